@@ -1,6 +1,22 @@
 from django.contrib import admin
-from .models import Term, Course, ClassNote
+from .archive import rehydrate
+from .models import Term, Course, ClassNote, Task
+
+class ClassNoteAdmin(admin.ModelAdmin):
+    """
+    Admin for ClassNote objects. Archived notes are brought back when opened,
+    as the edit page does, so that the form shows and saves their actual
+    body rather than the empty stub.
+    """
+
+    def get_object(self, request, object_id, from_field=None):
+        """
+        Retrieves the note, bringing back its body if it was archived.
+        """
+        note = super().get_object(request, object_id, from_field)
+        return note if note is None else rehydrate(note)
 
 admin.site.register(Term)
 admin.site.register(Course)
-admin.site.register(ClassNote)
+admin.site.register(ClassNote, ClassNoteAdmin)
+admin.site.register(Task)
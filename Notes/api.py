@@ -0,0 +1,98 @@
+"""
+The REST API's viewsets, loaded along with the API URLconf only once an API
+URL is first used; refer to Scribnotes/api_urls.py.
+"""
+from django.db import transaction
+from rest_framework import permissions, viewsets
+from .archive import archived_bodies
+from .models import Term, Course, ClassNote
+from .notecache import attach_body
+from .revisions import record_revision
+from .serializers import TermSerializer, CourseSerializer, ClassNoteSerializer
+
+class TermViewSet(viewsets.ModelViewSet):
+    """
+    Displays the JSON data of all Term objects associated with the active-user.
+    """
+    serializer_class = TermSerializer
+    permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+
+    def get_queryset(self):
+        """
+        Retrieves all Term objects associated with the active_user; otherwise
+        returns an empty queryset for anonymous users.
+        """
+        active_user = self.request.user
+        if active_user.is_authenticated:
+            queryset = Term.objects.filter(user=active_user)
+        else:
+            queryset = Term.objects.none()
+        return queryset
+
+class CourseViewSet(viewsets.ModelViewSet):
+    """
+    Displays JSON data of all Course objects associated with the active-user.
+    """
+    serializer_class = CourseSerializer
+    permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+
+    def get_queryset(self):
+        """
+        Retrieves all Course objects associated with the active_user; otherwise
+        returns an empty queryset for anonymous users.
+        """
+        active_user = self.request.user
+        if active_user.is_authenticated:
+            queryset = Course.objects.filter(user=active_user)
+        else:
+            queryset = Course.objects.none()
+        return queryset
+
+class ClassNoteViewSet(viewsets.ModelViewSet):
+    """
+    Displays JSON data of all ClassNote objects associated with the active-user.
+    """
+    serializer_class = ClassNoteSerializer
+    permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+    throttle_scope = 'notes_api'
+
+    def get_queryset(self):
+        """
+        Retrieves all ClassNote objects associated with the active_user;
+        otherwise returns an empty queryset for anonymous users.
+        """
+        active_user = self.request.user
+        if active_user.is_authenticated:
+            queryset = ClassNote.objects.filter(user=active_user)
+        else:
+            queryset = ClassNote.objects.none()
+        if self.action != 'list':
+            queryset = queryset.defer('body')
+        return queryset
+
+    def get_object(self):
+        """
+        Retrieves a single ClassNote object with its body from the note cache;
+        refer to Notes.notecache.
+        """
+        return attach_body(super().get_object())
+
+    def get_serializer(self, *args, **kwargs):
+        """
+        Provides the serializer, filling in the bodies of archived notes in
+        listings, whose rows only hold their empty stubs; refer to
+        Notes.archive.
+        """
+        if kwargs.get('many') and args:
+            args = (archived_bodies(list(args[0])),) + args[1:]
+        return super().get_serializer(*args, **kwargs)
+
+    def perform_update(self, serializer):
+        """
+        Saves the ClassNote object, which bumps its revision, and records the
+        new revision in the note's history, as UpdateNoteView does.
+        """
+        previous_body = serializer.instance.body
+        with transaction.atomic():
+            note = serializer.save()
+            record_revision(note, previous_body)
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class NotesConfig(AppConfig):
     name = 'Notes'
+
+    def ready(self):
+        """
+        Connects the app's signal handlers.
+        """
+        from . import signals
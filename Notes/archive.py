@@ -0,0 +1,114 @@
+"""
+Cold storage for the notes of past terms. Notes in terms that aren't current
+and that were created more than ARCHIVE_AFTER_YEARS years ago have their
+bodies compressed into NoteArchive rows, leaving a stub ClassNote with an
+empty body behind; titles, slugs, revisions and statistics stay where they
+are. Opening an archived note through rehydrate() moves its body back;
+listings showing many bodies at once read them with archived_bodies()
+instead, which leaves them archived. Saving a new body onto a stub drops
+its archive; refer to ClassNote.save().
+Archiving runs from `manage.py archive_notes` or the archive_old_notes
+background task.
+"""
+import zlib
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import ClassNote, NoteArchive
+
+ARCHIVE_AFTER_YEARS = getattr(settings, 'ARCHIVE_AFTER_YEARS', 2)
+ARCHIVE_BATCH_SIZE = getattr(settings, 'ARCHIVE_BATCH_SIZE', 200)
+
+
+def archivable_notes(years=ARCHIVE_AFTER_YEARS):
+    """
+    Notes of terms that aren't current, created more than years years ago
+    and not archived yet.
+    """
+    cutoff = timezone.now() - timedelta(days=365 * years)
+    return ClassNote.objects.filter(
+        archived=False,
+        course__term__current=False,
+        created_at__lt=cutoff,
+        ).order_by()
+
+
+def archive_notes(years=ARCHIVE_AFTER_YEARS, progress=None):
+    """
+    Archives every archivable note in batches of ARCHIVE_BATCH_SIZE, calling
+    progress(done, total) after each one. Each batch locks its notes while
+    their bodies move so that a concurrent edit can't be lost. Returns the
+    number of notes archived.
+    """
+    notes = archivable_notes(years)
+    total = notes.count()
+    done = 0
+
+    while True:
+        ids = list(notes.values_list('pk', flat=True)[:ARCHIVE_BATCH_SIZE])
+        if not ids:
+            break
+
+        with transaction.atomic():
+            rows = ClassNote.objects.select_for_update().filter(
+                pk__in=ids,
+                archived=False,
+                ).values_list('pk', 'body')
+            archives = [
+                NoteArchive(note_id=pk, data=zlib.compress(
+                    str(body).encode('utf-8'),
+                    ))
+                for pk, body in rows
+                ]
+            NoteArchive.objects.bulk_create(archives)
+            ClassNote.objects.filter(
+                pk__in=[archive.note_id for archive in archives],
+                ).update(body='', archived=True)
+
+        done += len(ids)
+        if progress is not None:
+            progress(done, total)
+
+    return done
+
+
+def rehydrate(note):
+    """
+    Moves an archived note's body back into its row and onto note. Does
+    nothing for notes that aren't archived.
+    """
+    if not note.archived:
+        return note
+
+    with transaction.atomic():
+        archive = NoteArchive.objects.select_for_update().filter(
+            note_id=note.pk,
+            ).first()
+        if archive is None:
+            note.refresh_from_db(fields=['body'])
+        else:
+            note.body = zlib.decompress(bytes(archive.data)).decode('utf-8')
+            ClassNote.objects.filter(pk=note.pk).update(
+                body=note.body,
+                archived=False,
+                )
+            archive.delete()
+        note.archived = False
+    return note
+
+
+def archived_bodies(notes):
+    """
+    Fills in the bodies of the archived notes among notes from their
+    archives, in one query, without moving them back. Returns notes.
+    """
+    archived = {note.pk: note for note in notes if note.archived}
+    if archived:
+        archives = NoteArchive.objects.filter(
+            note_id__in=archived,
+            ).values_list('note_id', 'data')
+        for note_id, data in archives:
+            body = zlib.decompress(bytes(data)).decode('utf-8')
+            archived[note_id].body = body
+    return notes
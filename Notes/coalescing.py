@@ -0,0 +1,44 @@
+"""
+Request coalescing: when identical expensive computations are requested at
+the same time, one caller computes the result and the others wait for it
+instead of repeating the work. Coordination goes through the cache, so it
+works across threads and worker processes alike.
+"""
+import time
+from django.core.cache import cache
+
+MISSING = object()
+
+
+def coalesce(key, compute, timeout=10, poll=0.05):
+    """
+    Returns compute() for key, sharing one computation among concurrent
+    callers. The result is kept for a couple of seconds so that callers that
+    arrive just after it finishes get it too. If the computing caller doesn't
+    finish within timeout seconds, waiting callers compute it themselves.
+    Results must be picklable.
+    """
+    result_key = f'coalesce:result:{key}'
+    lock_key = f'coalesce:lock:{key}'
+
+    result = cache.get(result_key, MISSING)
+    if result is not MISSING:
+        return result
+
+    if cache.add(lock_key, True, timeout):
+        try:
+            result = compute()
+            cache.set(result_key, result, 2)
+            return result
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(poll)
+        result = cache.get(result_key, MISSING)
+        if result is not MISSING:
+            return result
+        if cache.get(lock_key) is None:
+            break
+    return compute()
@@ -1,4 +1,7 @@
+from django.utils.functional import SimpleLazyObject
 from .forms import SearchBarForm
+from .models import Course
+from .navigation import get_navigation_tree
 
 def SearchBarContext(request):
     """
@@ -10,14 +13,29 @@ def SearchBarContext(request):
 def SetCurrentCourses(request):
     """
     Produces a context variable for all a user's current courses that's
-    available across all pages.
+    available across all pages; it's only fetched if a template uses it.
     """
     user = request.user
 
-    try:
-        current_term = user.terms.all().filter(user=user, current=True)[0]
-        current_courses = current_term.courses.all()
-    except (AttributeError, IndexError):
-        current_courses = None
+    def current_courses():
+        try:
+            current_term = user.terms.all().filter(user=user, current=True)[0]
+            return current_term.courses.all()
+        except (AttributeError, IndexError):
+            return Course.objects.none()
 
-    return {'current_courses': current_courses}
+    return {'current_courses': SimpleLazyObject(current_courses)}
+
+def NavigationTree(request):
+    """
+    Produces a context variable for the active-user's Term, Course and Note
+    tree that's available across all pages; it's only fetched if a template
+    uses it.
+    """
+    user = request.user
+
+    if not user.is_authenticated:
+        return {'navigation_tree': None}
+
+    tree = SimpleLazyObject(lambda: get_navigation_tree(user))
+    return {'navigation_tree': tree}
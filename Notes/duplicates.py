@@ -0,0 +1,205 @@
+"""
+Near-duplicate detection for note bodies. Each body is fingerprinted with a
+64-bit SimHash over its overlapping three-word shingles: bit i of the
+fingerprint is set when most shingles' hashes have bit i set, so bodies that
+share most of their shingles get fingerprints a few bits apart. The bit
+counts are taken a byte column at a time with bytes.translate() and
+bytes.count(), which run in C, rather than bit by bit in Python.
+
+Fingerprints are stored in NoteVector rows along with their four 16-bit
+bands. Two fingerprints at most MAX_DISTANCE (3) bits apart must agree on at
+least one band, so the indexed band columns form a locality-sensitive hash
+index: looking up the four bands finds every candidate near-duplicate, and
+only those are compared bit by bit. A note saved within MAX_DISTANCE of an
+older note of its owner is flagged as a duplicate of the oldest of them.
+find_originals() works out the same flags for a whole library in memory, for
+rebuilds and for flags left stale by edits to other notes.
+
+cluster_fingerprints() groups a whole library the same way, bucketing by
+band in memory; refer to `manage.py find_duplicates`. Bodies of fewer than
+MIN_WORDS words aren't fingerprinted, since short notes are alike anyway.
+"""
+import hashlib
+import re
+from django.db.models import Q
+from .models import NoteVector
+
+MAX_DISTANCE = 3
+BANDS = 4
+BAND_BITS = 64 // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+SHINGLE_WORDS = 3
+MIN_WORDS = 8
+
+WORD = re.compile(r'\w+')
+BIT_TABLES = [bytes((value >> bit) & 1 for value in range(256))
+              for bit in range(8)]
+
+
+def words(text):
+    """
+    Returns the lowercased words of plain text.
+    """
+    return WORD.findall(text.lower())
+
+
+def simhash(text):
+    """
+    Returns the 64-bit SimHash of plain text, or None if it's too short to
+    fingerprint.
+    """
+    found = words(text)
+    if len(found) < MIN_WORDS:
+        return None
+    shingles = {
+        ' '.join(found[i:i + SHINGLE_WORDS])
+        for i in range(len(found) - SHINGLE_WORDS + 1)
+        }
+    digests = b''.join(
+        hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest()
+        for shingle in shingles
+        )
+
+    fingerprint = 0
+    half = len(shingles) / 2
+    for byte in range(8):
+        column = digests[byte::8]
+        for bit in range(8):
+            if column.translate(BIT_TABLES[bit]).count(1) > half:
+                fingerprint |= 1 << (byte * 8 + bit)
+    return fingerprint
+
+
+def bands(fingerprint):
+    """
+    Returns the BANDS bands of a fingerprint, lowest bits first.
+    """
+    return [(fingerprint >> (band * BAND_BITS)) & BAND_MASK
+            for band in range(BANDS)]
+
+
+def to_signed(fingerprint):
+    """
+    Converts an unsigned 64-bit fingerprint to the signed value stored.
+    """
+    return fingerprint - (1 << 64) if fingerprint >> 63 else fingerprint
+
+
+def to_unsigned(stored):
+    """
+    Converts a stored fingerprint back to an unsigned one.
+    """
+    return stored & ((1 << 64) - 1)
+
+
+def distance(first, second):
+    """
+    Returns the number of bits two fingerprints differ by.
+    """
+    return bin(first ^ second).count('1')
+
+
+def fingerprint_fields(fingerprint):
+    """
+    Returns the NoteVector field values for a fingerprint, which may be
+    None.
+    """
+    fields = {'fingerprint': None}
+    fields.update({f'band_{band}': None for band in range(BANDS)})
+    if fingerprint is not None:
+        fields['fingerprint'] = to_signed(fingerprint)
+        for band, value in enumerate(bands(fingerprint)):
+            fields[f'band_{band}'] = value
+    return fields
+
+
+def find_original(user_id, note_id, fingerprint):
+    """
+    Returns the id of the oldest of the user's notes created before note_id
+    whose fingerprint is within MAX_DISTANCE of fingerprint, or None. Only
+    notes sharing a band with it are read.
+    """
+    if fingerprint is None:
+        return None
+    same_band = Q()
+    for band, value in enumerate(bands(fingerprint)):
+        same_band |= Q(**{f'band_{band}': value})
+    candidates = NoteVector.objects.filter(
+        same_band,
+        user_id=user_id,
+        note_id__lt=note_id,
+        ).values_list('note_id', 'fingerprint').order_by('note_id')
+    for candidate, stored in candidates:
+        if distance(fingerprint, to_unsigned(stored)) <= MAX_DISTANCE:
+            return candidate
+    return None
+
+
+def find_originals(fingerprints):
+    """
+    Returns a dict of note id to the id of the oldest older note whose
+    fingerprint is within MAX_DISTANCE of the note's, or None, for a whole
+    library at once. fingerprints maps note ids to unsigned fingerprints.
+    """
+    buckets = [{} for band in range(BANDS)]
+    originals = {}
+    for note_id, fingerprint in sorted(fingerprints.items()):
+        original = None
+        for band, value in enumerate(bands(fingerprint)):
+            for other_id, other in buckets[band].get(value, ()):
+                if original is not None and other_id >= original:
+                    break
+                if distance(fingerprint, other) <= MAX_DISTANCE:
+                    original = other_id
+                    break
+        originals[note_id] = original
+        for band, value in enumerate(bands(fingerprint)):
+            buckets[band].setdefault(value, []).append((note_id, fingerprint))
+    return originals
+
+
+def cluster_fingerprints(fingerprints, max_distance=MAX_DISTANCE):
+    """
+    Groups notes whose fingerprints are within max_distance of each other,
+    directly or through other notes. fingerprints maps note ids to unsigned
+    fingerprints; returns a list of clusters of two or more note ids, each
+    sorted. max_distance may not exceed MAX_DISTANCE.
+    """
+    parents = {}
+
+    def find(note_id):
+        root = note_id
+        while parents.get(root, root) != root:
+            root = parents[root]
+        while note_id != root:
+            parents[note_id], note_id = root, parents.get(note_id, note_id)
+        return root
+
+    def union(first, second):
+        first, second = find(first), find(second)
+        if first != second:
+            parents[max(first, second)] = min(first, second)
+
+    same = {}
+    for note_id, fingerprint in fingerprints.items():
+        same.setdefault(fingerprint, []).append(note_id)
+    for note_ids in same.values():
+        for note_id in note_ids[1:]:
+            union(note_ids[0], note_id)
+
+    for band in range(BANDS):
+        buckets = {}
+        for fingerprint, note_ids in same.items():
+            key = (fingerprint >> (band * BAND_BITS)) & BAND_MASK
+            buckets.setdefault(key, []).append(fingerprint)
+        for bucket in buckets.values():
+            for i, first in enumerate(bucket):
+                for second in bucket[i + 1:]:
+                    if distance(first, second) <= max_distance:
+                        union(same[first][0], same[second][0])
+
+    clusters = {}
+    for note_id in fingerprints:
+        clusters.setdefault(find(note_id), []).append(note_id)
+    return [sorted(cluster) for cluster in clusters.values()
+            if len(cluster) > 1]
@@ -0,0 +1,141 @@
+"""
+Model fields. CompressedRichTextField stores large note bodies zlib-compressed
+in the same text column, behind a one-character format header that plain
+HTML never starts with:
+
+    '\x1fz1' + base64(zlib(utf-8 text))    compressed, format version 1
+    '\x1fp' + text                         plain text that happens to start
+                                           with the header character
+    anything else                          plain text
+
+Bodies shorter than NOTE_BODY_COMPRESS_MIN_LENGTH characters, or that don't
+shrink, are stored as they are. Values read from the database are only
+decompressed when the attribute is first accessed, so listings that never
+touch a body never pay for it. Forms, serializers and the admin read the
+attribute and so always see plain HTML. values() and values_list() hand out
+compressed bodies as CompressedText objects, which str() decodes. Lookups on
+the column (contains and the like) only match bodies stored uncompressed.
+"""
+import base64
+import zlib
+from ckeditor.fields import RichTextField
+from django.conf import settings
+from django.db.models.query_utils import DeferredAttribute
+
+MARK = '\x1f'
+COMPRESSED = MARK + 'z1'
+ESCAPED = MARK + 'p'
+
+
+def compress_text(text):
+    """
+    Encodes text for storage, compressing it if it's long enough to benefit.
+    """
+    if text is None:
+        return None
+    minimum = getattr(settings, 'NOTE_BODY_COMPRESS_MIN_LENGTH', 1024)
+    if len(text) >= minimum:
+        data = zlib.compress(text.encode('utf-8'))
+        encoded = COMPRESSED + base64.b64encode(data).decode('ascii')
+        if len(encoded) < len(text):
+            return encoded
+    if text.startswith(MARK):
+        return ESCAPED + text
+    return text
+
+
+def decompress_text(stored):
+    """
+    Decodes a stored value back into text.
+    """
+    if stored is None or not stored.startswith(MARK):
+        return stored
+    if stored.startswith(COMPRESSED):
+        data = base64.b64decode(stored[len(COMPRESSED):])
+        return zlib.decompress(data).decode('utf-8')
+    if stored.startswith(ESCAPED):
+        return stored[len(ESCAPED):]
+    raise ValueError('Unknown compressed text format.')
+
+
+class CompressedText():
+    """
+    A compressed value as read from the database, decoded on demand. Model
+    instances never hand these out; refer to CompressedAttribute.
+    """
+
+    def __init__(self, stored):
+        self.stored = stored
+
+    def __str__(self):
+        """
+        Decompresses the value.
+        """
+        return decompress_text(self.stored)
+
+    def __repr__(self):
+        return f'<CompressedText: {len(self.stored)} characters>'
+
+
+class CompressedAttribute(DeferredAttribute):
+    """
+    Descriptor for a CompressedRichTextField that decompresses the loaded
+    value on first access and keeps the result.
+    """
+
+    def __get__(self, instance, cls=None):
+        """
+        Returns the plain text, decompressing it if needed.
+        """
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, CompressedText):
+            value = str(value)
+            instance.__dict__[self.field_name] = value
+        return value
+
+    def __set__(self, instance, value):
+        """
+        Stores a value on the instance; having __set__ makes this a data
+        descriptor so that __get__ runs even once a value is loaded.
+        """
+        instance.__dict__[self.field_name] = value
+
+
+class CompressedRichTextField(RichTextField):
+    """
+    RichTextField whose values are compressed in the database; refer to the
+    module docstring.
+    """
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        """
+        Installs the decompressing descriptor in place of the default one.
+        """
+        super().contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.attname, CompressedAttribute(self.attname))
+
+    def from_db_value(self, value, expression, connection):
+        """
+        Defers decompression until the value is used.
+        """
+        if value is not None and value.startswith(COMPRESSED):
+            return CompressedText(value)
+        return decompress_text(value)
+
+    def to_python(self, value):
+        """
+        Turns deferred values into plain text.
+        """
+        if isinstance(value, CompressedText):
+            return str(value)
+        return super().to_python(value)
+
+    def get_db_prep_save(self, value, connection):
+        """
+        Compresses the value on its way into the database. Lookups go through
+        get_prep_value instead and so compare against plain text.
+        """
+        value = self.get_prep_value(value)
+        return compress_text(value)
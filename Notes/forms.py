@@ -197,3 +197,43 @@ class SearchBarForm(forms.ModelForm):
         """
         model = ClassNote
         fields = ('title',)
+
+class SearchScopeForm(forms.Form):
+    """
+    Form that narrows a search down to a term, or the current one, a course
+    and a range of creation dates; refer to Notes.search.
+    """
+    title = forms.CharField(required=False)
+    term = forms.SlugField(required=False)
+    course = forms.SlugField(required=False)
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+
+    def __init__(self, *args, **kwargs):
+        """
+        HTML widget modification.
+        """
+        super().__init__(*args, **kwargs)
+        for field in self.fields:
+            self.fields[field].label = ''
+        self.fields['title'].widget = forms.HiddenInput()
+        self.fields['term'].widget = forms.HiddenInput()
+        self.fields['course'].widget = forms.HiddenInput()
+        for field, placeholder in (('start', 'From'), ('end', 'To')):
+            self.fields[field].widget = forms.DateInput(attrs={
+                'type': 'date',
+                'class': 'form-control form-control-sm',
+                'placeholder': placeholder,
+                })
+
+    def get_scope(self):
+        """
+        Returns the valid fields other than title, leaving out blank and
+        invalid ones.
+        """
+        self.is_valid()
+        return {
+            field: value
+            for field, value in self.cleaned_data.items()
+            if field != 'title' and value not in (None, '')
+            }
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from Notes.archive import ARCHIVE_AFTER_YEARS, archivable_notes, archive_notes
+from Notes.tasks import enqueue
+
+
+class Command(BaseCommand):
+    """
+    Moves the bodies of old notes from past terms into the archive; refer to
+    Notes.archive.
+    """
+    help = 'Archives notes of past terms older than --years years.'
+
+    def add_arguments(self, parser):
+        """
+        Age in years past which notes are archived, a flag to only count them
+        and a flag to queue the work for the background worker instead.
+        """
+        parser.add_argument('--years', type=int, default=ARCHIVE_AFTER_YEARS)
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--background', action='store_true')
+
+    def handle(self, *args, **options):
+        """
+        Archives the notes, counts them, or queues a task to archive them.
+        """
+        years = options['years']
+        if years < 1:
+            raise CommandError('--years must be at least 1.')
+
+        if options['dry_run']:
+            count = archivable_notes(years).count()
+            self.stdout.write(f'{count} notes would be archived.')
+        elif options['background']:
+            enqueue('archive_old_notes', years)
+            self.stdout.write('Queued archiving.')
+        else:
+            count = archive_notes(years)
+            self.stdout.write(f'Archived {count} notes.')
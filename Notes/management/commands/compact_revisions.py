@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from Notes.models import ClassNote
+from Notes.revisions import compact_revisions
+
+
+class Command(BaseCommand):
+    """
+    Trims the revision history of every ClassNote object down to its newest
+    revisions.
+    """
+    help = 'Discards old note revisions, keeping the newest --keep per note.'
+
+    def add_arguments(self, parser):
+        """
+        Number of revisions to keep per note.
+        """
+        parser.add_argument('--keep', type=int, default=50)
+
+    def handle(self, *args, **options):
+        """
+        Compacts the history of each note with more revisions than --keep.
+        """
+        keep = options['keep']
+        if keep < 1:
+            raise CommandError('--keep must be at least 1.')
+
+        notes = ClassNote.objects.annotate(
+            revision_count=Count('revisions'),
+            ).filter(revision_count__gt=keep).only('pk')
+
+        deleted = 0
+        for note in notes.iterator():
+            deleted += compact_revisions(note, keep)
+
+        self.stdout.write(f'Deleted {deleted} revisions.')
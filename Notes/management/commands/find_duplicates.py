@@ -0,0 +1,124 @@
+import time
+from itertools import groupby
+from operator import itemgetter
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from Notes.duplicates import MAX_DISTANCE, cluster_fingerprints, to_unsigned
+from Notes.models import ClassNote, NoteVector
+from Notes.related import REBUILD_BATCH_SIZE, rebuild_vectors
+
+
+class Command(BaseCommand):
+    """
+    Reports clusters of near-duplicate notes in each user's library, from the
+    fingerprints kept in NoteVector rows; refer to Notes.duplicates.
+    Fingerprints are read in one pass ordered by user, and each library is
+    clustered in memory as soon as it has been read.
+    """
+    help = (
+        'Reports near-duplicate note clusters for every user, or only for '
+        '--user, optionally fingerprinting their notes again first.'
+        )
+
+    def add_arguments(self, parser):
+        """
+        Optional username, maximum distance, whether to recompute the
+        fingerprints first, batch size and whether to list the notes.
+        """
+        parser.add_argument('--user')
+        parser.add_argument('--distance', type=int, default=MAX_DISTANCE)
+        parser.add_argument('--rebuild', action='store_true')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=REBUILD_BATCH_SIZE,
+            )
+        parser.add_argument('--summary', action='store_true')
+
+    def handle(self, *args, **options):
+        """
+        Optionally refingerprints the notes, then clusters each library and
+        reports the clusters.
+        """
+        if not 0 <= options['distance'] <= MAX_DISTANCE:
+            raise CommandError(
+                f'--distance must be between 0 and {MAX_DISTANCE}.'
+                )
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        notes = ClassNote.objects.all()
+        vectors = NoteVector.objects.exclude(fingerprint=None)
+        if options['user']:
+            user = get_user_model().objects.filter(
+                username=options['user'],
+                ).first()
+            if user is None:
+                raise CommandError(f'No user named {options["user"]}.')
+            notes = notes.filter(user=user)
+            vectors = vectors.filter(user=user)
+
+        if options['rebuild']:
+            start = time.perf_counter()
+            done = rebuild_vectors(notes, options['batch_size'])
+            self.stdout.write(
+                f'Fingerprinted {done} notes in '
+                f'{time.perf_counter() - start:.1f} s.'
+                )
+
+        start = time.perf_counter()
+        rows = vectors.order_by('user_id').values_list(
+            'user_id', 'note_id', 'fingerprint',
+            ).iterator(chunk_size=options['batch_size'])
+
+        scanned = 0
+        found = []
+        for user_id, library in groupby(rows, key=itemgetter(0)):
+            fingerprints = {
+                note_id: to_unsigned(fingerprint)
+                for user_id, note_id, fingerprint in library
+                }
+            scanned += len(fingerprints)
+            clusters = cluster_fingerprints(
+                fingerprints,
+                options['distance'],
+                )
+            found += [(user_id, cluster) for cluster in clusters]
+        elapsed = time.perf_counter() - start
+
+        if not options['summary']:
+            self.report(found)
+        users = len({user_id for user_id, cluster in found})
+        notes_found = sum(len(cluster) for user_id, cluster in found)
+        self.stdout.write(
+            f'{len(found)} duplicate clusters holding {notes_found} notes '
+            f'across {users} users, from {scanned} fingerprints in '
+            f'{elapsed:.1f} s.'
+            )
+
+    def report(self, found):
+        """
+        Lists each cluster's notes under its owner, oldest note first,
+        leaving out notes deleted since the fingerprints were read.
+        """
+        for start in range(0, len(found), REBUILD_BATCH_SIZE):
+            batch = found[start:start + REBUILD_BATCH_SIZE]
+            ids = [note_id for user_id, cluster in batch for note_id in cluster]
+            notes = {
+                pk: (username, title, course_code)
+                for pk, username, title, course_code in
+                ClassNote.objects.filter(pk__in=ids).values_list(
+                    'pk', 'user__username', 'title', 'course__course_code',
+                    )
+                }
+            for user_id, cluster in batch:
+                cluster = [note_id for note_id in cluster if note_id in notes]
+                if len(cluster) < 2:
+                    continue
+                username = notes[cluster[0]][0]
+                self.stdout.write(f'{username}: {len(cluster)} notes')
+                for note_id in cluster:
+                    username, title, course_code = notes[note_id]
+                    self.stdout.write(
+                        f'  {title} ({course_code or "no course"})'
+                        )
@@ -0,0 +1,36 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from Notes.models import ClassNote
+from Notes.related import rebuild_vectors, refresh_related
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the term vectors of notes from their bodies and then their
+    related notes, for notes saved before vectors were kept or after bodies
+    were changed behind the ORM's back. Archived notes keep their vectors.
+    """
+    help = 'Rebuilds related notes for every user, or only for --user.'
+
+    def add_arguments(self, parser):
+        """
+        Optional username to limit the rebuild to.
+        """
+        parser.add_argument('--user')
+
+    def handle(self, *args, **options):
+        """
+        Rebuilds the vectors and related notes of each selected user.
+        """
+        users = get_user_model().objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f'No user named {options["user"]}.')
+
+        count = 0
+        for user_id in users.values_list('pk', flat=True).iterator():
+            count += rebuild_vectors(ClassNote.objects.filter(user_id=user_id))
+            refresh_related(user_id)
+
+        self.stdout.write(f'Rebuilt related notes from {count} notes.')
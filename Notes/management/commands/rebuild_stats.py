@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from Notes.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the dashboard statistics from the notes themselves, for when
+    they have drifted or after data was changed behind the ORM's back.
+    """
+    help = 'Rebuilds note statistics for every user, or only for --user.'
+
+    def add_arguments(self, parser):
+        """
+        Optional username to limit the rebuild to.
+        """
+        parser.add_argument('--user')
+
+    def handle(self, *args, **options):
+        """
+        Rebuilds the statistics of each selected user.
+        """
+        users = get_user_model().objects.order_by('pk')
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f'No user named {options["user"]}.')
+
+        count = 0
+        for user_id in users.values_list('pk', flat=True).iterator():
+            rebuild_stats(user_id)
+            count += 1
+
+        self.stdout.write(f'Rebuilt statistics for {count} users.')
@@ -0,0 +1,116 @@
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from django.urls import reverse
+from Notes.models import Term, Course, ClassNote
+from Notes.views import NotesList
+
+USERNAME = 'render-benchmark'
+COURSES = 5
+
+
+class Command(BaseCommand):
+    """
+    Times rendering the notes list for a user with many notes, including
+    reading them, to the first byte of the page and to the last. The notes
+    are created in a transaction that is rolled back afterwards.
+    """
+    help = 'Times rendering notes_list.html with --rows notes.'
+
+    def add_arguments(self, parser):
+        """
+        Number of notes listed and number of timed renders.
+        """
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        """
+        Creates the notes, renders the list repeatedly and reports the times.
+        """
+        if options['rows'] < 1 or options['repeat'] < 1:
+            raise CommandError('--rows and --repeat must be at least 1.')
+
+        with transaction.atomic():
+            user = self.create_notes(options['rows'])
+            timings = self.render(user, options['repeat'])
+            transaction.set_rollback(True)
+
+        rows = options['rows']
+        first = min(timing[0] for timing in timings)
+        total = min(timing[1] for timing in timings)
+        median = statistics.median(timing[1] for timing in timings)
+        self.stdout.write(
+            f'notes_list.html with {rows} rows, {len(timings)} renders: '
+            f'first byte {first * 1000:.1f} ms, '
+            f'whole page {total * 1000:.1f} ms '
+            f'(median {median * 1000:.1f} ms), '
+            f'{total / rows * 1e6:.1f} us per row'
+            )
+
+    def create_notes(self, rows):
+        """
+        Creates a user with one current term, a few courses and rows notes.
+        """
+        if get_user_model().objects.filter(username=USERNAME).exists():
+            raise CommandError(f'A user named {USERNAME} already exists.')
+
+        user = get_user_model().objects.create_user(USERNAME)
+        term = Term.objects.create(
+            user=user,
+            school='School',
+            year=2019,
+            session='Fall 2019',
+            term_slug='fall-2019',
+            current=True,
+            )
+        courses = [
+            Course.objects.create(
+                user=user,
+                term=term,
+                course_code=f'CS{number}',
+                title=f'Course {number}',
+                course_slug=f'cs{number}',
+                )
+            for number in range(COURSES)
+            ]
+        ClassNote.objects.bulk_create(
+            ClassNote(
+                user=user,
+                course=courses[number % COURSES],
+                title=f'Lecture {number}',
+                body='<p>Body</p>',
+                note_slug=f'lecture-{number}',
+                )
+            for number in range(rows)
+            )
+        return user
+
+    def render(self, user, repeat):
+        """
+        Renders the list repeatedly, returning the time to the first chunk of
+        the page and to all of it for each render. The first render warms up
+        the template and navigation caches and isn't counted.
+        """
+        request = RequestFactory().get(reverse('Notes:notes_list'))
+        request.user = user
+        view = NotesList.as_view()
+
+        timings = []
+        for attempt in range(repeat + 1):
+            start = time.perf_counter()
+            response = view(request)
+            if response.streaming:
+                chunks = iter(response.streaming_content)
+                next(chunks)
+                first = time.perf_counter() - start
+                for chunk in chunks:
+                    pass
+            else:
+                response.render()
+                first = time.perf_counter() - start
+            timings.append((first, time.perf_counter() - start))
+        return timings[1:]
@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from Notes.tasks import STALE_AFTER, requeue_stale, run_pending
+
+
+class Command(BaseCommand):
+    """
+    Runs queued background tasks; refer to Notes.tasks.
+    """
+    help = 'Runs queued background tasks until interrupted.'
+
+    def add_arguments(self, parser):
+        """
+        Polling interval, stale-task timeout and a flag to drain the queue once
+        and exit.
+        """
+        parser.add_argument('--interval', type=float, default=1.0)
+        parser.add_argument('--stale-after', type=int, default=STALE_AFTER)
+        parser.add_argument('--once', action='store_true')
+
+    def handle(self, *args, **options):
+        """
+        Requeues tasks abandoned by a previous worker, then polls the queue.
+        """
+        requeued = requeue_stale(options['stale_after'])
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale tasks.')
+
+        while True:
+            close_old_connections()
+            count = run_pending()
+            if count:
+                self.stdout.write(f'Ran {count} tasks.')
+            if options['once']:
+                break
+            if not count:
+                time.sleep(options['interval'])
@@ -0,0 +1,80 @@
+import json
+import os
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+CHILD = (
+    'import json, sys\n'
+    'from Scribnotes.startup import profile_startup\n'
+    'json.dump(profile_startup(int(sys.argv[1])), sys.stdout)\n'
+    )
+
+
+class Command(BaseCommand):
+    """
+    Measures how long a fresh web process takes to boot and which imports
+    dominate; refer to Scribnotes.startup.
+    """
+    help = (
+        'Profiles the startup of a fresh process, reporting the fastest of '
+        '--repeat runs against the STARTUP_TIME_BUDGET setting.'
+        )
+
+    def add_arguments(self, parser):
+        """
+        Number of runs, number of imports listed and a flag to fail when the
+        budget is exceeded.
+        """
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--limit', type=int, default=25)
+        parser.add_argument('--check', action='store_true')
+
+    def handle(self, *args, **options):
+        """
+        Boots the project in child processes and reports the fastest run.
+        """
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1.')
+
+        runs = [self.profile(options['limit'])
+                for run in range(options['repeat'])]
+        fastest = min(runs, key=lambda run: run['total'])
+        budget = getattr(settings, 'STARTUP_TIME_BUDGET', None)
+
+        line = f'Startup: {fastest["total"] * 1000:.0f} ms'
+        if budget is not None:
+            line += f' (budget {budget * 1000:.0f} ms)'
+        lines = [line]
+        for name, seconds in fastest['phases']:
+            lines.append(f'  {name:<32}{seconds * 1000:8.0f} ms')
+
+        lines += ['', 'Slowest imports (own / total ms)']
+        for name, total, own in fastest['imports']:
+            lines.append(f'  {name:<48}{own * 1000:8.1f}{total * 1000:9.1f}')
+        self.stdout.write('\n'.join(lines))
+
+        if options['check'] and budget is not None and \
+                fastest['total'] > budget:
+            raise CommandError(
+                f'Startup took {fastest["total"] * 1000:.0f} ms, over the '
+                f'budget of {budget * 1000:.0f} ms.'
+                )
+
+    def profile(self, limit):
+        """
+        Runs Scribnotes.startup.profile_startup in a fresh interpreter.
+        """
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        result = subprocess.run(
+            [sys.executable, '-c', CHILD, str(limit)],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            )
+        if result.returncode:
+            raise CommandError(f'Startup failed:\n{result.stderr}')
+        return json.loads(result.stdout)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from Scribnotes.startup import warm_up
+
+
+class Command(BaseCommand):
+    """
+    Loads URLconfs, compiles templates and opens database connections ahead
+    of traffic; refer to Scribnotes.startup. gunicorn.conf.py does the same in
+    the web process itself, so this is mostly for checking what it costs.
+    """
+    help = 'Warms up URLconfs, templates and database connections.'
+
+    def add_arguments(self, parser):
+        """
+        Flag to leave the databases alone.
+        """
+        parser.add_argument('--skip-databases', action='store_true')
+
+    def handle(self, *args, **options):
+        """
+        Warms up and reports the time taken by each step.
+        """
+        timings = warm_up(connect=not options['skip_databases'])
+        for name, seconds in timings:
+            self.stdout.write(f'{name:<24}{seconds * 1000:8.0f} ms')
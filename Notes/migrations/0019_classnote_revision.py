@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-19 04:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Notes', '0018_auto_20190411_2037'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classnote',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
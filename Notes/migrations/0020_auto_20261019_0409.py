@@ -0,0 +1,32 @@
+# Generated by Django 2.1.7 on 2026-10-19 04:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Notes', '0019_classnote_revision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteRevision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('snapshot', models.BooleanField(default=False)),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='Notes.ClassNote')),
+            ],
+            options={
+                'ordering': ['note', 'number'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='noterevision',
+            unique_together={('note', 'number')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-19 04:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Notes', '0021_auto_20261019_0410'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='progress',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
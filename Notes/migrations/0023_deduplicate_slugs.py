@@ -0,0 +1,56 @@
+from django.db import migrations
+from django.utils.text import slugify
+
+
+def deduplicate(model, field, source, fallback):
+    """
+    Gives every object of model a slug in field that is unique among the
+    objects of its user, keeping existing unique slugs and renaming later
+    duplicates with a numeric suffix, shortening them as unique_slug in
+    Notes.slugs does so that the suffix fits.
+    """
+    max_length = model._meta.get_field(field).max_length
+    taken = {}
+    rows = model.objects.order_by('user_id', 'pk').values_list(
+        'pk', 'user_id', field, source,
+        )
+
+    for pk, user_id, slug, value in rows.iterator():
+        slugs = taken.setdefault(user_id, set())
+        new_slug = slug or slugify(value or '')[:max_length - 4].strip('-')
+        new_slug = new_slug or fallback
+        base = new_slug[:max_length - 4].strip('-') or fallback
+        suffix = 2
+        while new_slug in slugs:
+            new_slug = f'{base}-{suffix}'
+            suffix += 1
+        slugs.add(new_slug)
+        if new_slug != slug:
+            model.objects.filter(pk=pk).update(**{field: new_slug})
+
+
+def deduplicate_slugs(apps, schema_editor):
+    deduplicate(apps.get_model('Notes', 'Term'), 'term_slug', 'session', 'term')
+    deduplicate(
+        apps.get_model('Notes', 'Course'),
+        'course_slug',
+        'course_code',
+        'course',
+        )
+    deduplicate(
+        apps.get_model('Notes', 'ClassNote'),
+        'note_slug',
+        'title',
+        'note',
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Notes', '0022_task_progress'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_slugs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.1.7 on 2026-10-19 04:13
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('Notes', '0023_deduplicate_slugs'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='classnote',
+            unique_together={('user', 'note_slug')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='course',
+            unique_together={('user', 'course_slug')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='term',
+            unique_together={('user', 'term_slug')},
+        ),
+    ]
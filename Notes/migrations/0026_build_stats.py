@@ -0,0 +1,75 @@
+import datetime
+from django.db import migrations
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+
+def count_words(body):
+    """
+    Counts the words in a note's HTML body. A copy of Notes.stats.count_words
+    as it was when this migration was written, so that later changes there
+    don't change what this migration does.
+    """
+    return len(strip_tags(body or '').split())
+
+
+def week_of(moment):
+    """
+    Returns the Monday of the local week containing moment; a copy of
+    Notes.stats.week_of, as above.
+    """
+    day = timezone.localtime(moment).date()
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def build_stats(apps, schema_editor):
+    """
+    Counts the words of every existing note and builds the statistics of
+    every user from scratch.
+    """
+    ClassNote = apps.get_model('Notes', 'ClassNote')
+    CourseStats = apps.get_model('Notes', 'CourseStats')
+    WeeklyActivity = apps.get_model('Notes', 'WeeklyActivity')
+
+    weeks = {}
+    notes = ClassNote.objects.order_by().values_list(
+        'pk', 'user_id', 'created_at', 'body',
+        )
+    for pk, user_id, created_at, body in notes.iterator():
+        ClassNote.objects.filter(pk=pk).update(word_count=count_words(body))
+        key = (user_id, week_of(created_at))
+        weeks[key] = weeks.get(key, 0) + 1
+
+    courses = ClassNote.objects.order_by().values(
+        'user_id', 'course_id',
+        ).annotate(
+        notes=Count('pk'),
+        words=Sum('word_count'),
+        latest=Max('created_at'),
+        )
+    CourseStats.objects.bulk_create(
+        CourseStats(
+            user_id=row['user_id'],
+            course_id=row['course_id'],
+            note_count=row['notes'],
+            word_count=row['words'] or 0,
+            last_activity=row['latest'],
+            )
+        for row in courses
+        )
+    WeeklyActivity.objects.bulk_create(
+        WeeklyActivity(user_id=user_id, week=week, note_count=count)
+        for (user_id, week), count in weeks.items()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Notes', '0025_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
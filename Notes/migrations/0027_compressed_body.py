@@ -0,0 +1,47 @@
+# Generated by Django 2.1.7 on 2026-10-19 04:28
+
+import Notes.fields
+from django.db import migrations
+
+
+def compress_bodies(apps, schema_editor):
+    """
+    Rewrites every note body through the compressed field, which compresses
+    those above the size threshold.
+    """
+    ClassNote = apps.get_model('Notes', 'ClassNote')
+    bodies = ClassNote.objects.order_by().values_list('pk', 'body')
+    for pk, body in bodies.iterator():
+        if isinstance(body, str):
+            ClassNote.objects.filter(pk=pk).update(body=body)
+
+
+def decompress_bodies(apps, schema_editor):
+    """
+    Writes every note body back as plain text.
+    """
+    ClassNote = apps.get_model('Notes', 'ClassNote')
+    table = schema_editor.quote_name(ClassNote._meta.db_table)
+    bodies = ClassNote.objects.order_by().values_list('pk', 'body')
+    with schema_editor.connection.cursor() as cursor:
+        for pk, body in bodies.iterator():
+            cursor.execute(
+                f'UPDATE {table} SET body = %s WHERE id = %s',
+                [str(body), pk],
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Notes', '0026_build_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='classnote',
+            name='body',
+            field=Notes.fields.CompressedRichTextField(),
+        ),
+        migrations.RunPython(compress_bodies, decompress_bodies),
+    ]
@@ -0,0 +1,48 @@
+from django.db import DatabaseError, migrations, transaction
+
+INDEXES = (
+    ('notes_classnote_title_trgm', 'Notes_classnote', 'title'),
+    ('notes_course_code_trgm', 'Notes_course', 'course_code'),
+    ('notes_course_title_trgm', 'Notes_course', 'title'),
+    )
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    Installs pg_trgm and indexes the searched columns by trigram, on
+    PostgreSQL only. Without the privilege to install the extension, search
+    falls back to its in-process index; refer to Notes.search.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        return
+    for name, table, column in INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" '
+            f'USING gin ("{column}" gin_trgm_ops)'
+            )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    """
+    Drops the trigram indexes, leaving the extension installed.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Notes', '0028_note_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
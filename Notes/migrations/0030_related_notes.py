@@ -0,0 +1,43 @@
+# Generated by Django 2.1.7 on 2026-10-19 04:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('Notes', '0029_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteVector',
+            fields=[
+                ('note', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='vector', serialize=False, to='Notes.ClassNote')),
+                ('terms', models.BinaryField()),
+                ('counts', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='note_vectors', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RelatedNote',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_notes', to='Notes.ClassNote')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_to', to='Notes.ClassNote')),
+            ],
+            options={
+                'ordering': ['note', 'rank'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='relatednote',
+            unique_together={('note', 'rank')},
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 2.1.7 on 2026-10-19 04:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('Notes', '0030_related_notes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notevector',
+            name='band_0',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='notevector',
+            name='band_1',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='notevector',
+            name='band_2',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='notevector',
+            name='band_3',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='notevector',
+            name='duplicate_of',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='Notes.ClassNote'),
+        ),
+        migrations.AddField(
+            model_name='notevector',
+            name='fingerprint',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='notevector',
+            index_together={('user', 'band_1'), ('user', 'band_3'), ('user', 'band_2'), ('user', 'band_0')},
+        ),
+    ]
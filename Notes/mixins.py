@@ -0,0 +1,101 @@
+from functools import wraps
+from itertools import chain, islice
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.template import Context
+from django.template.loader import get_template
+from .streaming import ROWS_MARKER, RowStream, render_rows
+
+STREAMING_LIST_THRESHOLD = getattr(settings, 'STREAMING_LIST_THRESHOLD', 200)
+STREAMING_LIST_CHUNK_SIZE = getattr(settings, 'STREAMING_LIST_CHUNK_SIZE', 100)
+
+
+def memoize(method):
+    """
+    Wraps a bound method so that it only runs once for each set of arguments;
+    later calls return the first result.
+    """
+    results = {}
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        if key not in results:
+            results[key] = method(*args, **kwargs)
+        return results[key]
+
+    return wrapper
+
+
+class RequestMemoMixin():
+    """
+    Mixin for class-based views that look the same object up from several
+    methods in one request. The methods named in memoized_methods only hit
+    the database the first time they're called; since a view instance only
+    lives for a single request, nothing is shared between requests.
+    """
+    memoized_methods = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Memoizes the view's lookup methods before handling the request.
+        """
+        for name in self.memoized_methods:
+            setattr(self, name, memoize(getattr(self, name)))
+        return super().dispatch(request, *args, **kwargs)
+
+
+class StreamingListMixin():
+    """
+    Mixin for ListViews whose template renders its rows with the rows tag
+    (Notes.templatetags.lists) and row_template_name. Lists of up to
+    STREAMING_LIST_THRESHOLD rows render as usual. Longer ones are sent as a
+    StreamingHttpResponse: the page up to the rows, sidebar included, goes
+    out first, then the rows in chunks of STREAMING_LIST_CHUNK_SIZE read from
+    a queryset iterator, then the rest of the page. Either way the rows come
+    from a single query.
+    """
+    row_template_name = None
+
+    def get(self, request, *args, **kwargs):
+        """
+        Reads rows up to the threshold, rendering the page as usual if that's
+        all of them and streaming it otherwise.
+        """
+        notes = self.get_queryset().iterator(
+            chunk_size=STREAMING_LIST_CHUNK_SIZE,
+            )
+        first = list(islice(notes, STREAMING_LIST_THRESHOLD + 1))
+        if len(first) <= STREAMING_LIST_THRESHOLD:
+            self.object_list = first
+            return self.render_to_response(self.get_context_data())
+
+        self.object_list = RowStream(len(first))
+        context = self.get_context_data()
+        page = self.render_to_response(context).rendered_content
+        head, tail = page.split(ROWS_MARKER, 1)
+        row_context = Context(dict(
+            context,
+            request=request,
+            user=request.user,
+            csrf_token=get_token(request),
+            ))
+        return StreamingHttpResponse(
+            self.stream(head, chain(first, notes), row_context, tail),
+            )
+
+    def stream(self, head, notes, context, tail):
+        """
+        Yields the page head, the rows in chunks, and the page tail.
+        """
+        yield head
+        template = get_template(self.row_template_name).template
+        start = 0
+        while True:
+            chunk = list(islice(notes, STREAMING_LIST_CHUNK_SIZE))
+            if not chunk:
+                break
+            yield render_rows(template, context, chunk, start)
+            start += len(chunk)
+        yield tail
@@ -1,7 +1,35 @@
-from ckeditor.fields import RichTextField
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Max
 from django.contrib import auth
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from .fields import CompressedRichTextField
+
+class TermQuerySet(models.QuerySet):
+    """
+    Queries over Term objects.
+    """
+
+    def with_course_counts(self):
+        """
+        Annotates each term with course_count in the same grouped query.
+        """
+        return self.annotate(course_count=Count('courses'))
+
+class CourseQuerySet(models.QuerySet):
+    """
+    Queries over Course objects.
+    """
+
+    def with_note_stats(self):
+        """
+        Annotates each course with note_count and last_note_at, the creation
+        time of its newest note, in the same grouped query.
+        """
+        return self.annotate(
+            note_count=Count('notes'),
+            last_note_at=Max('notes__created_at'),
+            )
 
 class Term(models.Model):
     """
@@ -19,6 +47,8 @@ class Term(models.Model):
     term_slug = models.SlugField(null=True)
     current = models.BooleanField(default=False)
 
+    objects = TermQuerySet.as_manager()
+
     def __str__(self):
         """
         Provides a readable string representation of Term object
@@ -27,9 +57,10 @@ class Term(models.Model):
 
     class Meta():
         """
-        Arranges queryset by increasing year.
+        Arranges queryset by increasing year; slugs are unique per user.
         """
         ordering = ['-year']
+        unique_together = ('user', 'term_slug')
 
 class Course(models.Model):
     """
@@ -55,6 +86,7 @@ class Course(models.Model):
     title = models.CharField(max_length=40, blank=False)
     course_slug = models.SlugField(null=True)
 
+    objects = CourseQuerySet.as_manager()
 
     def __str__(self):
         """
@@ -64,9 +96,11 @@ class Course(models.Model):
 
     class Meta():
         """
-        Orders courses alphabetically by their course code.
+        Orders courses alphabetically by their course code; slugs are unique
+        per user.
         """
         ordering = ['course_code']
+        unique_together = ('user', 'course_slug')
 
 class ClassNote(models.Model):
     """
@@ -80,7 +114,10 @@ class ClassNote(models.Model):
         )
     title = models.CharField(max_length=47, blank=False)
     created_at = models.DateTimeField(auto_now_add=True)
-    body = RichTextField(config_name='ckeditor')
+    body = CompressedRichTextField(config_name='ckeditor')
+    revision = models.PositiveIntegerField(default=0)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    archived = models.BooleanField(default=False, editable=False)
     note_slug = models.SlugField(null=True)
     course = models.ForeignKey(
         Course,
@@ -95,6 +132,45 @@ class ClassNote(models.Model):
         """
         return f'{self.title}'
 
+    def save(self, *args, **kwargs):
+        """
+        Saves the ClassNote object, bumping its revision whenever an existing
+        object's body is written. Cached bodies are keyed by revision (refer
+        to Notes.notecache), so this retires every process's copy of the old
+        body, whoever saves: views, the API, the admin or a shell. Writing a
+        body onto an archived note's empty stub replaces the archived body,
+        which is dropped, rather than leaving it to overwrite the new one
+        when the note is next opened; refer to Notes.archive.
+        """
+        update_fields = kwargs.get('update_fields')
+        writes_body = (
+            self.pk is not None and
+            'body' not in self.get_deferred_fields() and
+            (update_fields is None or 'body' in update_fields)
+            )
+        unarchives = writes_body and self.archived and bool(self.body)
+        self._previous_revision = self.revision
+        if writes_body:
+            self.revision += 1
+            if unarchives:
+                self.archived = False
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {
+                    'revision', 'archived',
+                    }
+        try:
+            if unarchives:
+                with transaction.atomic(using=kwargs.get('using')):
+                    super().save(*args, **kwargs)
+                    NoteArchive.objects.filter(note_id=self.pk).delete()
+            else:
+                super().save(*args, **kwargs)
+        except Exception:
+            self.revision = self._previous_revision
+            if unarchives:
+                self.archived = True
+            raise
+
     def join_title(self):
         """
         Uses a ClassNote object's title to produce a lowercased version devoid
@@ -106,6 +182,257 @@ class ClassNote(models.Model):
     class Meta():
         """
         Orders ClassNote objects first, by their courses alphabetically; objects
-        with the same course are then ordered by most recent.
+        with the same course are then ordered by most recent. Slugs are unique
+        per user.
         """
         ordering = ['course', '-created_at']
+        unique_together = ('user', 'note_slug')
+
+class NoteArchive(models.Model):
+    """
+    Model holding the compressed body of a ClassNote object from a past term,
+    moved out of the note's row so that the notes table stays small. The note
+    is left behind as a stub with an empty body and archived set, and gets
+    its body back the next time it's opened. Refer to Notes.archive.
+    """
+    note = models.OneToOneField(
+        ClassNote,
+        on_delete=models.CASCADE,
+        related_name='archive',
+        )
+    data = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """
+        Provides a readable string representation of NoteArchive object.
+        """
+        return f'{self.note} (archived)'
+
+class NoteRevision(models.Model):
+    """
+    Model that records one saved version of a ClassNote object's body. Most
+    revisions store a zlib-compressed patch against the previous revision;
+    every few revisions a full snapshot is stored instead so that any version
+    can be rebuilt from a handful of rows. Refer to Notes.revisions.
+    """
+    note = models.ForeignKey(
+        ClassNote,
+        on_delete=models.CASCADE,
+        related_name='revisions',
+        )
+    number = models.PositiveIntegerField()
+    snapshot = models.BooleanField(default=False)
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """
+        Provides a readable string representation of NoteRevision object.
+        """
+        return f'{self.note} (revision {self.number})'
+
+    class Meta():
+        """
+        Orders revisions of a note from oldest to newest; each revision number
+        appears once per note.
+        """
+        ordering = ['note', 'number']
+        unique_together = ('note', 'number')
+
+class Task(models.Model):
+    """
+    Model whose objects are queued units of background work, such as deleting
+    a term with all of its notes. Tasks are run outside of the request by the
+    worker in Notes.tasks; each one may be related to the user who queued it
+    so that they can poll its status.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        )
+
+    user = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='tasks',
+        )
+    name = models.CharField(max_length=100)
+    arguments = models.TextField(default='[]')
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        )
+    progress = models.PositiveSmallIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    error = models.TextField(blank=True)
+    run_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        """
+        Provides a readable string representation of Task object.
+        """
+        return f'{self.name} ({self.status})'
+
+    class Meta():
+        """
+        Orders tasks by when they are due to run; the index serves the worker's
+        lookup of the next pending task.
+        """
+        ordering = ['run_at', 'pk']
+        index_together = [('status', 'run_at')]
+
+class CourseStats(models.Model):
+    """
+    Model holding running totals of a user's notes in one course, kept up to
+    date as notes are saved and deleted so that the dashboard never has to
+    aggregate over ClassNote. Notes without a course are totalled in a row
+    whose course is null. Refer to Notes.stats.
+    """
+    user = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.CASCADE,
+        related_name='course_stats',
+        )
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='stats',
+        )
+    note_count = models.PositiveIntegerField(default=0)
+    word_count = models.PositiveIntegerField(default=0)
+    last_activity = models.DateTimeField(null=True)
+
+    def __str__(self):
+        """
+        Provides a readable string representation of CourseStats object.
+        """
+        return f'{self.course} ({self.note_count} notes)'
+
+    class Meta():
+        """
+        One row per user and course.
+        """
+        unique_together = ('user', 'course')
+
+class WeeklyActivity(models.Model):
+    """
+    Model counting the notes a user created in one week, the week being
+    identified by its Monday. Refer to Notes.stats.
+    """
+    user = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.CASCADE,
+        related_name='weekly_activity',
+        )
+    week = models.DateField()
+    note_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        """
+        Provides a readable string representation of WeeklyActivity object.
+        """
+        return f'Week of {self.week}: {self.note_count} notes'
+
+    class Meta():
+        """
+        Orders weeks from oldest to newest; one row per user and week.
+        """
+        ordering = ['week']
+        unique_together = ('user', 'week')
+
+class NoteVector(models.Model):
+    """
+    Model holding the term frequencies of a ClassNote object's body as two
+    packed arrays: the sorted hashed ids of its terms and how often each
+    occurs. Also holds the body's SimHash fingerprint, split into bands for
+    lookups, and the older note it's a near-duplicate of, if any. Kept up to
+    date as the note is saved; refer to Notes.related and Notes.duplicates.
+    """
+    note = models.OneToOneField(
+        ClassNote,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='vector',
+        )
+    user = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.CASCADE,
+        related_name='note_vectors',
+        )
+    terms = models.BinaryField()
+    counts = models.BinaryField()
+    fingerprint = models.BigIntegerField(null=True)
+    band_0 = models.PositiveIntegerField(null=True)
+    band_1 = models.PositiveIntegerField(null=True)
+    band_2 = models.PositiveIntegerField(null=True)
+    band_3 = models.PositiveIntegerField(null=True)
+    duplicate_of = models.ForeignKey(
+        ClassNote,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='duplicates',
+        )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """
+        Provides a readable string representation of NoteVector object.
+        """
+        return f'{self.note} (vector)'
+
+    class Meta():
+        """
+        Indexes each band of a user's fingerprints for near-duplicate lookups.
+        """
+        index_together = [
+            ('user', 'band_0'),
+            ('user', 'band_1'),
+            ('user', 'band_2'),
+            ('user', 'band_3'),
+            ]
+
+class RelatedNote(models.Model):
+    """
+    Model ranking the notes most similar to a ClassNote object, as found by
+    the background pass in Notes.related.
+    """
+    note = models.ForeignKey(
+        ClassNote,
+        on_delete=models.CASCADE,
+        related_name='related_notes',
+        )
+    related = models.ForeignKey(
+        ClassNote,
+        on_delete=models.CASCADE,
+        related_name='related_to',
+        )
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    def __str__(self):
+        """
+        Provides a readable string representation of RelatedNote object.
+        """
+        return f'{self.note} -> {self.related} ({self.score:.2f})'
+
+    class Meta():
+        """
+        Orders a note's related notes from most to least similar; each rank
+        appears once per note.
+        """
+        ordering = ['note', 'rank']
+        unique_together = ('note', 'rank')
@@ -0,0 +1,146 @@
+"""
+The Term -> Course -> Note tree shown in the sidebar and served by the
+navigation endpoints. The tree is built from three queries and kept in the
+cache per user until one of the user's terms, courses or notes changes;
+refer to Notes.signals. The sidebar's rendered HTML and the search index built
+from the tree are cached alongside it.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+from django.utils.timezone import localdate
+from .models import Term, Course, ClassNote
+
+CACHE_TIMEOUT = getattr(settings, 'NAVIGATION_CACHE_TIMEOUT', 60 * 60)
+
+
+def cache_key(user_id):
+    """
+    Returns the cache key for a user's navigation tree.
+    """
+    return f'navigation-tree:{user_id}'
+
+
+def sidebar_cache_key(user_id):
+    """
+    Returns the cache key for a user's rendered sidebar.
+    """
+    return f'sidebar:{user_id}'
+
+
+def search_index_cache_key(user_id):
+    """
+    Returns the cache key for a user's search index; refer to Notes.search.
+    The version changes with the index's layout, so that indexes cached in
+    an older layout are never read.
+    """
+    return f'search-index:2:{user_id}'
+
+
+def build_navigation_tree(user):
+    """
+    Builds the user's navigation tree as a list of terms, each holding its
+    courses, each holding the titles, URLs and creation dates of its notes.
+    Only the columns needed are read, and note bodies never are.
+    """
+    terms = Term.objects.filter(user=user).only(
+        'session', 'school', 'year', 'term_slug', 'current',
+        )
+    notes = ClassNote.objects.only(
+        'title', 'note_slug', 'course_id', 'created_at',
+        )
+    courses = Course.objects.filter(user=user, term__isnull=False).only(
+        'title', 'course_code', 'course_slug', 'term_id',
+        ).prefetch_related(Prefetch('notes', queryset=notes))
+
+    courses_by_term = {}
+    for course in courses:
+        courses_by_term.setdefault(course.term_id, []).append(course)
+
+    tree = []
+    for term in terms:
+        term_courses = []
+        for course in courses_by_term.get(term.pk, []):
+            args = [term.term_slug, course.course_slug]
+            term_courses.append({
+                'title': course.title,
+                'course_code': course.course_code,
+                'slug': course.course_slug,
+                'url': reverse('Notes:notes_of_course', args=args),
+                'notes': [
+                    {
+                        'title': note.title,
+                        'slug': note.note_slug,
+                        'url': reverse(
+                            'Notes:one_note',
+                            args=args + [note.note_slug],
+                            ),
+                        'created': localdate(note.created_at).isoformat(),
+                    }
+                    for note in course.notes.all()
+                    ],
+                })
+        tree.append({
+            'session': term.session,
+            'school': term.school,
+            'year': term.year,
+            'slug': term.term_slug,
+            'current': term.current,
+            'url': reverse('Notes:course_term', args=[term.term_slug]),
+            'courses': term_courses,
+            })
+    return tree
+
+
+def get_navigation_tree(user):
+    """
+    Returns the user's navigation tree from the cache, building and caching it
+    on a miss.
+    """
+    key = cache_key(user.pk)
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_navigation_tree(user)
+        cache.set(key, tree, CACHE_TIMEOUT)
+    return tree
+
+
+def current_courses(tree):
+    """
+    Returns the courses of the current term in a navigation tree.
+    """
+    for term in tree:
+        if term['current']:
+            return term['courses']
+    return []
+
+
+def render_sidebar(user):
+    """
+    Returns the HTML of the sidebar's current courses and library from the
+    cache, rendering and caching it on a miss.
+    """
+    key = sidebar_cache_key(user.pk)
+    html = cache.get(key)
+    if html is None:
+        tree = get_navigation_tree(user)
+        html = render_to_string('sidebar.html', {
+            'current_courses': current_courses(tree),
+            'navigation_tree': tree,
+            })
+        cache.set(key, html, CACHE_TIMEOUT)
+    return mark_safe(html)
+
+
+def invalidate_navigation_tree(user_id):
+    """
+    Drops a user's cached navigation tree, sidebar and search index.
+    """
+    cache.delete_many([
+        cache_key(user_id),
+        sidebar_cache_key(user_id),
+        search_index_cache_key(user_id),
+        ])
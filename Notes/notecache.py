@@ -0,0 +1,174 @@
+"""
+Two-level read-through cache of decoded note bodies, for the pages and API
+calls that show a single note. The first level is an in-process LRU bounded
+by the total size of the bodies it holds (NOTE_CACHE_MAX_BYTES); the second is
+the shared Django cache, unless that's a database cache: a hit there is a
+query costing as much as reading the note, and a miss would write the body
+uncompressed into the cache table, crowding out everything else kept there.
+NOTE_CACHE_SHARED forces the choice either way. Entries are keyed by note id and revision, and every
+change to a body bumps the note's revision (ClassNote.save() does for any
+save, autosave's conditional update does for its own), so a cached body can
+never be stale: an edit made through another process simply moves readers on
+to a new key. Saves and deletes also drop the note's entries so that memory
+isn't held for bodies nobody will ask for again. Writes that bypass both, such
+as other queryset updates of body, must bump revision themselves.
+
+Callers fetch the note without its body (defer('body')) and hand it to
+attach_body(), which fills the body in from the cache, falling back to the
+database, and rehydrating archived notes, on a miss.
+"""
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import DatabaseCache
+from .archive import rehydrate
+
+MAX_BYTES = getattr(settings, 'NOTE_CACHE_MAX_BYTES', 8 * 1024 * 1024)
+TIMEOUT = getattr(settings, 'NOTE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+class BodyLRU():
+    """
+    Thread-safe LRU mapping of note id to (revision, body), evicting the
+    least recently used bodies once their total size exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, note_id, revision):
+        """
+        Returns the cached body of the note at revision, or None.
+        """
+        with self.lock:
+            entry = self.entries.get(note_id)
+            if entry is None or entry[0] != revision:
+                return None
+            self.entries.move_to_end(note_id)
+            return entry[1]
+
+    def put(self, note_id, revision, body):
+        """
+        Caches the body of the note at revision, replacing any other revision
+        of it. Bodies larger than the whole cache aren't kept.
+        """
+        size = len(body.encode('utf-8'))
+        with self.lock:
+            self._discard(note_id)
+            if size > self.max_bytes:
+                return
+            self.entries[note_id] = (revision, body, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, _, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+
+    def discard(self, note_id):
+        """
+        Drops the note's entry, if any.
+        """
+        with self.lock:
+            self._discard(note_id)
+
+    def _discard(self, note_id):
+        entry = self.entries.pop(note_id, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def clear(self):
+        """
+        Drops every entry.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+local = BodyLRU(MAX_BYTES)
+metrics = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+_metrics_lock = threading.Lock()
+
+
+def count(outcome):
+    """
+    Counts a lookup's outcome.
+    """
+    with _metrics_lock:
+        metrics[outcome] += 1
+
+
+def shared():
+    """
+    Returns whether bodies are kept in the shared Django cache as well.
+    """
+    choice = getattr(settings, 'NOTE_CACHE_SHARED', None)
+    if choice is not None:
+        return choice
+    return not isinstance(caches['default'], DatabaseCache)
+
+
+def cache_key(note_id, revision):
+    """
+    Shared cache key of a note's body at a revision.
+    """
+    return f'note-body:{note_id}:{revision}'
+
+
+def attach_body(note):
+    """
+    Sets note.body from the caches, loading it from the database and caching
+    it on a miss. note must have its pk and revision loaded.
+    """
+    body = local.get(note.pk, note.revision)
+    if body is not None:
+        count('local_hits')
+    else:
+        use_shared = shared()
+        key = cache_key(note.pk, note.revision)
+        if use_shared:
+            body = cache.get(key)
+        if body is not None:
+            count('shared_hits')
+        else:
+            count('misses')
+            if note.archived:
+                rehydrate(note)
+            body = note.body
+            if use_shared:
+                cache.set(key, body, TIMEOUT)
+        local.put(note.pk, note.revision, body)
+
+    note.body = body
+    return note
+
+
+def invalidate(note_id, revision):
+    """
+    Drops a note's cached body at revision from both levels.
+    """
+    local.discard(note_id)
+    if shared():
+        cache.delete(cache_key(note_id, revision))
+
+
+def cache_metrics():
+    """
+    Returns this process's lookup counts, hit rates and local cache size.
+    """
+    with _metrics_lock:
+        counts = dict(metrics)
+    lookups = sum(counts.values())
+    hits = counts['local_hits'] + counts['shared_hits']
+    counts.update({
+        'lookups': lookups,
+        'hit_rate': hits / lookups if lookups else 0.0,
+        'local_hit_rate': counts['local_hits'] / lookups if lookups else 0.0,
+        'local_entries': len(local.entries),
+        'local_bytes': local.size,
+        'local_max_bytes': local.max_bytes,
+        })
+    return counts
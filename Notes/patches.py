@@ -0,0 +1,111 @@
+"""
+Helpers for applying the compact edit operations sent by the note autosave
+script. A patch is a list of operations applied left to right against the
+saved body:
+
+    * a positive integer retains that many characters,
+    * a negative integer deletes that many characters,
+    * a string inserts that text.
+
+Whatever is left of the body after the last operation is retained, so a
+typical patch is just ``[offset, -removed, 'inserted']``. Offsets count
+UTF-16 code units, matching JavaScript string indices on the client.
+"""
+from difflib import SequenceMatcher
+
+UNIT = 2
+
+
+class PatchError(ValueError):
+    """
+    Raised when a patch is malformed or does not fit the body it is applied
+    to.
+    """
+
+
+def apply_patch(body, ops):
+    """
+    Applies a list of operations to body and returns the resulting string.
+    """
+    if not isinstance(ops, list):
+        raise PatchError('Patch must be a list of operations.')
+
+    source = body.encode('utf-16-le', 'surrogatepass')
+    output = []
+    position = 0
+
+    for op in ops:
+        if isinstance(op, bool):
+            raise PatchError(f'Invalid operation: {op!r}')
+        elif isinstance(op, int):
+            end = position + abs(op) * UNIT
+            if end > len(source):
+                raise PatchError('Patch runs past the end of the body.')
+            if op > 0:
+                output.append(source[position:end])
+            position = end
+        elif isinstance(op, str):
+            output.append(op.encode('utf-16-le', 'surrogatepass'))
+        else:
+            raise PatchError(f'Invalid operation: {op!r}')
+
+    output.append(source[position:])
+
+    try:
+        return b''.join(output).decode('utf-16-le')
+    except UnicodeDecodeError:
+        raise PatchError('Patch splits a character.')
+
+
+def units(text):
+    """
+    Returns the length of text in UTF-16 code units.
+    """
+    return len(text.encode('utf-16-le', 'surrogatepass')) // UNIT
+
+
+def make_patch(before, after):
+    """
+    Produces a list of operations that turns before into after. Bodies are
+    compared line by line, and each replaced block is trimmed to the span that
+    actually changed, so the patch grows with the edit rather than the body.
+    """
+    old_lines = before.splitlines(True)
+    new_lines = after.splitlines(True)
+    matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    ops = []
+
+    def retain(count):
+        if count:
+            if ops and isinstance(ops[-1], int) and ops[-1] > 0:
+                ops[-1] += count
+            else:
+                ops.append(count)
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        old = ''.join(old_lines[i1:i2])
+        new = ''.join(new_lines[j1:j2])
+
+        if tag == 'equal':
+            retain(units(old))
+            continue
+
+        prefix = 0
+        limit = min(len(old), len(new))
+        while prefix < limit and old[prefix] == new[prefix]:
+            prefix += 1
+        suffix = 0
+        limit -= prefix
+        while suffix < limit and old[-1 - suffix] == new[-1 - suffix]:
+            suffix += 1
+
+        retain(units(old[:prefix]))
+        if len(old) - prefix - suffix:
+            ops.append(-units(old[prefix:len(old) - suffix]))
+        if len(new) - prefix - suffix:
+            ops.append(new[prefix:len(new) - suffix])
+        retain(units(old[len(old) - suffix:]))
+
+    if ops and isinstance(ops[-1], int) and ops[-1] > 0:
+        ops.pop()
+    return ops
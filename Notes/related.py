@@ -0,0 +1,367 @@
+"""
+Related-note suggestions from the words of note bodies. Each note's body is
+stripped of HTML, split into lowercased words, less stop words, and stored
+as a sparse term-frequency vector in its NoteVector row: the sorted crc32
+hashes of its terms and their counts, packed into arrays. Vectors are
+updated as notes are saved; refer to Notes.signals.
+
+A background pass per user (the refresh_related_notes task, queued shortly
+after the user's notes change) weighs every vector by TF-IDF, normalizes it,
+and finds each note's RELATED_NOTES_COUNT most cosine-similar notes through
+an inverted index of the terms shared by more than one note. Terms found in
+more than half of a user's notes say little about any of them and are left
+out, and only each note's RELATED_NOTES_TERMS_KEPT heaviest terms are
+compared, which keeps the pass roughly linear in the number of notes; the
+scores are then the part of the cosine those terms make up. The neighbours
+are stored as RelatedNote rows, and the read page gets them from the cache in
+one lookup, along with the note the body duplicates, if any, falling back to
+two queries.
+"""
+import heapq
+import html
+import math
+import re
+import zlib
+from array import array
+from itertools import groupby
+from operator import itemgetter
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import strip_tags
+from .duplicates import (find_original, find_originals, fingerprint_fields,
+                         simhash, to_unsigned,)
+from .models import NoteVector, RelatedNote
+
+RELATED_COUNT = getattr(settings, 'RELATED_NOTES_COUNT', 5)
+MIN_SCORE = getattr(settings, 'RELATED_NOTES_MIN_SCORE', 0.1)
+CACHE_TIMEOUT = getattr(settings, 'RELATED_NOTES_CACHE_TIMEOUT', 60 * 60 * 24)
+MAX_DOCUMENT_FREQUENCY = 0.5
+TERMS_KEPT = getattr(settings, 'RELATED_NOTES_TERMS_KEPT', 32)
+REBUILD_BATCH_SIZE = 500
+
+WORD = re.compile(r'[^\W\d_]{3,}')
+STOP_WORDS = frozenset('''
+    about above after again against all also and any are because been before
+    being below between both but can could did does doing down during each
+    few for from further had has have having her here hers herself him
+    himself his how into its itself just more most nor not now off once only
+    other our ours ourselves out over own same she should some such than that
+    the their theirs them themselves then there these they this those through
+    too under until very was were what when where which while who whom why
+    will with would you your yours yourself yourselves
+    '''.split())
+
+
+def plain_text(body):
+    """
+    Returns the text of a note's HTML body.
+    """
+    return html.unescape(strip_tags(body or ''))
+
+
+def tokenize(text):
+    """
+    Returns the lowercased words of plain text, less stop words.
+    """
+    return [word for word in WORD.findall(text.lower())
+            if word not in STOP_WORDS]
+
+
+def vectorize(text):
+    """
+    Returns the term-frequency vector of plain text as an array of sorted
+    term hashes and an array of their counts.
+    """
+    frequencies = {}
+    for word in tokenize(text):
+        term = zlib.crc32(word.encode('utf-8'))
+        frequencies[term] = frequencies.get(term, 0) + 1
+    terms = array('I', sorted(frequencies))
+    counts = array('H', (min(frequencies[term], 0xffff) for term in terms))
+    return terms, counts
+
+
+def unpack(typecode, data):
+    """
+    Returns the array packed into data.
+    """
+    values = array(typecode)
+    values.frombytes(bytes(data))
+    return values
+
+
+def vector_fields(text, fingerprint):
+    """
+    Returns the NoteVector field values for a note's text and fingerprint,
+    other than the note it duplicates.
+    """
+    terms, counts = vectorize(text)
+    fields = {
+        'terms': terms.tobytes(),
+        'counts': counts.tobytes(),
+        'updated_at': timezone.now(),
+        }
+    fields.update(fingerprint_fields(fingerprint))
+    return fields
+
+
+def update_vector(note):
+    """
+    Stores the term vector and fingerprint of a note's body, flagging it as
+    a duplicate of the oldest older note of its owner it's nearly the same
+    as; refer to Notes.duplicates.
+    """
+    text = plain_text(note.body)
+    fingerprint = simhash(text)
+    values = vector_fields(text, fingerprint)
+    values.update({
+        'user_id': note.user_id,
+        'duplicate_of_id': find_original(note.user_id, note.pk, fingerprint),
+        })
+    cache.delete(cache_key(note.pk))
+
+    for attempt in range(2):
+        if NoteVector.objects.filter(note_id=note.pk).update(**values):
+            return
+        try:
+            with transaction.atomic():
+                NoteVector.objects.create(note_id=note.pk, **values)
+            return
+        except IntegrityError:
+            continue
+
+
+def rebuild_vectors(notes, batch_size=REBUILD_BATCH_SIZE, progress=None):
+    """
+    Recomputes the vectors and fingerprints of the ClassNote objects matched
+    by notes, replacing their NoteVector rows a batch at a time and calling
+    progress with the number done after each, then flags the duplicates in
+    the libraries of their owners anew. Archived notes keep their vectors.
+    Returns the number of notes done.
+    """
+    notes = notes.filter(archived=False).order_by('pk').values_list(
+        'pk', 'user_id', 'body',
+        )
+    done = 0
+    last = 0
+    users = set()
+    while True:
+        batch = list(notes.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            break
+        vectors = []
+        for pk, user_id, body in batch:
+            text = plain_text(str(body))
+            vectors.append(NoteVector(
+                note_id=pk,
+                user_id=user_id,
+                **vector_fields(text, simhash(text)),
+                ))
+            users.add(user_id)
+        ids = [vector.note_id for vector in vectors]
+
+        with transaction.atomic():
+            flags = dict(NoteVector.objects.filter(
+                note_id__in=ids,
+                ).values_list('note_id', 'duplicate_of_id'))
+            for vector in vectors:
+                vector.duplicate_of_id = flags.get(vector.note_id)
+            NoteVector.objects.filter(note_id__in=ids).delete()
+            NoteVector.objects.bulk_create(vectors)
+        last = ids[-1]
+        done += len(batch)
+        if progress is not None:
+            progress(done)
+
+    users = sorted(users)
+    for start in range(0, len(users), batch_size):
+        flag_duplicates(users[start:start + batch_size])
+    return done
+
+
+def flag_duplicates(user_ids):
+    """
+    Works out which note each note of the given users duplicates from their
+    stored fingerprints, updating the flags that changed; refer to
+    Notes.duplicates. Returns the number of notes whose flag changed.
+    """
+    rows = NoteVector.objects.filter(user_id__in=user_ids).order_by(
+        'user_id', 'note_id',
+        ).values_list('user_id', 'note_id', 'fingerprint', 'duplicate_of_id')
+
+    changed = {}
+    for user_id, library in groupby(rows.iterator(), key=itemgetter(0)):
+        flags = {}
+        fingerprints = {}
+        for user_id, note_id, fingerprint, duplicate_of_id in library:
+            flags[note_id] = duplicate_of_id
+            if fingerprint is not None:
+                fingerprints[note_id] = to_unsigned(fingerprint)
+        originals = find_originals(fingerprints)
+        for note_id, duplicate_of_id in flags.items():
+            original = originals.get(note_id)
+            if original != duplicate_of_id:
+                changed.setdefault(original, []).append(note_id)
+
+    for original, note_ids in changed.items():
+        NoteVector.objects.filter(note_id__in=note_ids).update(
+            duplicate_of_id=original,
+            )
+    note_ids = [note_id for ids in changed.values() for note_id in ids]
+    cache.delete_many([cache_key(note_id) for note_id in note_ids])
+    return len(note_ids)
+
+
+def weigh(vectors, keep=TERMS_KEPT):
+    """
+    Turns term-frequency vectors, a dict of note id to (terms, counts), into
+    unit-length TF-IDF vectors, a dict of note id to a list of (term, weight),
+    keeping only the keep heaviest terms that can make two notes similar.
+    """
+    frequencies = {}
+    for terms, counts in vectors.values():
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+
+    total = len(vectors)
+    most = max(2, MAX_DOCUMENT_FREQUENCY * total)
+    weighted = {}
+    for note_id, (terms, counts) in vectors.items():
+        weights = [
+            (term, (1 + math.log(count)) *
+             (math.log((1 + total) / (1 + frequencies[term])) + 1))
+            for term, count in zip(terms, counts)
+            ]
+        norm = math.sqrt(sum(weight * weight for term, weight in weights))
+        weighted[note_id] = heapq.nlargest(
+            keep,
+            ((term, weight / norm) for term, weight in weights
+             if 1 < frequencies[term] <= most),
+            key=itemgetter(1),
+            )
+    return weighted
+
+
+def nearest_neighbours(vectors, count=RELATED_COUNT, min_score=MIN_SCORE):
+    """
+    Returns a dict of note id to a list of (score, note id) of its count most
+    cosine-similar notes, best first, scoring at least min_score.
+    """
+    weighted = weigh(vectors)
+    postings = {}
+    for note_id, weights in weighted.items():
+        for term, weight in weights:
+            postings.setdefault(term, []).append((note_id, weight))
+
+    neighbours = {}
+    for note_id, weights in weighted.items():
+        scores = {}
+        for term, weight in weights:
+            for other, other_weight in postings[term]:
+                if other != note_id:
+                    scores[other] = scores.get(other, 0.0) + \
+                        weight * other_weight
+        best = heapq.nlargest(
+            count,
+            ((score, other) for other, score in scores.items()
+             if score >= min_score),
+            )
+        if best:
+            neighbours[note_id] = best
+    return neighbours
+
+
+def cache_key(note_id):
+    """
+    Returns the cache key for a note's related notes.
+    """
+    return f'related-notes:{note_id}'
+
+
+def refresh_related(user_id):
+    """
+    Recomputes the related notes of every note of a user from their vectors,
+    and which notes duplicate which, since edits to one note can make
+    another's flag stale.
+    """
+    rows = NoteVector.objects.filter(user_id=user_id).values_list(
+        'note_id', 'terms', 'counts',
+        )
+    vectors = {
+        note_id: (unpack('I', terms), unpack('H', counts))
+        for note_id, terms, counts in rows.iterator()
+        }
+    neighbours = nearest_neighbours(vectors)
+
+    with transaction.atomic():
+        RelatedNote.objects.filter(note__user_id=user_id).delete()
+        RelatedNote.objects.bulk_create(
+            RelatedNote(
+                note_id=note_id,
+                related_id=related_id,
+                rank=rank,
+                score=score,
+                )
+            for note_id, best in neighbours.items()
+            for rank, (score, related_id) in enumerate(best)
+            )
+    cache.delete_many([cache_key(note_id) for note_id in vectors])
+    flag_duplicates([user_id])
+
+
+def related_notes(note):
+    """
+    Returns a dict with the title, course code, URL and score of each of a
+    note's related notes, best first, and the title and URL of the note it
+    duplicates, if any, from the cache, reading and caching them on a miss.
+    """
+    key = cache_key(note.pk)
+    related = cache.get(key)
+    if related is None:
+        rows = RelatedNote.objects.filter(
+            note_id=note.pk,
+            related__course__term__isnull=False,
+            ).values_list(
+            'score', 'related__title', 'related__note_slug',
+            'related__course__course_code', 'related__course__course_slug',
+            'related__course__term__term_slug',
+            )
+        original = NoteVector.objects.filter(
+            note_id=note.pk,
+            duplicate_of__course__term__isnull=False,
+            ).values_list(
+            'duplicate_of__title', 'duplicate_of__note_slug',
+            'duplicate_of__course__course_slug',
+            'duplicate_of__course__term__term_slug',
+            ).first()
+        related = {
+            'notes': [
+                {
+                    'title': title,
+                    'course_code': course_code,
+                    'url': note_url(term_slug, course_slug, note_slug),
+                    'score': score,
+                }
+                for score, title, note_slug, course_code, course_slug,
+                term_slug in rows
+                ],
+            'duplicate_of': None,
+            }
+        if original is not None:
+            title, note_slug, course_slug, term_slug = original
+            related['duplicate_of'] = {
+                'title': title,
+                'url': note_url(term_slug, course_slug, note_slug),
+                }
+        cache.set(key, related, CACHE_TIMEOUT)
+    return related
+
+
+def note_url(term_slug, course_slug, note_slug):
+    """
+    Returns the URL of a note's read page.
+    """
+    return reverse('Notes:one_note', args=[term_slug, course_slug, note_slug])
@@ -0,0 +1,122 @@
+"""
+Revision history for ClassNote bodies. Each save appends a NoteRevision row
+holding a zlib-compressed patch (refer to Notes.patches) against the previous
+revision, so storage grows with the size of the edit. Every
+NOTE_SNAPSHOT_INTERVAL revisions a compressed copy of the whole body is stored
+instead, which bounds how many patches a reconstruction has to replay.
+"""
+import json
+import zlib
+from django.conf import settings
+from django.db import transaction
+from .models import NoteRevision
+from .patches import apply_patch, make_patch
+
+SNAPSHOT_INTERVAL = getattr(settings, 'NOTE_SNAPSHOT_INTERVAL', 10)
+
+
+def pack_snapshot(body):
+    """
+    Compresses a full note body.
+    """
+    return zlib.compress(body.encode('utf-8'))
+
+
+def pack_patch(ops):
+    """
+    Compresses a list of patch operations.
+    """
+    encoded = json.dumps(ops, ensure_ascii=False, separators=(',', ':'))
+    return zlib.compress(encoded.encode('utf-8', 'surrogatepass'))
+
+
+def unpack(revision):
+    """
+    Decompresses a NoteRevision object's data into either the body it stores
+    or the list of patch operations it stores.
+    """
+    decoded = zlib.decompress(bytes(revision.data))
+    if revision.snapshot:
+        return decoded.decode('utf-8')
+    return json.loads(decoded.decode('utf-8', 'surrogatepass'))
+
+
+def record_revision(note, previous_body=None):
+    """
+    Appends a revision for the note's current body and revision number.
+    previous_body is the body as it was at the previous revision; when it is
+    missing, or that revision was never recorded, a snapshot is stored.
+    """
+    number = note.revision
+    snapshot = (
+        previous_body is None
+        or number % SNAPSHOT_INTERVAL == 0
+        or not note.revisions.filter(number=number - 1).exists()
+        )
+
+    if snapshot:
+        data = pack_snapshot(note.body)
+    else:
+        data = pack_patch(make_patch(previous_body, note.body))
+
+    return NoteRevision.objects.create(
+        note=note,
+        number=number,
+        snapshot=snapshot,
+        data=data,
+        )
+
+
+def get_revision_body(note, number):
+    """
+    Rebuilds the note's body as it was at the given revision from the nearest
+    preceding snapshot, using two queries. Returns None if the revision is not
+    recorded.
+    """
+    base = note.revisions.filter(
+        number__lte=number,
+        snapshot=True,
+        ).order_by('-number').values_list('number', flat=True).first()
+
+    if base is None:
+        return None
+
+    revisions = list(note.revisions.filter(
+        number__gte=base,
+        number__lte=number,
+        ).order_by('number'))
+
+    if revisions[-1].number != number:
+        return None
+
+    body = unpack(revisions[0])
+    for revision in revisions[1:]:
+        body = apply_patch(body, unpack(revision))
+    return body
+
+
+def compact_revisions(note, keep):
+    """
+    Discards all but the newest keep revisions of the note. The oldest
+    revision that is kept is rewritten as a snapshot so the remaining history
+    can still be rebuilt. Returns the number of revisions deleted.
+    """
+    numbers = list(note.revisions.order_by('-number').values_list(
+        'number',
+        flat=True,
+        )[:keep])
+
+    if len(numbers) < keep or not numbers:
+        return 0
+
+    cutoff = numbers[-1]
+
+    with transaction.atomic():
+        oldest = note.revisions.get(number=cutoff)
+        if not oldest.snapshot:
+            oldest.data = pack_snapshot(get_revision_body(note, cutoff))
+            oldest.snapshot = True
+            oldest.save(update_fields=['data', 'snapshot'])
+        deleted, _ = note.revisions.filter(number__lt=cutoff).delete()
+
+    return deleted
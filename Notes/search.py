@@ -0,0 +1,390 @@
+"""
+Typo-tolerant search of a user's notes by title, course code and course title.
+Texts are normalized (lowercased, accents and punctuation dropped) and
+compared as sets of trigrams the way PostgreSQL's pg_trgm does: every word is
+padded with two spaces in front and one behind, and the similarity of two
+texts is the number of trigrams they share over the number either has. A note
+scores the best similarity of its three fields, and a query found verbatim in
+a note's title scores 1.
+
+On PostgreSQL with the pg_trgm extension installed, the database does the
+matching against the trigram indexes added by migration 0029. Elsewhere,
+each user's fields are kept in an in-process trigram index, an inverted index
+from trigram to notes cached beside the navigation tree it's built from and
+dropped with it. Only notes sharing enough of the query's trigrams to reach
+SEARCH_SIMILARITY_THRESHOLD are scored, so a search never scores the whole
+library. Titles containing the query verbatim, even mid-word, are found first
+with str.find() over one string of every title, which runs in C.
+
+Searches can be scoped to a term (or whichever is current), a course and a
+range of creation dates. Matches are counted per term and per course from the
+same rows the hits come from, so facets cost no extra queries: term counts
+cover every term within the dates, course counts every course within the
+term, so that each facet shows what choosing it would list.
+"""
+import math
+import unicodedata
+from bisect import bisect_right
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router
+from django.db.models import CharField, Q
+from django.db.models.functions import Greatest
+from django.urls import reverse
+from django.utils.timezone import localdate
+from .models import ClassNote
+from .navigation import (CACHE_TIMEOUT, get_navigation_tree,
+                         search_index_cache_key,)
+
+THRESHOLD = getattr(settings, 'SEARCH_SIMILARITY_THRESHOLD', 0.3)
+RESULT_LIMIT = getattr(settings, 'SEARCH_RESULT_LIMIT', 50)
+CURRENT_TERM = 'current'
+
+
+def normalize(text):
+    """
+    Lowercases text and reduces it to words of letters and digits.
+    """
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(
+        character if character.isalnum() else ' '
+        for character in text
+        if not unicodedata.combining(character)
+        )
+    return ' '.join(text.split())
+
+
+def trigrams(text):
+    """
+    Returns the set of trigrams of normalized text, as pg_trgm builds them.
+    """
+    grams = set()
+    for word in text.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(first, second):
+    """
+    Returns the similarity, between 0 and 1, of two sets of trigrams.
+    """
+    if not first or not second:
+        return 0.0
+    shared = len(first & second)
+    return shared / (len(first) + len(second) - shared)
+
+
+def build_search_index(user):
+    """
+    Builds the user's trigram index from their navigation tree. Notes hold
+    their title, slug, URL, creation date, course number and title trigrams;
+    courses hold their slug, code, term number, the trigrams of their code
+    and title and the numbers of their notes. Each has postings mapping
+    trigrams to the numbers of the notes or courses having them. titles
+    joins every note's title, less spaces, on newlines, and title_starts
+    holds the offset of each in it.
+    """
+    terms = []
+    notes = []
+    courses = []
+    joined_titles = []
+    note_postings = {}
+    course_postings = {}
+    for term in get_navigation_tree(user):
+        term_number = len(terms)
+        terms.append({
+            'slug': term['slug'],
+            'label': term['session'],
+            'current': term['current'],
+            })
+        for course in term['courses']:
+            fields = [
+                trigrams(normalize(course['course_code'])),
+                trigrams(normalize(course['title'])),
+                ]
+            course_number = len(courses)
+            courses.append({
+                'slug': course['slug'],
+                'label': course['course_code'],
+                'term': term_number,
+                'fields': fields,
+                'notes': [],
+                })
+            for gram in fields[0] | fields[1]:
+                course_postings.setdefault(gram, []).append(course_number)
+
+            for note in course['notes']:
+                title = normalize(note['title'])
+                grams = trigrams(title)
+                number = len(notes)
+                joined_titles.append(title.replace(' ', ''))
+                notes.append({
+                    'title': note['title'],
+                    'slug': note['slug'],
+                    'url': note['url'],
+                    'created': note['created'],
+                    'course': course_number,
+                    'grams': grams,
+                    })
+                courses[course_number]['notes'].append(number)
+                for gram in grams:
+                    note_postings.setdefault(gram, []).append(number)
+    title_starts = []
+    offset = 0
+    for title in joined_titles:
+        title_starts.append(offset)
+        offset += len(title) + 1
+    return {
+        'terms': terms,
+        'notes': notes,
+        'titles': '\n'.join(joined_titles),
+        'title_starts': title_starts,
+        'courses': courses,
+        'note_postings': note_postings,
+        'course_postings': course_postings,
+        }
+
+
+def get_search_index(user):
+    """
+    Returns the user's trigram index from the cache, building and caching it
+    on a miss.
+    """
+    key = search_index_cache_key(user.pk)
+    index = cache.get(key)
+    if index is None:
+        index = build_search_index(user)
+        cache.set(key, index, CACHE_TIMEOUT)
+    return index
+
+
+def candidates(postings, grams, needed):
+    """
+    Returns the numbers having at least needed of grams in postings.
+    """
+    overlaps = {}
+    for gram in grams:
+        for number in postings.get(gram, ()):
+            overlaps[number] = overlaps.get(number, 0) + 1
+    return [number for number, overlap in overlaps.items()
+            if overlap >= needed]
+
+
+def search_index(index, query, threshold=THRESHOLD):
+    """
+    Returns (score, match) for the notes of index matching query; refer to
+    match(). Notes whose title holds the query verbatim score 1. Other notes
+    and courses sharing fewer than threshold times the query's trigrams can't
+    reach threshold and are never scored; a course's score is shared by all
+    of its notes.
+    """
+    query = normalize(query)
+    grams = trigrams(query)
+    if not grams:
+        return []
+    needed = max(1, math.ceil(threshold * len(grams) - 1e-9))
+
+    scores = {}
+    joined = query.replace(' ', '')
+    found = index['titles'].find(joined)
+    while found != -1:
+        scores[bisect_right(index['title_starts'], found) - 1] = 1.0
+        found = index['titles'].find(joined, found + 1)
+    for number in candidates(index['note_postings'], grams, needed):
+        if number not in scores:
+            note = index['notes'][number]
+            scores[number] = similarity(grams, note['grams'])
+    for number in candidates(index['course_postings'], grams, needed):
+        course = index['courses'][number]
+        score = max(similarity(grams, field) for field in course['fields'])
+        for note in course['notes']:
+            scores[note] = max(scores.get(note, 0.0), score)
+
+    matches = []
+    for number, score in scores.items():
+        if score < threshold:
+            continue
+        note = index['notes'][number]
+        course = index['courses'][note['course']]
+        term = index['terms'][course['term']]
+        matches.append((score, match(
+            note['title'], note['slug'], note['url'], note['created'],
+            course['slug'], course['label'], term['slug'], term['label'],
+            term['current'],
+            )))
+    return matches
+
+
+@lru_cache(maxsize=None)
+def trigram_extension(alias):
+    """
+    Tells whether the database behind alias is PostgreSQL with pg_trgm.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            )
+        return cursor.fetchone() is not None
+
+
+def search_database(user, query, alias, start=None, end=None,
+                    threshold=THRESHOLD):
+    """
+    Returns (score, match) for the user's notes matching query and created
+    between the start and end dates, using pg_trgm; refer to match(). The %
+    operator and ILIKE both let the trigram indexes prune candidates, % at
+    the server's pg_trgm.similarity_threshold, 0.3 by default.
+    """
+    from django.contrib.postgres.lookups import TrigramSimilar
+    from django.contrib.postgres.search import TrigramSimilarity
+    CharField.register_lookup(TrigramSimilar)
+
+    query = normalize(query)
+    if not query:
+        return []
+    fields = ('title', 'course__course_code', 'course__title')
+    similar = Q(title__icontains=query)
+    for field in fields:
+        similar |= Q(**{f'{field}__trigram_similar': query})
+
+    notes = ClassNote.objects.using(alias).filter(
+        similar,
+        user=user,
+        course__term__isnull=False,
+        )
+    if start is not None:
+        notes = notes.filter(created_at__date__gte=start)
+    if end is not None:
+        notes = notes.filter(created_at__date__lte=end)
+    notes = notes.annotate(
+        score=Greatest(*(TrigramSimilarity(field, query) for field in fields)),
+        ).values_list(
+        'score', 'title', 'note_slug', 'created_at', 'course__course_slug',
+        'course__course_code', 'course__term__term_slug',
+        'course__term__session', 'course__term__current',
+        ).order_by()
+
+    joined = query.replace(' ', '')
+    matches = []
+    for score, title, note_slug, created_at, course_slug, course_code, \
+            term_slug, session, current in notes:
+        if joined in normalize(title).replace(' ', ''):
+            score = 1.0
+        if score < threshold:
+            continue
+        url = reverse(
+            'Notes:one_note',
+            args=[term_slug, course_slug, note_slug],
+            )
+        matches.append((score, match(
+            title, note_slug, url, localdate(created_at).isoformat(),
+            course_slug, course_code, term_slug, session, current,
+            )))
+    return matches
+
+
+def match(title, slug, url, created, course, course_label, term, term_label,
+          current):
+    """
+    Returns a search match: a note's title, slug, URL and creation date, and
+    the slugs and labels of its course and term.
+    """
+    return {
+        'title': title,
+        'slug': slug,
+        'url': url,
+        'created': created,
+        'course': course,
+        'course_label': course_label,
+        'term': term,
+        'term_label': term_label,
+        'current': current,
+        }
+
+
+def in_term(found, term):
+    """
+    Tells whether a match is in term, a term slug or CURRENT_TERM.
+    """
+    if term == CURRENT_TERM:
+        return found['current']
+    return found['term'] == term
+
+
+def in_course(found, course):
+    """
+    Tells whether a match is in course, a course slug.
+    """
+    return found['course'] == course
+
+
+def count_facet(matches, key, label, test, value):
+    """
+    Counts matches by their key, returning a facet's values, most matches
+    first, each with its slug, label, count and whether it's the value
+    selected, if any, according to test.
+    """
+    counts = {}
+    for score, found in matches:
+        facet = counts.setdefault(found[key], {
+            'slug': found[key],
+            'label': found[label],
+            'count': 0,
+            'selected': value is not None and test(found, value),
+            })
+        facet['count'] += 1
+    return sorted(
+        counts.values(),
+        key=lambda facet: (-facet['count'], facet['label']),
+        )
+
+
+def apply_scope(matches, scope):
+    """
+    Narrows matches down to scope, returning the remaining matches, best
+    first, and the term and course facets; refer to the module docstring.
+    """
+    start = scope.get('start')
+    if start is not None:
+        matches = [(score, found) for score, found in matches
+                   if found['created'] >= start.isoformat()]
+    end = scope.get('end')
+    if end is not None:
+        matches = [(score, found) for score, found in matches
+                   if found['created'] <= end.isoformat()]
+
+    facets = {}
+    for name, key, test in (('terms', 'term', in_term),
+                            ('courses', 'course', in_course)):
+        value = scope.get(key)
+        facets[name] = count_facet(matches, key, f'{key}_label', test, value)
+        if value is not None:
+            matches = [(score, found) for score, found in matches
+                       if test(found, value)]
+
+    matches.sort(key=lambda match: (-match[0], match[1]['title']))
+    return matches, facets
+
+
+def search_notes(user, query, scope=None, limit=RESULT_LIMIT):
+    """
+    Returns (score, match) for at most limit of the user's notes matching
+    query within scope, best first, and the term and course facets of all
+    of them. scope may hold a term slug, or CURRENT_TERM, a course slug and
+    start and end dates.
+    """
+    scope = scope or {}
+    alias = router.db_for_read(ClassNote)
+    if trigram_extension(alias):
+        matches = search_database(
+            user, query, alias, scope.get('start'), scope.get('end'),
+            )
+    else:
+        matches = search_index(get_search_index(user), query)
+    matches, facets = apply_scope(matches, scope)
+    return matches[:limit], facets
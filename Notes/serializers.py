@@ -25,6 +25,7 @@ class TermSerializer(serializers.HyperlinkedModelSerializer):
         """
         model = Term
         fields = ('user', 'school', 'year', 'session', 'term_slug',)
+        extra_kwargs = {'user': {'view_name': 'api:user-detail'}}
 
 class CourseSerializer(serializers.HyperlinkedModelSerializer):
     """
@@ -53,6 +54,10 @@ class CourseSerializer(serializers.HyperlinkedModelSerializer):
         """
         model = Course
         fields = ('user', 'title', 'course_code', 'course_slug', 'term',)
+        extra_kwargs = {
+            'user': {'view_name': 'api:user-detail'},
+            'term': {'view_name': 'api:term-detail'},
+            }
 
 class ClassNoteSerializer(serializers.HyperlinkedModelSerializer):
     """
@@ -66,6 +71,10 @@ class ClassNoteSerializer(serializers.HyperlinkedModelSerializer):
         """
         model = ClassNote
         fields = ('user', 'title', 'body', 'note_slug', 'course',)
+        extra_kwargs = {
+            'user': {'view_name': 'api:user-detail'},
+            'course': {'view_name': 'api:course-detail'},
+            }
 
     def __init__(self, *args, **kwargs):
         """
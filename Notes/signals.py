@@ -0,0 +1,97 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import Term, Course, ClassNote
+from .navigation import invalidate_navigation_tree
+from .notecache import invalidate
+from .related import update_vector
+from .stats import count_words, note_deleted, note_saved
+from .tasks import queue_related_refresh
+
+
+@receiver(post_save, sender=Term)
+@receiver(post_delete, sender=Term)
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=ClassNote)
+@receiver(post_delete, sender=ClassNote)
+def navigation_changed(sender, instance, **kwargs):
+    """
+    Drops the owner's cached navigation tree whenever one of their terms,
+    courses or notes is saved or deleted.
+    """
+    invalidate_navigation_tree(instance.user_id)
+
+
+@receiver(pre_save, sender=ClassNote)
+def note_saving(sender, instance, raw=False, **kwargs):
+    """
+    Counts the note's words and remembers its previous course and word count
+    so that the statistics can be adjusted once it's saved.
+    """
+    if raw:
+        return
+    instance.word_count = count_words(instance.body)
+    instance._stats_previous = None
+    if instance.pk is not None:
+        instance._stats_previous = ClassNote.objects.filter(
+            pk=instance.pk,
+            ).values_list('course_id', 'word_count').first()
+
+
+@receiver(post_save, sender=ClassNote)
+def note_stats_saved(sender, instance, raw=False, **kwargs):
+    """
+    Adds a saved note to its owner's statistics.
+    """
+    if not raw:
+        note_saved(instance, getattr(instance, '_stats_previous', None))
+
+
+@receiver(post_delete, sender=ClassNote)
+def note_stats_deleted(sender, instance, **kwargs):
+    """
+    Removes a deleted note from its owner's statistics.
+    """
+    note_deleted(instance)
+
+
+@receiver(post_save, sender=ClassNote)
+def note_cache_saved(sender, instance, **kwargs):
+    """
+    Drops the note's cached body, cached under the revision the note had
+    before ClassNote.save() bumped it. Raw saves don't go through save().
+    """
+    revision = getattr(instance, '_previous_revision', instance.revision)
+    invalidate(instance.pk, revision)
+
+
+@receiver(post_delete, sender=ClassNote)
+def note_cache_deleted(sender, instance, **kwargs):
+    """
+    Drops the note's cached body.
+    """
+    invalidate(instance.pk, instance.revision)
+
+
+@receiver(post_save, sender=ClassNote)
+def note_vector_saved(sender, instance, raw=False, update_fields=None,
+                      **kwargs):
+    """
+    Updates the note's term vector when its body was saved, and queues a
+    refresh of its owner's related notes. Archived notes keep the vector of
+    the body they had.
+    """
+    if raw or instance.archived or 'body' in instance.get_deferred_fields():
+        return
+    if update_fields is not None and 'body' not in update_fields:
+        return
+    update_vector(instance)
+    queue_related_refresh(instance.user_id)
+
+
+@receiver(post_delete, sender=ClassNote)
+def note_vector_deleted(sender, instance, **kwargs):
+    """
+    Queues a refresh of the owner's related notes.
+    """
+    queue_related_refresh(instance.user_id)
@@ -0,0 +1,51 @@
+"""
+Allocation of slugs that are unique per user. Term, Course and ClassNote
+objects are looked up by (user, slug), which unique constraints on those
+pairs turn into single-row index hits; the helpers here pick a free slug for
+a new object, appending -2, -3 and so on when the plain slug is taken.
+"""
+from django.db import IntegrityError, transaction
+from django.utils.text import slugify
+
+ATTEMPTS = 3
+
+
+def unique_slug(instance, field, value, fallback):
+    """
+    Returns a slug derived from value that no other object of the instance's
+    model belonging to the same user has in field. Every slug the user has
+    that could collide is fetched in one query on the (user, slug) index.
+    """
+    model = type(instance)
+    max_length = model._meta.get_field(field).max_length
+    base = slugify(value)[:max_length - 4].strip('-') or fallback
+
+    taken = model.objects.filter(
+        user=instance.user,
+        **{f'{field}__startswith': base},
+        ).exclude(pk=instance.pk).values_list(field, flat=True)
+    taken = set(taken)
+
+    slug = base
+    suffix = 2
+    while slug in taken:
+        slug = f'{base}-{suffix}'
+        suffix += 1
+    return slug
+
+
+def save_with_unique_slug(instance, field, value, fallback):
+    """
+    Assigns a unique slug to the instance and saves it. If a concurrent save
+    claims the same slug first, the unique constraint rejects this one and a
+    new slug is allocated.
+    """
+    for attempt in range(ATTEMPTS):
+        setattr(instance, field, unique_slug(instance, field, value, fallback))
+        try:
+            with transaction.atomic():
+                instance.save()
+            return instance
+        except IntegrityError:
+            if attempt == ATTEMPTS - 1:
+                raise
@@ -0,0 +1,211 @@
+"""
+Materialized note statistics for the dashboard. CourseStats rows keep each
+user's note count, word total and last activity per course, and
+WeeklyActivity rows count the notes created each week. Both are adjusted by
+the signal handlers in Notes.signals as notes are saved and deleted, using
+conditional F() updates so concurrent saves don't lose counts. Writes that
+bypass signals (queryset updates, the raw batch deletes in Notes.tasks) adjust
+or rebuild the numbers themselves; `manage.py rebuild_stats` recomputes
+everything from the notes.
+"""
+import datetime
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from django.utils.html import strip_tags
+from .models import ClassNote, CourseStats, WeeklyActivity
+
+WEEKS_SHOWN = getattr(settings, 'DASHBOARD_WEEKS_SHOWN', 8)
+
+
+def count_words(body):
+    """
+    Counts the words in a note's HTML body.
+    """
+    return len(strip_tags(body or '').split())
+
+
+def week_of(moment):
+    """
+    Returns the Monday of the local week containing moment.
+    """
+    day = timezone.localtime(moment).date()
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def upsert(model, lookup, **changes):
+    """
+    Adds the given amounts to the fields of the row matched by lookup,
+    creating the row if it doesn't exist yet. Totals never drop below zero,
+    and a last_activity change only ever moves the timestamp forward.
+    """
+    values = {}
+    for field, amount in changes.items():
+        if field == 'last_activity':
+            values[field] = Coalesce(Greatest(F(field), amount), amount)
+        elif amount < 0:
+            values[field] = Greatest(F(field) + amount, 0)
+        else:
+            values[field] = F(field) + amount
+
+    for attempt in range(2):
+        if model.objects.filter(**lookup).update(**values):
+            return
+        if any(amount < 0 for field, amount in changes.items()
+               if field != 'last_activity'):
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, **changes)
+            return
+        except IntegrityError:
+            continue
+
+
+def adjust_stats(user_id, course_id, notes=0, words=0, created=None,
+                 activity=None):
+    """
+    Adjusts a user's statistics for one course by notes and words, counting
+    notes against the week of created and recording activity as the latest
+    time the course was worked on.
+    """
+    changes = {'note_count': notes, 'word_count': words}
+    if activity is not None:
+        changes['last_activity'] = activity
+    lookup = {'user_id': user_id, 'course_id': course_id}
+    upsert(CourseStats, lookup, **changes)
+
+    if notes and created is not None:
+        upsert(
+            WeeklyActivity,
+            {'user_id': user_id, 'week': week_of(created)},
+            note_count=notes,
+            )
+
+
+def note_saved(note, previous):
+    """
+    Accounts for a saved note. previous is the (course_id, word_count) the
+    note had before the save, or None if it was just created.
+    """
+    now = timezone.now()
+    if previous is None:
+        adjust_stats(note.user_id, note.course_id, 1, note.word_count,
+                     note.created_at, now)
+        return
+
+    course_id, words = previous
+    if course_id == note.course_id:
+        adjust_stats(note.user_id, course_id, 0, note.word_count - words,
+                     activity=now)
+    else:
+        adjust_stats(note.user_id, course_id, -1, -words)
+        adjust_stats(note.user_id, note.course_id, 1, note.word_count,
+                     activity=now)
+
+
+def note_deleted(note):
+    """
+    Accounts for a deleted note.
+    """
+    adjust_stats(note.user_id, note.course_id, -1, -note.word_count,
+                 note.created_at)
+
+
+def latest(*moments):
+    """
+    Returns the latest of the given times that are set, or None.
+    """
+    moments = [moment for moment in moments if moment is not None]
+    return max(moments) if moments else None
+
+
+def rebuild_stats(user_id):
+    """
+    Recomputes a user's statistics from their notes. Last activity is the
+    time a course's notes were last saved, which the notes don't record, so
+    the times already recorded are kept, moved forward to the newest note's
+    creation if that's later; courses without one get the latter.
+    """
+    notes = ClassNote.objects.filter(user_id=user_id).order_by()
+    courses = notes.values('course_id').annotate(
+        notes=Count('pk'),
+        words=Sum('word_count'),
+        latest=Max('created_at'),
+        )
+    weeks = {}
+    for created_at in notes.values_list('created_at', flat=True).iterator():
+        week = week_of(created_at)
+        weeks[week] = weeks.get(week, 0) + 1
+
+    with transaction.atomic():
+        stats = CourseStats.objects.filter(user_id=user_id)
+        activity = dict(stats.values_list('course_id', 'last_activity'))
+        stats.delete()
+        WeeklyActivity.objects.filter(user_id=user_id).delete()
+        CourseStats.objects.bulk_create(
+            CourseStats(
+                user_id=user_id,
+                course_id=row['course_id'],
+                note_count=row['notes'],
+                word_count=row['words'] or 0,
+                last_activity=latest(
+                    activity.get(row['course_id']),
+                    row['latest'],
+                    ),
+                )
+            for row in courses
+            )
+        WeeklyActivity.objects.bulk_create(
+            WeeklyActivity(user_id=user_id, week=week, note_count=count)
+            for week, count in weeks.items()
+            )
+
+
+def dashboard_stats(user):
+    """
+    Gathers the dashboard's numbers for a user in two queries: totals, notes
+    per term and course, and notes per week for the last WEEKS_SHOWN weeks.
+    """
+    rows = user.course_stats.select_related('course__term').filter(
+        note_count__gt=0,
+        )
+    terms = {}
+    totals = {'notes': 0, 'words': 0, 'last_activity': None}
+    for row in rows:
+        term = row.course.term if row.course else None
+        entry = terms.setdefault(term, {'term': term, 'notes': 0,
+                                        'courses': []})
+        entry['notes'] += row.note_count
+        entry['courses'].append(row)
+        totals['notes'] += row.note_count
+        totals['words'] += row.word_count
+        if row.last_activity and (totals['last_activity'] is None or
+                                  row.last_activity > totals['last_activity']):
+            totals['last_activity'] = row.last_activity
+
+    this_week = week_of(timezone.now())
+    first_week = this_week - datetime.timedelta(weeks=WEEKS_SHOWN - 1)
+    counts = dict(user.weekly_activity.filter(
+        week__gte=first_week,
+        ).values_list('week', 'note_count'))
+    weeks = []
+    for offset in range(WEEKS_SHOWN):
+        week = first_week + datetime.timedelta(weeks=offset)
+        weeks.append({'week': week, 'notes': counts.get(week, 0)})
+
+    peak = max([week['notes'] for week in weeks] + [1])
+    for week in weeks:
+        week['height'] = round(100 * week['notes'] / peak)
+
+    return {
+        'totals': totals,
+        'terms': sorted(
+            terms.values(),
+            key=lambda entry: entry['term'] and entry['term'].year or 0,
+            reverse=True,
+            ),
+        'weeks': weeks,
+        }
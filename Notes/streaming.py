@@ -0,0 +1,34 @@
+"""
+Rendering of list rows, shared by the rows template tag and the streamed
+lists of Notes.mixins.StreamingListMixin.
+"""
+ROWS_MARKER = '<!-- streamed rows -->'
+
+
+class RowStream():
+    """
+    Stands in for a streamed list's rows while the page around them is
+    rendered; the rows tag leaves ROWS_MARKER in their place. It counts as
+    the number of rows known to exist.
+    """
+
+    def __init__(self, count):
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(())
+
+
+def render_rows(template, context, notes, start=0):
+    """
+    Renders template once for each note, with the note as `note` and its
+    position in the whole list, counting from 1, as `counter`.
+    """
+    parts = []
+    for counter, note in enumerate(notes, start + 1):
+        with context.push(note=note, counter=counter):
+            parts.append(template.render(context))
+    return ''.join(parts)
@@ -0,0 +1,327 @@
+"""
+A small database-backed queue for work that is too slow to do inside a
+request. Functions decorated with @task can be queued with enqueue(); queued
+Task objects are run either by the run_tasks management command or, when
+BACKGROUND_TASKS_IN_PROCESS is set, by a daemon thread inside the web process
+that is woken whenever a task is queued. Failed tasks are retried with an
+exponential backoff until they run out of attempts. Either worker also puts
+back tasks left running for longer than BACKGROUND_TASK_STALE_AFTER seconds by
+a worker that died, or was recycled, mid-task.
+"""
+import json
+import threading
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connections, models, transaction
+from django.db.models import F
+from django.utils import timezone
+from .archive import ARCHIVE_AFTER_YEARS, archive_notes
+from .models import Term, Course, ClassNote, Task
+from .related import refresh_related
+from .stats import rebuild_stats
+
+IN_PROCESS = getattr(settings, 'BACKGROUND_TASKS_IN_PROCESS', True)
+RETRY_DELAY = getattr(settings, 'BACKGROUND_TASK_RETRY_DELAY', 30)
+POLL_INTERVAL = getattr(settings, 'BACKGROUND_TASK_POLL_INTERVAL', 30)
+STALE_AFTER = getattr(settings, 'BACKGROUND_TASK_STALE_AFTER', 600)
+DELETE_BATCH_SIZE = getattr(settings, 'DELETE_BATCH_SIZE', 500)
+RELATED_REFRESH_DELAY = getattr(settings, 'RELATED_NOTES_REFRESH_DELAY', 60)
+
+TASKS = {}
+
+_current = threading.local()
+_wakeup = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def task(func):
+    """
+    Decorator that registers func so that it can be queued by name.
+    """
+    TASKS[func.__name__] = func
+    return func
+
+
+def enqueue(name, *args, user=None, max_attempts=3, delay=0):
+    """
+    Queues the registered task called name to be run with args, which must be
+    JSON serializable, no sooner than delay seconds from now, and returns the
+    new Task object.
+    """
+    if name not in TASKS:
+        raise KeyError(f'No task named {name!r} is registered.')
+
+    queued = Task.objects.create(
+        name=name,
+        arguments=json.dumps(args),
+        user=user,
+        max_attempts=max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        )
+
+    if IN_PROCESS:
+        transaction.on_commit(wake_worker)
+
+    return queued
+
+
+def claim_next():
+    """
+    Marks the next due pending task as running and returns it, or returns None
+    if there is nothing to run. Claiming is a conditional update, so several
+    workers can share the queue without running a task twice.
+    """
+    now = timezone.now()
+    candidates = Task.objects.filter(
+        status=Task.PENDING,
+        run_at__lte=now,
+        ).values_list('pk', flat=True)[:10]
+
+    for pk in candidates:
+        claimed = Task.objects.filter(pk=pk, status=Task.PENDING).update(
+            status=Task.RUNNING,
+            attempts=F('attempts') + 1,
+            started_at=now,
+            )
+        if claimed:
+            return Task.objects.get(pk=pk)
+    return None
+
+
+def run_task(queued):
+    """
+    Runs a claimed Task object and records whether it succeeded. A failed task
+    is put back in the queue with a growing delay until it has used up its
+    attempts.
+    """
+    func = TASKS.get(queued.name)
+    _current.task = queued
+
+    try:
+        if func is None:
+            raise KeyError(f'No task named {queued.name!r} is registered.')
+        func(*json.loads(queued.arguments))
+    except Exception:
+        queued.error = traceback.format_exc()
+        if func is not None and queued.attempts < queued.max_attempts:
+            delay = RETRY_DELAY * 2 ** (queued.attempts - 1)
+            queued.status = Task.PENDING
+            queued.run_at = timezone.now() + timedelta(seconds=delay)
+        else:
+            queued.status = Task.FAILED
+            queued.finished_at = timezone.now()
+    else:
+        queued.status = Task.DONE
+        queued.progress = 100
+        queued.finished_at = timezone.now()
+    finally:
+        _current.task = None
+
+    queued.save(update_fields=[
+        'status', 'progress', 'error', 'run_at', 'finished_at',
+        ])
+    return queued
+
+
+def report_progress(done, total):
+    """
+    Records how far along the task that is currently running is, for the
+    task page to show.
+    """
+    queued = getattr(_current, 'task', None)
+    if queued is None or not total:
+        return
+
+    progress = min(99, 100 * done // total)
+    if progress != queued.progress:
+        queued.progress = progress
+        Task.objects.filter(pk=queued.pk).update(progress=progress)
+
+
+def run_pending(limit=None):
+    """
+    Runs due tasks until the queue is empty or limit tasks have been run, and
+    returns how many were run.
+    """
+    count = 0
+    while limit is None or count < limit:
+        queued = claim_next()
+        if queued is None:
+            break
+        run_task(queued)
+        count += 1
+    return count
+
+
+def requeue_stale(timeout=STALE_AFTER):
+    """
+    Puts tasks that have been running for longer than timeout seconds back in
+    the queue; these were left behind by a worker that died mid-task. Tasks
+    that have used up their attempts are marked failed instead. Returns the
+    number of tasks requeued or failed.
+    """
+    now = timezone.now()
+    stale = Task.objects.filter(
+        status=Task.RUNNING,
+        started_at__lt=now - timedelta(seconds=timeout),
+        )
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED,
+        error='The worker running the task stopped.',
+        finished_at=now,
+        )
+    return failed + stale.update(status=Task.PENDING, run_at=now)
+
+
+def wake_worker():
+    """
+    Starts the in-process worker thread if it is not already running and
+    wakes it up.
+    """
+    global _worker
+
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(
+                target=_work,
+                name='notes-tasks',
+                daemon=True,
+                )
+            _worker.start()
+    _wakeup.set()
+
+
+def _work():
+    """
+    Body of the in-process worker thread. Besides being woken by enqueue, it
+    checks the queue every POLL_INTERVAL seconds to pick up retries and
+    tasks abandoned by workers that have gone.
+    """
+    while True:
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+        close_old_connections()
+        try:
+            requeue_stale()
+            run_pending()
+        except Exception:
+            traceback.print_exc()
+        finally:
+            connections.close_all()
+
+
+def delete_notes(notes):
+    """
+    Deletes the ClassNote objects matched by notes in batches of
+    DELETE_BATCH_SIZE, reporting progress after each batch. Only primary keys
+    are ever read: rows that cascade from a note are deleted by note id first,
+    then the notes themselves are deleted by id without going through
+    Django's collector, which would load every note, body included, into
+    memory before deleting anything. References from rows that outlive the
+    note are cleared the same way. Each batch is its own transaction so
+    locks are held briefly. Since no signals are sent, callers rebuild the
+    owner's statistics afterwards.
+    """
+    total = notes.count()
+    done = 0
+    dependents = [
+        relation for relation in ClassNote._meta.related_objects
+        if relation.on_delete is models.CASCADE
+        ]
+    references = [
+        relation for relation in ClassNote._meta.related_objects
+        if relation.on_delete is models.SET_NULL
+        ]
+
+    while True:
+        ids = list(notes.order_by().values_list('pk', flat=True)[
+            :DELETE_BATCH_SIZE
+            ])
+        if not ids:
+            break
+
+        with transaction.atomic():
+            for relation in references:
+                lookup = {f'{relation.field.name}__in': ids}
+                relation.related_model.objects.filter(**lookup).update(
+                    **{relation.field.name: None}
+                    )
+            for relation in dependents:
+                lookup = {f'{relation.field.name}__in': ids}
+                relation.related_model.objects.filter(**lookup).delete()
+            batch = ClassNote.objects.filter(pk__in=ids)
+            batch._raw_delete(batch.db)
+
+        done += len(ids)
+        report_progress(done, total)
+
+
+@task
+def delete_term(term_id):
+    """
+    Deletes a Term object along with its courses and notes, removing the notes
+    in batches first.
+    """
+    term = Term.objects.filter(pk=term_id).values_list('user_id').first()
+    delete_notes(ClassNote.objects.filter(course__term_id=term_id))
+    Term.objects.filter(pk=term_id).delete()
+    if term is not None:
+        rebuild_stats(term[0])
+        queue_related_refresh(term[0])
+
+
+@task
+def delete_course(course_id):
+    """
+    Deletes a Course object along with its notes, removing the notes in
+    batches first.
+    """
+    course = Course.objects.filter(pk=course_id).values_list('user_id').first()
+    delete_notes(ClassNote.objects.filter(course_id=course_id))
+    Course.objects.filter(pk=course_id).delete()
+    if course is not None:
+        rebuild_stats(course[0])
+        queue_related_refresh(course[0])
+
+
+@task
+def archive_old_notes(years=None):
+    """
+    Moves the bodies of old notes from past terms into the archive; refer to
+    Notes.archive.
+    """
+    archive_notes(years or ARCHIVE_AFTER_YEARS, progress=report_progress)
+
+
+def refresh_cache_key(user_id):
+    """
+    Returns the cache key marking a pending refresh of a user's related notes.
+    """
+    return f'related-refresh:{user_id}'
+
+
+def queue_related_refresh(user_id):
+    """
+    Queues a refresh of a user's related notes RELATED_REFRESH_DELAY seconds
+    from now, unless one is already waiting to run, so that a burst of saves
+    leads to a single refresh.
+    """
+    if cache.add(refresh_cache_key(user_id), True, RELATED_REFRESH_DELAY * 10):
+        enqueue(
+            'refresh_related_notes',
+            user_id,
+            delay=RELATED_REFRESH_DELAY,
+            )
+
+
+@task
+def refresh_related_notes(user_id):
+    """
+    Recomputes a user's related notes; refer to Notes.related. Saves made
+    from now on queue another refresh.
+    """
+    cache.delete(refresh_cache_key(user_id))
+    refresh_related(user_id)
@@ -0,0 +1,38 @@
+"""
+Tags rendering the parts of base.html that don't depend on the page, as
+fragments that are rendered once and reused rather than re-rendered with
+every page.
+"""
+from functools import lru_cache
+from django import template
+from django.template.loader import render_to_string
+from ..forms import SearchBarForm
+from ..navigation import render_sidebar
+
+register = template.Library()
+
+
+@lru_cache(maxsize=None)
+def render_navbar():
+    """
+    Renders the top navigation bar, which is the same for every user, once
+    per process.
+    """
+    return render_to_string('navbar.html', {'searchbar': SearchBarForm()})
+
+
+@register.simple_tag
+def navbar():
+    """
+    Inserts the top navigation bar.
+    """
+    return render_navbar()
+
+
+@register.simple_tag(takes_context=True)
+def sidebar_library(context):
+    """
+    Inserts the active-user's current courses and library; refer to
+    Notes.navigation.render_sidebar.
+    """
+    return render_sidebar(context['user'])
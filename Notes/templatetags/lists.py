@@ -0,0 +1,24 @@
+"""
+The rows tag, which renders a list's rows from a row template:
+
+    {% rows notes "notes_list_row.html" %}
+
+Lists streamed by Notes.mixins.StreamingListMixin get a marker instead, with
+the rows sent in its place.
+"""
+from django import template
+from django.utils.safestring import mark_safe
+from ..streaming import ROWS_MARKER, RowStream, render_rows
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def rows(context, notes, template_name):
+    """
+    Renders template_name for each of notes; refer to render_rows.
+    """
+    if isinstance(notes, RowStream):
+        return mark_safe(ROWS_MARKER)
+    row_template = context.template.engine.get_template(template_name)
+    return mark_safe(render_rows(row_template, context, notes))
@@ -0,0 +1,198 @@
+"""
+Query auditing for the test suite. QueryAuditRunner wraps every request made
+through Django's test client and records the SQL it runs. A request fails its
+test when its route makes more queries than the budget declared for it beside
+the URL definitions (query_budgets in the URLconf modules listed in
+BUDGET_URLCONFS). The same statement shape repeated within one request, the
+mark of an N+1 such as note.course.term in a template, raises a warning. At
+the end of the run a report of N+1 suspects, per-route query counts and the
+slowest statements is written to TEST_QUERY_REPORT.
+
+The runner also adds the REPLICA_ALIASES databases, replicas mirroring the
+default test database, for the replica routing tests; they exist only under
+test.
+"""
+import importlib
+import os
+import re
+import warnings
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.urls import Resolver404, resolve
+from Scribnotes.profiling import QueryRecorder
+
+BUDGET_URLCONFS = ('Notes.urls', 'Scribnotes.urls', 'Scribnotes.api_urls')
+N_PLUS_ONE_THRESHOLD = 3
+SLOWEST_SHOWN = 25
+IGNORED = re.compile(r'^\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO)', re.I)
+PLACEHOLDERS = re.compile(r'%s(\s*,\s*%s)*')
+REPLICA_ALIASES = ('local_replica1', 'local_replica2')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when a request makes more queries than its route's budget.
+    """
+
+
+def load_budgets():
+    """
+    Collects the query budgets of every audited URLconf, keyed by view name
+    including the namespace, e.g. 'Notes:one_note'.
+    """
+    budgets = {}
+    for module_name in BUDGET_URLCONFS:
+        module = importlib.import_module(module_name)
+        prefix = f'{module.app_name}:' if hasattr(module, 'app_name') else ''
+        for name, budget in getattr(module, 'query_budgets', {}).items():
+            budgets[prefix + name] = budget
+    return budgets
+
+
+def shape(sql):
+    """
+    Reduces a statement to its shape: whitespace collapsed and lists of
+    placeholders folded, so statements differing only in parameters match.
+    """
+    return PLACEHOLDERS.sub('%s...', ' '.join(sql.split()))
+
+
+class QueryAudit():
+    """
+    Collects the queries of test client requests and checks them against the
+    budgets.
+    """
+
+    def __init__(self):
+        self.budgets = load_budgets()
+        self.counts = {}
+        self.suspects = {}
+        self.queries = []
+
+    def audit(self, request, method, path):
+        """
+        Runs request(), a test client call, recording its queries.
+        """
+        try:
+            route = resolve(path).view_name
+        except Resolver404:
+            return request()
+
+        recorders = [QueryRecorder(alias) for alias in connections]
+        with ExitStack() as stack:
+            for recorder in recorders:
+                connection = connections[recorder.alias]
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = request()
+
+        queries = [query for recorder in recorders
+                   for query in recorder.queries
+                   if not IGNORED.match(query['sql'])]
+        self.record(route, f'{method} {path}', queries)
+        return response
+
+    def record(self, route, request, queries):
+        """
+        Notes a request's queries, warning about repeated shapes and failing
+        if the route's budget is exceeded.
+        """
+        self.counts[route] = max(self.counts.get(route, 0), len(queries))
+        for query in queries:
+            self.queries.append((query, request))
+
+        repeated = {}
+        for query in queries:
+            repeated.setdefault(shape(query['sql']), []).append(query)
+        for sql, matches in repeated.items():
+            if len(matches) >= N_PLUS_ONE_THRESHOLD:
+                self.suspects[(route, sql)] = (len(matches), matches[0])
+                warnings.warn(
+                    f'{request} ran the same query {len(matches)} times '
+                    f'from {matches[0]["origin"]}: {sql}'
+                    )
+
+        budget = self.budgets.get(route)
+        if budget is not None and len(queries) > budget:
+            raise QueryBudgetExceeded(
+                f'{request} made {len(queries)} queries; the budget for '
+                f'{route} is {budget}.\n' +
+                '\n'.join(f'{query["origin"]}: {query["sql"]}'
+                          for query in queries)
+                )
+
+    def write_report(self, path):
+        """
+        Writes N+1 suspects, query counts by route and the slowest statements
+        to path.
+        """
+        lines = ['Repeated queries', '']
+        for (route, sql), (count, query) in sorted(self.suspects.items()):
+            lines.append(f'{route}: {count}x from {query["origin"]}')
+            lines.append(f'    {sql}')
+        if not self.suspects:
+            lines.append('None.')
+
+        lines += ['', 'Queries by route (most in one request / budget)', '']
+        for route, count in sorted(self.counts.items()):
+            budget = self.budgets.get(route, '-')
+            lines.append(f'{route}: {count} / {budget}')
+
+        lines += ['', 'Slowest queries', '']
+        slowest = sorted(self.queries, key=lambda item: item[0]['duration'],
+                         reverse=True)
+        for query, request in slowest[:SLOWEST_SHOWN]:
+            lines.append(f'{query["duration"]:.2f} ms  {request}  '
+                         f'{query["origin"]}')
+            lines.append(f'    {" ".join(query["sql"].split())}')
+
+        with open(path, 'w') as report:
+            report.write('\n'.join(lines) + '\n')
+
+
+class QueryAuditRunner(DiscoverRunner):
+    """
+    Test runner that audits the queries of every test client request; refer
+    to the module docstring.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        """
+        Starts auditing test client requests.
+        """
+        super().setup_test_environment(**kwargs)
+        self.query_audit = audit = QueryAudit()
+        self.original_request = original = Client.request
+
+        def request(client, **environ):
+            return audit.audit(
+                lambda: original(client, **environ),
+                environ.get('REQUEST_METHOD', 'GET'),
+                environ.get('PATH_INFO', '/'),
+                )
+        Client.request = request
+
+    def setup_databases(self, **kwargs):
+        """
+        Adds REPLICA_ALIASES, mirroring the default test database, before the
+        test databases are set up.
+        """
+        for alias in REPLICA_ALIASES:
+            connections.databases[alias] = dict(
+                connections.databases['default'],
+                TEST={'MIRROR': 'default'},
+                )
+        return super().setup_databases(**kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        """
+        Stops auditing and writes the report.
+        """
+        Client.request = self.original_request
+        path = getattr(settings, 'TEST_QUERY_REPORT', None)
+        if path:
+            self.query_audit.write_report(path)
+            print(f'Query report written to {os.path.relpath(path)}')
+        super().teardown_test_environment(**kwargs)
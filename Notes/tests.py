@@ -1,3 +1,1932 @@
-from django.test import TestCase
+import importlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core import signing
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection, connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings,)
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, path
+from django.urls.resolvers import RegexPattern
+from django.utils import timezone
+from django.utils.http import urlencode
+from django.utils.text import slugify
+from Scribnotes import routers
+from Scribnotes.middleware import (OFFLINE_USER_COOKIE, STICKY_COOKIE,
+                                   ReplicaMiddleware, offline_user,)
+from Scribnotes.profiling import PROFILE_PARAM, make_token, token_is_valid
+from Scribnotes.resolvers import lazy_include
+from Scribnotes.startup import connect_databases
+from . import mixins, notecache, slugs, tasks, throttling, views
+from .coalescing import coalesce
+from .duplicates import (cluster_fingerprints, distance, find_originals,
+                         simhash,)
+from .management.commands import find_duplicates
+from .archive import archive_notes, rehydrate
+from .fields import COMPRESSED, CompressedText
+from .forms import UpdateNoteForm
+from .models import (Term, Course, ClassNote, CourseStats, NoteArchive,
+                     NoteRevision, NoteVector, RelatedNote, Task,
+                     WeeklyActivity,)
+from .navigation import get_navigation_tree, render_sidebar
+from .notecache import BodyLRU, attach_body, local
+from .patches import PatchError, apply_patch, make_patch
+from .related import (nearest_neighbours, plain_text, rebuild_vectors,
+                      tokenize, vectorize,)
+from .revisions import (compact_revisions, get_revision_body,
+                        pack_snapshot, record_revision,)
+from .search import (get_search_index, normalize, search_notes, similarity,
+                     trigrams,)
+from .serializers import ClassNoteSerializer
+from .stats import rebuild_stats
+from .testing import (REPLICA_ALIASES, QueryAudit, QueryBudgetExceeded,
+                      shape,)
 
-# Create your tests here.
+STATIC_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+LOCAL_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    }
+
+
+@override_settings(STATICFILES_STORAGE=STATIC_STORAGE, CACHES=LOCAL_CACHE)
+class LibraryTestCase(TestCase):
+    """
+    Base class for tests needing a user, student, with a current term, Fall
+    2019, and a course in it, CS101. NOTES lists the notes created in the
+    course, each a title or a (title, body) pair; subclasses add anything
+    else they need in setUpTestData. The caches are emptied before each test.
+    """
+    NOTES = ()
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Creates the user, term, course and NOTES.
+        """
+        cls.user = get_user_model().objects.create_user(
+            'student',
+            password='password',
+            )
+        cls.term = Term.objects.create(
+            user=cls.user,
+            school='School',
+            year=2019,
+            session='Fall 2019',
+            term_slug='fall-2019',
+            current=True,
+            )
+        cls.course = cls.create_course('CS101', 'Intro')
+        for note in cls.NOTES:
+            if isinstance(note, str):
+                note = (note,)
+            cls.create_note(*note)
+
+    @classmethod
+    def create_course(cls, course_code, title):
+        """
+        Creates a course in the term.
+        """
+        return Course.objects.create(
+            user=cls.user,
+            term=cls.term,
+            course_code=course_code,
+            title=title,
+            course_slug=slugify(course_code),
+            )
+
+    @classmethod
+    def create_note(cls, title, body='<p>Body</p>', course=None):
+        """
+        Creates a note in course, CS101 by default, slugged from its title.
+        """
+        return ClassNote.objects.create(
+            user=cls.user,
+            course=course or cls.course,
+            title=title,
+            body=body,
+            note_slug=slugify(title),
+            )
+
+    def setUp(self):
+        """
+        Empties the caches.
+        """
+        cache.clear()
+        local.clear()
+
+
+class SlugTests(LibraryTestCase):
+    """
+    Checks that slugs are unique per user and fit their columns.
+    """
+    NOTES = ('Lecture 1', 'A' * 46)
+
+    def new_note(self, title):
+        """
+        Returns an unsaved note of the user titled title.
+        """
+        return ClassNote(user=self.user, course=self.course, title=title)
+
+    def test_taken_slugs_get_a_suffix(self):
+        self.assertEqual(
+            slugs.unique_slug(self.new_note('Lecture 1'), 'note_slug',
+                              'Lecture 1', 'note'),
+            'lecture-1-2',
+            )
+        note = ClassNote.objects.get(note_slug='lecture-1')
+        self.assertEqual(
+            slugs.unique_slug(note, 'note_slug', 'Lecture 1', 'note'),
+            'lecture-1',
+            )
+        self.assertEqual(
+            slugs.unique_slug(self.new_note('?!'), 'note_slug', '?!', 'note'),
+            'note',
+            )
+
+    def test_long_slugs_fit_with_their_suffix(self):
+        note = self.new_note('A' * 60)
+        slugs.save_with_unique_slug(note, 'note_slug', note.title, 'note')
+        self.assertEqual(note.note_slug, 'a' * 46 + '-2')
+
+    def test_concurrent_claims_retry(self):
+        note = self.new_note('Lecture 1')
+        claimed = ['lecture-1', 'lecture-1-2']
+        with mock.patch.object(slugs, 'unique_slug', side_effect=claimed):
+            slugs.save_with_unique_slug(note, 'note_slug', note.title, 'note')
+        self.assertEqual(note.note_slug, 'lecture-1-2')
+        claimed = ['lecture-1'] * slugs.ATTEMPTS
+        with mock.patch.object(slugs, 'unique_slug', side_effect=claimed), \
+                self.assertRaises(IntegrityError):
+            slugs.save_with_unique_slug(
+                self.new_note('Lecture 1'), 'note_slug', 'Lecture 1', 'note',
+                )
+
+    def test_migration_shortens_long_duplicates(self):
+        migration = importlib.import_module(
+            'Notes.migrations.0023_deduplicate_slugs',
+            )
+        model = mock.Mock(_meta=ClassNote._meta)
+        rows = model.objects.order_by.return_value.values_list.return_value
+        rows.iterator.return_value = [(1, 1, 'a' * 50, 'A'),
+                                      (2, 1, 'a' * 50, 'A')]
+        migration.deduplicate(model, 'note_slug', 'title', 'note')
+        model.objects.filter.assert_called_once_with(pk=2)
+        model.objects.filter.return_value.update.assert_called_once_with(
+            note_slug='a' * 46 + '-2',
+            )
+
+
+class PatchTests(SimpleTestCase):
+    """
+    Checks the autosave patch format; refer to Notes.patches.
+    """
+
+    def test_operations(self):
+        self.assertEqual(
+            apply_patch('hello world', [6, -5, 'there']),
+            'hello there',
+            )
+        self.assertEqual(apply_patch('hello', ['oh, ']), 'oh, hello')
+        self.assertEqual(apply_patch('hello', []), 'hello')
+
+    def test_offsets_count_utf16_units(self):
+        smile = '\U0001f600'
+        self.assertEqual(apply_patch(f'a{smile}b', [3, 'x']), f'a{smile}xb')
+        self.assertEqual(apply_patch(f'a{smile}b', [1, -2]), 'ab')
+        with self.assertRaises(PatchError):
+            apply_patch(f'a{smile}b', [2, 'x'])
+
+    def test_malformed_patches(self):
+        for ops in ({'ops': []}, [100], [-100], [True], [1.5], [None]):
+            with self.assertRaises(PatchError):
+                apply_patch('hello', ops)
+
+    def test_make_patch_round_trips(self):
+        before = '<p>One</p>\n<p>Two \U0001f600</p>\n<p>Three</p>\n'
+        for after in ('<p>One</p>\n<p>Two \U0001f600!</p>\n<p>Three</p>\n',
+                      '<p>Three</p>\n',
+                      ''):
+            self.assertEqual(
+                apply_patch(before, make_patch(before, after)),
+                after,
+                )
+        self.assertEqual(make_patch(before, before), [])
+
+
+class AutosaveTests(LibraryTestCase):
+    """
+    Checks that autosave applies patches to the revision they were made
+    against and refuses stale ones.
+    """
+    NOTES = (('Lecture 1', '<p>Body</p>'),)
+    URL = '/Notes/Courses/fall-2019/cs101/lecture-1/Autosave/'
+
+    def setUp(self):
+        """
+        Logs the test client in and empties the caches.
+        """
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def autosave(self, payload):
+        """
+        Posts payload as JSON to the autosave URL.
+        """
+        return self.client.post(
+            self.URL,
+            payload if isinstance(payload, str) else json.dumps(payload),
+            content_type='application/json',
+            )
+
+    def test_patch_is_applied(self):
+        response = self.autosave({'revision': 0, 'ops': [3, 'Edited ']})
+        self.assertEqual(response.json(), {'revision': 1, 'saved': True})
+        note = ClassNote.objects.get(note_slug='lecture-1')
+        self.assertEqual(str(note.body), '<p>Edited Body</p>')
+        response = self.autosave({'revision': 1, 'ops': []})
+        self.assertEqual(response.json(), {'revision': 1, 'saved': False})
+
+    def test_stale_revision_conflicts(self):
+        self.autosave({'revision': 0, 'ops': [3, 'Edited ']})
+        response = self.autosave({'revision': 0, 'ops': [3, 'Other ']})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {'revision': 1})
+        note = ClassNote.objects.get(note_slug='lecture-1')
+        self.assertEqual(str(note.body), '<p>Edited Body</p>')
+
+    def test_malformed_requests(self):
+        for payload in ('not json', {'ops': []}, {'revision': 0, 'ops': [99]}):
+            self.assertEqual(self.autosave(payload).status_code, 400)
+
+
+class NoteCacheTests(LibraryTestCase):
+    """
+    Checks the note body cache's eviction and that no save leaves a stale
+    body behind in any process.
+    """
+    NOTES = ('Lecture 1',)
+
+    def read(self):
+        """
+        Reads the note the way the read page does.
+        """
+        note = ClassNote.objects.defer('body').get(note_slug='lecture-1')
+        return attach_body(note)
+
+    def test_lru_evicts_by_size(self):
+        lru = BodyLRU(10)
+        lru.put(1, 0, 'aaaa')
+        lru.put(2, 0, 'bbbb')
+        lru.get(1, 0)
+        lru.put(3, 0, '\u00e9\u00e9')
+        self.assertEqual(lru.get(2, 0), None)
+        self.assertEqual(lru.get(1, 0), 'aaaa')
+        self.assertEqual(lru.size, 8)
+        lru.put(1, 1, 'a')
+        self.assertEqual((lru.get(1, 0), lru.get(1, 1)), (None, 'a'))
+        lru.put(4, 0, 'x' * 11)
+        self.assertEqual((lru.get(4, 0), lru.size), (None, 5))
+
+    def test_every_save_retires_cached_bodies(self):
+        note = self.read()
+        revision = note.revision
+        note.body = '<p>Edited</p>'
+        note.save()
+        self.assertEqual(note.revision, revision + 1)
+        local.put(note.pk, revision, '<p>Body</p>')
+        self.assertEqual(str(self.read().body), '<p>Edited</p>')
+
+        note.title = 'Renamed'
+        note.save(update_fields=['title'])
+        self.assertEqual(note.revision, revision + 1)
+        note.save(update_fields=['body'])
+        self.assertEqual(
+            ClassNote.objects.get(pk=note.pk).revision,
+            revision + 2,
+            )
+
+    def test_database_cache_is_not_shared_level(self):
+        self.assertTrue(notecache.shared())
+        note = self.read()
+        key = notecache.cache_key(note.pk, note.revision)
+        self.assertEqual(cache.get(key), '<p>Body</p>')
+
+        cache.clear()
+        local.clear()
+        database_cache = {'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'scribnotes_cache',
+            }}
+        with override_settings(CACHES=database_cache):
+            self.assertFalse(notecache.shared())
+        with override_settings(NOTE_CACHE_SHARED=False):
+            with self.assertNumQueries(2):
+                self.read()
+            self.assertIsNone(cache.get(key))
+            with self.assertNumQueries(1):
+                self.assertEqual(str(self.read().body), '<p>Body</p>')
+
+    def test_unchanged_edit_form_keeps_revision(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            '/Notes/Courses/fall-2019/cs101/lecture-1/Edit/',
+            {'title': 'Lecture 1', 'body': '<p>Body</p>',
+             'course': self.course.pk},
+            )
+        self.assertRedirects(
+            response,
+            '/Notes/Courses/fall-2019/cs101/lecture-1/',
+            fetch_redirect_response=False,
+            )
+        self.assertEqual(self.read().revision, 0)
+
+
+class ReadNoteTests(LibraryTestCase):
+    """
+    Checks the read page's ETag and that kept notes are marked with their
+    reader for the service worker.
+    """
+    NOTES = (
+        ('Stacks', '<p>Stacks push and pop; a stack is LIFO.</p>'),
+        ('Deques', '<p>A deque is a stack: push and pop.</p>'),
+        )
+    URL = '/Notes/Courses/fall-2019/cs101/stacks/'
+
+    def setUp(self):
+        """
+        Signs the user in.
+        """
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def assertCurrent(self, etag):
+        """
+        Asserts that the page is still at etag.
+        """
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def assertChanged(self, etag):
+        """
+        Asserts that the page moved on from etag, returning its new ETag.
+        """
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response['ETag']
+
+    def test_unchanged_note_answers_304(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Offline-Note'], '1')
+        self.assertCurrent(response['ETag'])
+        self.assertChanged('"stale"')
+
+    def test_edits_change_etag(self):
+        etag = self.client.get(self.URL)['ETag']
+        note = ClassNote.objects.get(note_slug='stacks')
+        note.title = 'Renamed'
+        note.save(update_fields=['title'])
+        self.assertCurrent(etag)
+        note.body = '<p>Stacks are LIFO.</p>'
+        note.save()
+        self.assertChanged(etag)
+
+    def test_related_notes_change_etag(self):
+        etag = self.client.get(self.URL)['ETag']
+        tasks.refresh_related_notes(self.user.pk)
+        etag = self.assertChanged(etag)
+        self.assertCurrent(etag)
+        ClassNote.objects.get(note_slug='deques').delete()
+        tasks.refresh_related_notes(self.user.pk)
+        self.assertChanged(etag)
+
+    def test_kept_notes_name_their_reader(self):
+        response = self.client.get(self.URL)
+        value = offline_user(self.user)
+        self.assertEqual(response['X-Offline-User'], value)
+        self.assertEqual(response.cookies[OFFLINE_USER_COOKIE].value, value)
+        self.assertFalse(response.cookies[OFFLINE_USER_COOKIE]['httponly'])
+        response = self.client.get(self.URL)
+        self.assertNotIn(OFFLINE_USER_COOKIE, response.cookies)
+        other = get_user_model().objects.create_user('other')
+        self.assertNotEqual(offline_user(other), value)
+
+        response = self.client.get('/Logout/')
+        self.assertEqual(response.cookies[OFFLINE_USER_COOKIE].value, '')
+        self.assertEqual(self.client.cookies[OFFLINE_USER_COOKIE].value, '')
+
+
+class ArchiveTests(LibraryTestCase):
+    """
+    Checks that notes of old terms are archived and come back intact, however
+    they're opened or edited.
+    """
+    NOTES = ('Lecture 1',)
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Adds an old term with a course and a note.
+        """
+        super().setUpTestData()
+        cls.term = Term.objects.create(
+            user=cls.user,
+            school='School',
+            year=2010,
+            session='Fall 2010',
+            term_slug='fall-2010',
+            current=False,
+            )
+        course = cls.create_course('CS100', 'Old')
+        cls.create_note('Old Lecture', '<p>Old body</p>', course=course)
+        ClassNote.objects.filter(title='Old Lecture').update(
+            created_at=timezone.now().replace(year=2010),
+            )
+
+    def setUp(self):
+        """
+        Archives the old note.
+        """
+        super().setUp()
+        self.assertEqual(archive_notes(), 1)
+
+    def old_note(self, title='Old Lecture'):
+        """
+        Returns the old note, titled title, as stored.
+        """
+        return ClassNote.objects.get(title=title)
+
+    def test_archive_and_rehydrate(self):
+        note = self.old_note()
+        self.assertEqual((note.archived, note.body), (True, ''))
+        rehydrate(note)
+        self.assertEqual(note.body, '<p>Old body</p>')
+        note = self.old_note()
+        self.assertFalse(note.archived)
+        self.assertEqual(note.body, '<p>Old body</p>')
+        self.assertFalse(NoteArchive.objects.exists())
+
+    def test_saving_a_body_over_a_stub_replaces_the_archive(self):
+        note = self.old_note()
+        note.title = 'Renamed'
+        note.save()
+        self.assertTrue(self.old_note('Renamed').archived)
+        note.body = '<p>New body</p>'
+        note.save()
+        note = rehydrate(self.old_note('Renamed'))
+        self.assertEqual(note.body, '<p>New body</p>')
+        self.assertFalse(NoteArchive.objects.exists())
+
+    def test_admin_edits_the_archived_body(self):
+        admin = get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password',
+            )
+        self.client.force_login(admin)
+        note = self.old_note()
+        url = f'/admin/Notes/classnote/{note.pk}/change/'
+        response = self.client.get(url)
+        self.assertEqual(
+            response.context['adminform'].form['body'].value(),
+            '<p>Old body</p>',
+            )
+        response = self.client.post(url, {
+            'user': self.user.pk,
+            'title': 'Old Lecture',
+            'body': '<p>Edited in the admin</p>',
+            'revision': note.revision,
+            'note_slug': note.note_slug,
+            'course': note.course_id,
+            })
+        self.assertEqual(response.status_code, 302)
+        note = rehydrate(self.old_note())
+        self.assertEqual(note.body, '<p>Edited in the admin</p>')
+
+    def test_api_lists_archived_bodies(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/Web-API/classnotes/')
+        bodies = {note['title']: note['body']
+                  for note in response.json()['results']}
+        self.assertEqual(
+            bodies,
+            {'Lecture 1': '<p>Body</p>', 'Old Lecture': '<p>Old body</p>'},
+            )
+        self.assertTrue(self.old_note().archived)
+
+
+@override_settings(NOTE_BODY_COMPRESS_MIN_LENGTH=100)
+class CompressedBodyTests(LibraryTestCase):
+    """
+    Checks that note bodies are compressed in the database only, and that
+    everything reading them through the model sees plain HTML.
+    """
+    LONG = '<p>' + 'A long and repetitive body. ' * 20 + '</p>'
+    NOTES = (('Short', '<p>Short body</p>'), ('Long', LONG))
+
+    def stored(self, title):
+        """
+        Returns the body column of the note titled title as stored.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT body FROM "Notes_classnote" WHERE title = %s',
+                [title],
+                )
+            return cursor.fetchone()[0]
+
+    def test_round_trip(self):
+        self.assertEqual(self.stored('Short'), '<p>Short body</p>')
+        self.assertTrue(self.stored('Long').startswith(COMPRESSED))
+        self.assertLess(len(self.stored('Long')), len(self.LONG))
+        self.assertEqual(ClassNote.objects.get(title='Long').body, self.LONG)
+
+    def test_header_in_plain_bodies_is_escaped(self):
+        body = COMPRESSED + 'not compressed'
+        self.create_note('Tricky', body)
+        self.assertEqual(self.stored('Tricky'), '\x1fp' + body)
+        self.assertEqual(ClassNote.objects.get(title='Tricky').body, body)
+
+    def test_values_hand_out_compressed_text(self):
+        body, = ClassNote.objects.filter(title='Long').values_list(
+            'body', flat=True,
+            )
+        self.assertIsInstance(body, CompressedText)
+        self.assertEqual(str(body), self.LONG)
+        row = ClassNote.objects.filter(title='Short').values('body').get()
+        self.assertEqual(row['body'], '<p>Short body</p>')
+
+    def test_forms_serializers_and_admin_see_html(self):
+        note = ClassNote.objects.get(title='Long')
+        self.assertEqual(UpdateNoteForm(instance=note)['body'].value(),
+                         self.LONG)
+        request = RequestFactory().get('/Web-API/classnotes/')
+        request.user = self.user
+        serializer = ClassNoteSerializer(note, context={'request': request})
+        self.assertEqual(serializer.data['body'], self.LONG)
+        admin = get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password',
+            )
+        self.client.force_login(admin)
+        response = self.client.get(
+            f'/admin/Notes/classnote/{note.pk}/change/',
+            )
+        self.assertEqual(
+            response.context['adminform'].form['body'].value(),
+            self.LONG,
+            )
+
+    def test_migration_compresses_and_decompresses(self):
+        migration = importlib.import_module(
+            'Notes.migrations.0027_compressed_body',
+            )
+        editor = mock.Mock(
+            connection=connection,
+            quote_name=connection.ops.quote_name,
+            )
+        migration.decompress_bodies(global_apps, editor)
+        self.assertEqual(self.stored('Long'), self.LONG)
+        self.assertEqual(self.stored('Short'), '<p>Short body</p>')
+        migration.compress_bodies(global_apps, editor)
+        self.assertTrue(self.stored('Long').startswith(COMPRESSED))
+        self.assertEqual(self.stored('Short'), '<p>Short body</p>')
+        self.assertEqual(ClassNote.objects.get(title='Long').body, self.LONG)
+
+
+class TaskTests(LibraryTestCase):
+    """
+    Checks the background task queue: claiming, retries with backoff,
+    recovery of tasks abandoned by a worker, and the status page.
+    """
+
+    def setUp(self):
+        """
+        Registers a task that fails until told otherwise.
+        """
+        super().setUp()
+        self.calls = []
+        self.failing = True
+
+        def flaky(*args):
+            self.calls.append(args)
+            if self.failing:
+                raise ValueError('Flaky')
+
+        patcher = mock.patch.dict(tasks.TASKS, {'flaky': flaky})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_enqueue(self):
+        queued = tasks.enqueue('flaky', 1, 'a', user=self.user, delay=60)
+        self.assertEqual(queued.status, Task.PENDING)
+        self.assertEqual(json.loads(queued.arguments), [1, 'a'])
+        self.assertGreater(queued.run_at, timezone.now())
+        with self.assertRaises(KeyError):
+            tasks.enqueue('missing')
+
+    def test_claim_next_takes_due_tasks_once(self):
+        tasks.enqueue('flaky', delay=60)
+        due = tasks.enqueue('flaky')
+        claimed = tasks.claim_next()
+        self.assertEqual(claimed.pk, due.pk)
+        self.assertEqual((claimed.status, claimed.attempts), (Task.RUNNING, 1))
+        self.assertIsNone(tasks.claim_next())
+
+    def test_failed_tasks_back_off_then_fail(self):
+        queued = tasks.enqueue('flaky', 7)
+        for delay in (tasks.RETRY_DELAY, tasks.RETRY_DELAY * 2):
+            before = timezone.now()
+            queued = tasks.run_task(tasks.claim_next())
+            self.assertEqual(queued.status, Task.PENDING)
+            self.assertIn('ValueError: Flaky', queued.error)
+            waited = (queued.run_at - before).total_seconds()
+            self.assertAlmostEqual(waited, delay, delta=1)
+            self.assertIsNone(tasks.claim_next())
+            Task.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+
+        queued = tasks.run_task(tasks.claim_next())
+        self.assertEqual((queued.status, queued.attempts), (Task.FAILED, 3))
+        self.assertIsNotNone(queued.finished_at)
+        self.assertEqual(self.calls, [(7,)] * 3)
+
+    def test_tasks_succeed_after_retry(self):
+        queued = tasks.enqueue('flaky')
+        tasks.run_task(tasks.claim_next())
+        self.failing = False
+        Task.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        self.assertEqual(tasks.run_pending(), 1)
+        queued.refresh_from_db()
+        self.assertEqual(
+            (queued.status, queued.progress, queued.attempts),
+            (Task.DONE, 100, 2),
+            )
+
+    def test_stale_tasks_are_requeued_or_failed(self):
+        long_ago = timezone.now() - timedelta(
+            seconds=tasks.STALE_AFTER + 60,
+            )
+        abandoned, exhausted, running = [
+            tasks.enqueue('flaky', max_attempts=3) for number in range(3)
+            ]
+        Task.objects.filter(pk=abandoned.pk).update(
+            status=Task.RUNNING, attempts=1, started_at=long_ago,
+            )
+        Task.objects.filter(pk=exhausted.pk).update(
+            status=Task.RUNNING, attempts=3, started_at=long_ago,
+            )
+        Task.objects.filter(pk=running.pk).update(
+            status=Task.RUNNING, attempts=1, started_at=timezone.now(),
+            )
+        self.assertEqual(tasks.requeue_stale(), 2)
+        statuses = dict(Task.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {
+            abandoned.pk: Task.PENDING,
+            exhausted.pk: Task.FAILED,
+            running.pk: Task.RUNNING,
+            })
+
+    def test_in_process_worker_requeues_stale_tasks(self):
+        with mock.patch.object(tasks, '_wakeup'), \
+                mock.patch.object(tasks, 'close_old_connections'), \
+                mock.patch.object(tasks, 'connections'), \
+                mock.patch.object(tasks, 'requeue_stale') as requeue_stale, \
+                mock.patch.object(tasks, 'run_pending',
+                                  side_effect=[0, SystemExit]):
+            with self.assertRaises(SystemExit):
+                tasks._work()
+        self.assertEqual(requeue_stale.call_count, 2)
+
+    def test_task_pages(self):
+        queued = tasks.enqueue('flaky', user=self.user)
+        other = get_user_model().objects.create_user('other')
+        foreign = tasks.enqueue('flaky', user=other)
+        self.client.force_login(self.user)
+        response = self.client.get(
+            f'/Notes/Tasks/{queued.pk}/',
+            {'next': 'https://example.com/'},
+            )
+        self.assertEqual(response.context['next_url'], '/Dashboard/')
+        response = self.client.get(f'/Notes/Tasks/{queued.pk}/Status/')
+        self.assertEqual(
+            response.json(),
+            {'status': Task.PENDING, 'progress': 0, 'attempts': 0},
+            )
+        response = self.client.get(f'/Notes/Tasks/{foreign.pk}/Status/')
+        self.assertEqual(response.status_code, 404)
+
+
+class DeleteTests(LibraryTestCase):
+    """
+    Checks that deleting a term or course removes its notes in batches,
+    along with every row hanging off them, and clears references to them.
+    """
+    BODY = '<p>Binary trees keep their keys in order for quick lookups.</p>'
+
+    def setUp(self):
+        """
+        Creates a past term whose notes have revisions, an archive, vectors
+        and related notes, one of them being duplicated by a note that stays.
+        """
+        super().setUp()
+        self.old_term = Term.objects.create(
+            user=self.user,
+            school='School',
+            year=2018,
+            session='Spring 2018',
+            term_slug='spring-2018',
+            )
+        self.old_course = Course.objects.create(
+            user=self.user,
+            term=self.old_term,
+            course_code='CS200',
+            title='Trees',
+            course_slug='cs200',
+            )
+        self.doomed = [
+            self.create_note('Trees 1', self.BODY, self.old_course),
+            self.create_note('Trees 2', '<p>Heaps</p>', self.old_course),
+            self.create_note('Trees 3', '<p>Tries</p>', self.old_course),
+            ]
+        self.keeper = self.create_note('Keeper', self.BODY)
+
+        first = self.doomed[0]
+        record_revision(first)
+        previous = first.body
+        first.body = '<p>Binary trees, edited.</p>'
+        first.save()
+        record_revision(first, previous)
+        NoteArchive.objects.create(note=self.doomed[1], data=b'archived')
+        RelatedNote.objects.create(
+            note=self.keeper, related=first, rank=0, score=0.5,
+            )
+        RelatedNote.objects.create(
+            note=first, related=self.keeper, rank=0, score=0.5,
+            )
+        self.assertEqual(self.keeper.vector.duplicate_of_id, first.pk)
+
+    def delete(self, name, pk):
+        """
+        Runs the deletion task two notes at a time, returning the progress
+        it reported.
+        """
+        with mock.patch.object(tasks, 'DELETE_BATCH_SIZE', 2), \
+                mock.patch.object(tasks, 'report_progress') as progress:
+            tasks.TASKS[name](pk)
+        return [call[0] for call in progress.call_args_list]
+
+    def assertNotesGone(self):
+        """
+        Asserts that nothing refers to the deleted notes any more and that
+        the statistics only count the note that stayed.
+        """
+        ids = [note.pk for note in self.doomed]
+        self.assertFalse(ClassNote.objects.filter(pk__in=ids).exists())
+        for model, lookup in (
+                (NoteRevision, 'note__in'),
+                (NoteArchive, 'note__in'),
+                (NoteVector, 'note__in'),
+                (NoteVector, 'duplicate_of__in'),
+                (RelatedNote, 'note__in'),
+                (RelatedNote, 'related__in'),
+                ):
+            self.assertFalse(model.objects.filter(**{lookup: ids}).exists())
+        connection.check_constraints()
+
+        self.assertTrue(NoteVector.objects.filter(note=self.keeper).exists())
+        stats = CourseStats.objects.filter(user=self.user, note_count__gt=0)
+        self.assertEqual(
+            list(stats.values_list('course_id', 'note_count')),
+            [(self.course.pk, 1)],
+            )
+        weeks = WeeklyActivity.objects.filter(user=self.user)
+        self.assertEqual(sum(weeks.values_list('note_count', flat=True)), 1)
+
+    def test_delete_term(self):
+        progress = self.delete('delete_term', self.old_term.pk)
+        self.assertEqual(progress, [(2, 3), (3, 3)])
+        self.assertFalse(Term.objects.filter(pk=self.old_term.pk).exists())
+        self.assertFalse(
+            Course.objects.filter(pk=self.old_course.pk).exists()
+            )
+        self.assertNotesGone()
+
+    def test_delete_course(self):
+        progress = self.delete('delete_course', self.old_course.pk)
+        self.assertEqual(progress, [(2, 3), (3, 3)])
+        self.assertTrue(Term.objects.filter(pk=self.old_term.pk).exists())
+        self.assertFalse(
+            Course.objects.filter(pk=self.old_course.pk).exists()
+            )
+        self.assertNotesGone()
+
+
+class RevisionTests(LibraryTestCase):
+    """
+    Checks that every recorded revision of a note can be rebuilt, before
+    and after compaction, and that an edit racing an autosave is refused.
+    """
+    NOTES = ('Lecture 1',)
+    URL = '/Notes/Courses/fall-2019/cs101/lecture-1/Edit/'
+
+    def edit(self, count):
+        """
+        Saves count more versions of the note, recording a revision for each
+        as well as for the starting one, and returns every version's body.
+        """
+        note = ClassNote.objects.get(note_slug='lecture-1')
+        record_revision(note)
+        bodies = [note.body]
+        for number in range(1, count + 1):
+            previous = note.body
+            note.body = f'{previous}<p>Paragraph {number}</p>'
+            note.save()
+            record_revision(note, previous)
+            bodies.append(note.body)
+        self.assertEqual(note.revision, count)
+        return note, bodies
+
+    def test_deltas_rebuild_every_revision(self):
+        note, bodies = self.edit(25)
+        snapshots = note.revisions.filter(snapshot=True)
+        self.assertEqual(
+            list(snapshots.values_list('number', flat=True)),
+            [0, 10, 20],
+            )
+        for number, body in enumerate(bodies):
+            self.assertEqual(get_revision_body(note, number), body)
+        with self.assertNumQueries(2):
+            get_revision_body(note, 19)
+        self.assertIsNone(get_revision_body(note, 26))
+
+    def test_compaction_keeps_recent_revisions_readable(self):
+        note, bodies = self.edit(25)
+        self.assertEqual(compact_revisions(note, 7), 19)
+        self.assertTrue(note.revisions.get(number=19).snapshot)
+        for number in range(19, 26):
+            self.assertEqual(get_revision_body(note, number), bodies[number])
+        self.assertIsNone(get_revision_body(note, 18))
+
+        out = StringIO()
+        call_command('compact_revisions', keep=3, stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Deleted 4 revisions.')
+        self.assertEqual(get_revision_body(note, 23), bodies[23])
+
+    def test_edit_records_revision(self):
+        self.client.force_login(self.user)
+        response = self.client.post(self.URL, {
+            'title': 'Lecture 1',
+            'body': '<p>Edited</p>',
+            'course': self.course.pk,
+            })
+        self.assertEqual(response.status_code, 302)
+        note = ClassNote.objects.get(note_slug='lecture-1')
+        self.assertEqual(note.revision, 1)
+        self.assertEqual(get_revision_body(note, 1), '<p>Edited</p>')
+
+    def test_edit_racing_autosave_conflicts(self):
+        def autosave_first(note):
+            ClassNote.objects.filter(pk=note.pk).update(
+                body='<p>Autosaved</p>',
+                revision=F('revision') + 1,
+                )
+            NoteRevision.objects.create(
+                note=note,
+                number=note.revision + 1,
+                snapshot=True,
+                data=pack_snapshot('<p>Autosaved</p>'),
+                )
+            return note
+
+        self.client.force_login(self.user)
+        with mock.patch.object(views, 'rehydrate', side_effect=autosave_first):
+            response = self.client.post(self.URL, {
+                'title': 'Lecture 1',
+                'body': '<p>Edited</p>',
+                'course': self.course.pk,
+                })
+        self.assertEqual(response.status_code, 409)
+        self.assertContains(response, 'saved elsewhere', status_code=409)
+        self.assertContains(response, 'data-revision="1"', status_code=409)
+        note = ClassNote.objects.get(note_slug='lecture-1')
+        self.assertEqual(
+            (note.revision, str(note.body)),
+            (1, '<p>Autosaved</p>'),
+            )
+        self.assertEqual(get_revision_body(note, 1), '<p>Autosaved</p>')
+
+
+class StatsTests(LibraryTestCase):
+    """
+    Checks that the statistics kept up to date as notes change match the
+    ones rebuild_stats computes from scratch.
+    """
+
+    def setUp(self):
+        """
+        Adds a second course.
+        """
+        super().setUp()
+        self.other_course = self.create_course('CS102', 'Data Structures')
+
+    def stats(self):
+        """
+        Returns the user's course and weekly statistics.
+        """
+        courses = CourseStats.objects.filter(user=self.user).order_by(
+            'course_id',
+            ).values_list('course_id', 'note_count', 'word_count',
+                          'last_activity')
+        weeks = WeeklyActivity.objects.filter(user=self.user).values_list(
+            'week', 'note_count',
+            )
+        return list(courses), list(weeks)
+
+    def assertRebuilt(self):
+        """
+        Asserts that rebuilding the statistics changes nothing, other than
+        dropping rows that count nothing, and returns them.
+        """
+        kept = self.stats()
+        rebuild_stats(self.user.pk)
+        rebuilt = self.stats()
+        self.assertEqual(
+            ([row for row in kept[0] if row[1]],
+             [row for row in kept[1] if row[1]]),
+            rebuilt,
+            )
+        return rebuilt
+
+    def counts(self):
+        """
+        Returns each course's note and word counts.
+        """
+        courses, weeks = self.stats()
+        return {row[0]: row[1:3] for row in courses if row[1]}
+
+    def test_create(self):
+        weeks_ago = timezone.now() - timedelta(weeks=3)
+        with mock.patch('django.utils.timezone.now', return_value=weeks_ago):
+            self.create_note('Old', '<p>Three words here</p>')
+        self.create_note('Lecture 1', '<p>One two</p>')
+        self.create_note('Lecture 2', '<p>Data</p>', self.other_course)
+        ClassNote.objects.create(
+            user=self.user,
+            title='Loose',
+            body='<p>No course</p>',
+            note_slug='loose',
+            )
+        self.assertEqual(self.counts(), {
+            self.course.pk: (2, 5),
+            self.other_course.pk: (1, 1),
+            None: (1, 2),
+            })
+        courses, weeks = self.assertRebuilt()
+        self.assertEqual(
+            sorted(count for week, count in weeks),
+            [1, 3],
+            )
+
+    def test_edit(self):
+        note = self.create_note('Lecture 1', '<p>One two</p>')
+        before = self.stats()[0][0][3]
+        note.body = '<p>One two three four</p>'
+        note.save()
+        self.assertEqual(self.counts(), {self.course.pk: (1, 4)})
+        courses, weeks = self.assertRebuilt()
+        self.assertGreater(courses[0][3], before)
+
+    def test_move(self):
+        note = self.create_note('Lecture 1', '<p>One two</p>')
+        self.create_note('Lecture 2', '<p>Three</p>')
+        note.course = self.other_course
+        note.save()
+        self.assertEqual(self.counts(), {
+            self.course.pk: (1, 1),
+            self.other_course.pk: (1, 2),
+            })
+        self.assertRebuilt()
+
+    def test_delete(self):
+        note = self.create_note('Lecture 1', '<p>One two</p>')
+        self.create_note('Lecture 2', '<p>Three</p>', self.other_course)
+        note.delete()
+        self.assertEqual(self.counts(), {self.other_course.pk: (1, 1)})
+        courses, weeks = self.assertRebuilt()
+        self.assertEqual(weeks[0][1], 1)
+
+
+class QueryCountTests(LibraryTestCase):
+    """
+    Pins the number of database queries each route makes, so that repeated
+    lookups of the same object within a request don't creep back in. Counts
+    include the session, user and context processor queries every page makes,
+    with the sidebar's navigation tree built from a cold cache.
+    """
+    NOTES = ('Lecture 1', 'Lecture 2')
+
+    def setUp(self):
+        """
+        Logs the test client in and empties the caches.
+        """
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def assertGetQueries(self, count, url, **extra):
+        """
+        Asserts that a GET request to url succeeds using count queries.
+        """
+        with self.assertNumQueries(count):
+            response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200)
+
+    def test_notes_of_course(self):
+        self.assertGetQueries(7, '/Notes/Courses/fall-2019/cs101/')
+
+    def test_notes_of_course_edit(self):
+        referer = 'http://testserver/Notes/Courses/fall-2019/cs101/'
+        self.assertGetQueries(
+            7,
+            '/Notes/Courses/fall-2019/cs101/Edit/',
+            HTTP_REFERER=referer,
+            )
+
+    def test_read_note(self):
+        self.assertGetQueries(9, '/Notes/Courses/fall-2019/cs101/lecture-1/')
+
+    def test_read_note_cached(self):
+        url = '/Notes/Courses/fall-2019/cs101/lecture-1/'
+        self.client.get(url)
+        self.assertGetQueries(3, url)
+
+    def test_update_note_get(self):
+        self.assertGetQueries(
+            7,
+            '/Notes/Courses/fall-2019/cs101/lecture-1/Edit/',
+            )
+
+    def test_update_note_post(self):
+        data = {
+            'title': 'Lecture 1',
+            'body': '<p>Edited</p>',
+            'course': self.course.pk,
+            }
+        with self.assertNumQueries(16):
+            response = self.client.post(
+                '/Notes/Courses/fall-2019/cs101/lecture-1/Edit/',
+                data,
+                )
+        self.assertEqual(response.status_code, 302)
+
+    def test_note_history(self):
+        note = ClassNote.objects.get(note_slug='lecture-1')
+        record_revision(note)
+        self.assertGetQueries(
+            7,
+            '/Notes/Courses/fall-2019/cs101/lecture-1/History/',
+            )
+
+    def test_note_update_options(self):
+        self.assertGetQueries(6, '/Notes/Courses/All-Notes/Edit/')
+
+    def test_create_note_get(self):
+        self.assertGetQueries(6, '/Notes/New/')
+        cache.clear()
+        self.assertGetQueries(6, '/Notes/New/cs101/')
+
+    def test_courses_of_term_get(self):
+        self.assertGetQueries(7, '/Notes/Courses/SingleCourse/fall-2019/')
+
+    def test_courses_of_term_post(self):
+        data = {'title': 'Algorithms', 'course_code': 'CS201'}
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                '/Notes/Courses/SingleCourse/fall-2019/',
+                data,
+                )
+        self.assertEqual(response.status_code, 302)
+
+    def test_courses_of_term_edit(self):
+        self.assertGetQueries(8, '/Notes/Course/Edit/fall-2019/')
+
+    def test_create_course_get(self):
+        self.assertGetQueries(7, '/Notes/Courses/')
+
+    def test_course_update_options(self):
+        self.assertGetQueries(6, '/Notes/Course/Edit/')
+
+    def test_create_term_get(self):
+        self.assertGetQueries(6, '/Notes/Term/')
+
+    def test_term_update_options(self):
+        self.assertGetQueries(7, '/Notes/Term/Edit/')
+
+    def test_update_term_get(self):
+        self.assertGetQueries(6, '/Notes/Term/Edit/Update/fall-2019/')
+
+    def test_task_pages(self):
+        queued = Task.objects.create(name='delete_term', user=self.user)
+        self.assertGetQueries(6, f'/Notes/Tasks/{queued.pk}/')
+        self.assertGetQueries(3, f'/Notes/Tasks/{queued.pk}/Status/')
+
+    def test_navigation(self):
+        self.assertGetQueries(5, '/Notes/Navigation/')
+        cache.clear()
+        self.assertGetQueries(5, '/Notes/Navigation/JSON/')
+
+    def test_update_course_get(self):
+        self.assertGetQueries(8, '/Notes/Course/Edit/Update/cs101/SF/')
+
+
+@override_settings(
+    CACHES=LOCAL_CACHE,
+    DATABASE_REPLICAS=list(REPLICA_ALIASES),
+    )
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Checks which connection serves reads: the local replicas, which mirror
+    the test database, in safe requests, and the primary otherwise or when
+    the replicas lag. A TransactionTestCase, since the router keeps reads on
+    the primary inside a transaction.
+    """
+    multi_db = True
+    REPLICAS = REPLICA_ALIASES
+
+    def setUp(self):
+        """
+        Creates a note and forgets the replicas' health.
+        """
+        cache.clear()
+        routers._health.clear()
+        self.addCleanup(routers.allow_replicas, False)
+        user = get_user_model().objects.create_user(
+            'student',
+            password='password',
+            )
+        self.note = ClassNote.objects.create(
+            user=user,
+            title='Lecture 1',
+            body='<p>Body</p>',
+            note_slug='lecture-1',
+            )
+
+    def served_by(self, read):
+        """
+        Runs read() and returns the aliases of the connections it queried.
+        """
+        contexts = {
+            alias: CaptureQueriesContext(connections[alias])
+            for alias in connections
+            }
+        with ExitStack() as stack:
+            for context in contexts.values():
+                stack.enter_context(context)
+            read()
+        return {alias for alias, context in contexts.items() if len(context)}
+
+    def read_note(self):
+        """
+        Reads the note back, checking that the database had it.
+        """
+        note = ClassNote.objects.get(pk=self.note.pk)
+        self.assertEqual(note.title, 'Lecture 1')
+        return note
+
+    def test_reads_use_primary_outside_safe_requests(self):
+        self.assertEqual(self.served_by(self.read_note), {'default'})
+
+    def test_reads_use_replica_in_safe_requests(self):
+        routers.allow_replicas(True)
+        served = set()
+        for attempt in range(20):
+            served |= self.served_by(self.read_note)
+        self.assertEqual(served, set(self.REPLICAS))
+        self.assertIn(self.read_note()._state.db, self.REPLICAS)
+
+        tasks = lambda: list(Task.objects.all())
+        self.assertEqual(self.served_by(tasks), {'default'})
+        update = lambda: ClassNote.objects.filter(pk=self.note.pk).update(
+            title='Lecture 2',
+            )
+        self.assertEqual(self.served_by(update), {'default'})
+
+    def test_lagging_replica_is_skipped(self):
+        lags = {'local_replica1': 60, 'local_replica2': 0}
+        routers.allow_replicas(True)
+        with mock.patch.object(routers, 'replica_lag', side_effect=lags.get):
+            served = set()
+            for attempt in range(20):
+                served |= self.served_by(self.read_note)
+            self.assertEqual(routers.replica_lag.call_count, 2)
+        self.assertEqual(served, {'local_replica2'})
+
+    def test_lagging_replicas_fall_back_to_primary(self):
+        routers.allow_replicas(True)
+        with mock.patch.object(routers, 'replica_lag', return_value=60):
+            self.assertEqual(self.served_by(self.read_note), {'default'})
+
+    def test_unreachable_replicas_fall_back_to_primary(self):
+        routers.allow_replicas(True)
+        error = DatabaseError('could not connect')
+        with mock.patch.object(routers, 'replica_lag', side_effect=error):
+            self.assertEqual(self.served_by(self.read_note), {'default'})
+
+    def test_workers_connect_to_databases_in_use(self):
+        with mock.patch.object(
+                BaseDatabaseWrapper, 'ensure_connection', autospec=True,
+                ) as ensure_connection:
+            connect_databases()
+            with override_settings(DATABASE_REPLICAS=[]):
+                connect_databases()
+        self.assertEqual(
+            [call[0][0].alias for call in ensure_connection.call_args_list],
+            ['default', 'local_replica1', 'local_replica2', 'default'],
+            )
+
+    def test_writes_pin_client_to_primary(self):
+        served = []
+
+        def view(request):
+            served.append(self.served_by(self.read_note))
+            return HttpResponse()
+
+        middleware = ReplicaMiddleware(view)
+        factory = RequestFactory()
+        response = middleware(factory.post('/'))
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        request = factory.get('/')
+        request.COOKIES[STICKY_COOKIE] = '1'
+        middleware(request)
+        middleware(factory.get('/'))
+        self.assertEqual(served[:2], [{'default'}, {'default'}])
+        self.assertEqual(len(served[2]), 1)
+        self.assertLessEqual(served[2], set(self.REPLICAS))
+
+
+@override_settings(STATICFILES_STORAGE=STATIC_STORAGE, CACHES=LOCAL_CACHE)
+class ProfilingTests(TestCase):
+    """
+    Checks that only a staff user's own, unexpired, untampered profiling
+    token gets a request profiled, and that reports stay with their owner.
+    """
+    URL = '/Notes/Navigation/'
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Creates two staff users and a student.
+        """
+        User = get_user_model()
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+        cls.other_staff = User.objects.create_user('other', is_staff=True)
+        cls.student = User.objects.create_user('student')
+
+    def setUp(self):
+        """
+        Empties the cache.
+        """
+        cache.clear()
+
+    def profiled(self, user, token, header=False):
+        """
+        Makes a request as user carrying token, returning the URL of its
+        report, or None if it wasn't profiled.
+        """
+        self.client.force_login(user)
+        if header:
+            response = self.client.get(self.URL, HTTP_X_PROFILE=token)
+        else:
+            response = self.client.get(self.URL, {PROFILE_PARAM: token})
+        self.assertEqual(response.status_code, 200)
+        return response.get('X-Profile-Report')
+
+    def test_staff_token_profiles_request(self):
+        token = make_token(self.staff)
+        report_url = self.profiled(self.staff, token)
+        self.assertIsNotNone(report_url)
+        self.assertIsNotNone(self.profiled(self.staff, token, header=True))
+
+        response = self.client.get(report_url)
+        self.assertEqual(response.status_code, 200)
+        report = response.context['report']
+        self.assertEqual(
+            (report['user_id'], report['path'], report['status']),
+            (self.staff.pk, self.URL + '?' + urlencode({'profile': token}),
+             200),
+            )
+        self.assertTrue(report['queries'])
+        response = self.client.get(report_url + 'Download/')
+        self.assertEqual(response.content, report['profile'])
+
+        response = self.client.get('/Profiles/')
+        self.assertEqual(len(response.context['reports']), 2)
+        self.assertTrue(
+            token_is_valid(response.context['token'], self.staff),
+            )
+
+    def test_requests_without_token_are_not_profiled(self):
+        self.assertIsNone(self.profiled(self.staff, ''))
+
+    def test_non_staff_are_ignored(self):
+        self.assertIsNone(self.profiled(self.student, make_token(self.student)))
+        self.assertIsNone(self.profiled(self.student, make_token(self.staff)))
+        response = self.client.get('/Profiles/')
+        self.assertEqual(response.status_code, 302)
+
+    def test_tokens_are_tied_to_their_user(self):
+        token = make_token(self.staff)
+        self.assertIsNone(self.profiled(self.other_staff, token))
+
+    def test_forged_tokens_are_ignored(self):
+        token = make_token(self.staff)
+        value, signature = token.split(':', 1)
+        forged = f'{self.other_staff.pk}:{signature}'
+        self.assertIsNone(self.profiled(self.other_staff, forged))
+        unsalted = signing.TimestampSigner().sign(str(self.staff.pk))
+        self.assertIsNone(self.profiled(self.staff, unsalted))
+        self.assertIsNone(self.profiled(self.staff, 'not-a-token'))
+
+    def test_expired_tokens_are_ignored(self):
+        issued = time.time() - settings.PROFILING_TOKEN_MAX_AGE - 60
+        with mock.patch('time.time', return_value=issued):
+            token = make_token(self.staff)
+        self.assertIsNone(self.profiled(self.staff, token))
+        with override_settings(PROFILING_TOKEN_MAX_AGE=None):
+            self.assertIsNotNone(self.profiled(self.staff, token))
+
+    def test_demoted_staff_are_ignored(self):
+        token = make_token(self.staff)
+        demoted = get_user_model().objects.get(pk=self.staff.pk)
+        demoted.is_staff = False
+        demoted.save()
+        self.assertIsNone(self.profiled(demoted, token))
+
+    def test_reports_stay_with_their_owner(self):
+        report_url = self.profiled(self.staff, make_token(self.staff))
+        self.client.force_login(self.other_staff)
+        self.assertEqual(self.client.get(report_url).status_code, 404)
+        response = self.client.get(report_url + 'Download/')
+        self.assertEqual(response.status_code, 404)
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(report_url).status_code, 302)
+
+
+@override_settings(CACHES=LOCAL_CACHE, RATE_LIMITS={'test': '3/minute'})
+class ThrottlingTests(SimpleTestCase):
+    """
+    Checks that token buckets hold under concurrent requests and that limited
+    views answer 429 with Retry-After.
+    """
+
+    def setUp(self):
+        """
+        Empties the cache.
+        """
+        cache.clear()
+
+    def test_limited_view_answers_429(self):
+        view = throttling.rate_limit('test')(lambda request: HttpResponse())
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')
+        request.user = AnonymousUser()
+        statuses = [view(request).status_code for attempt in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        response = view(request)
+        self.assertEqual(int(response['Retry-After']), 20)
+        self.assertIsNone(throttling.get_rate('unlimited'))
+
+    def test_concurrent_requests_share_one_bucket(self):
+        get = LocMemCache.get
+
+        def slow_get(cache, *args, **kwargs):
+            value = get(cache, *args, **kwargs)
+            time.sleep(0.005)
+            return value
+
+        with mock.patch.object(LocMemCache, 'get', slow_get), \
+                ThreadPoolExecutor(max_workers=8) as pool:
+            waits = list(pool.map(
+                lambda attempt: throttling.take_token('test', 'ip:10.0.0.2'),
+                range(16),
+                ))
+        self.assertEqual(waits.count(0), 3)
+
+    def test_locked_bucket_refuses(self):
+        cache.add('throttle:test:ip:10.0.0.3:lock', True)
+        with mock.patch.object(throttling, 'LOCK_WAIT', 0):
+            self.assertEqual(throttling.take_token('test', 'ip:10.0.0.3'), 20)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CoalescingTests(SimpleTestCase):
+    """
+    Checks that concurrent identical computations run once.
+    """
+
+    def setUp(self):
+        """
+        Empties the cache.
+        """
+        cache.clear()
+
+    def test_concurrent_callers_share_one_computation(self):
+        calls = []
+        started = threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            threading.Event().wait(0.2)
+            return 'result'
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            first = pool.submit(coalesce, 'key', compute)
+            started.wait()
+            others = [pool.submit(coalesce, 'key', compute) for i in range(3)]
+            results = [future.result() for future in [first] + others]
+        self.assertEqual(results, ['result'] * 4)
+        self.assertEqual(len(calls), 1)
+
+    def test_waiters_compute_when_lock_is_stuck(self):
+        cache.add('coalesce:lock:key', True)
+        self.assertEqual(coalesce('key', lambda: 'mine', timeout=0.1), 'mine')
+
+
+class QueryAuditTests(SimpleTestCase):
+    """
+    Checks the query audit the test runner applies to test client requests.
+    """
+
+    def query(self, sql):
+        """
+        Builds a recorded query as QueryRecorder would.
+        """
+        return {'sql': sql, 'duration': 0.1, 'origin': 'notes_list.html:84'}
+
+    def test_shape_ignores_parameter_lists(self):
+        self.assertEqual(
+            shape('SELECT *\n  FROM t WHERE id IN (%s, %s, %s)'),
+            shape('SELECT * FROM t WHERE id IN (%s)'),
+            )
+
+    def test_repeated_queries_warn(self):
+        audit = QueryAudit()
+        queries = [self.query('SELECT * FROM course WHERE id = %s')] * 3
+        with self.assertWarns(UserWarning):
+            audit.record('Notes:notes_list', 'GET /', queries)
+        self.assertEqual(len(audit.suspects), 1)
+
+    def test_budget_exceeded_fails(self):
+        audit = QueryAudit()
+        audit.budgets = {'Notes:one_note': 1}
+        queries = [self.query('SELECT 1'), self.query('SELECT 2')]
+        with self.assertRaises(QueryBudgetExceeded):
+            audit.record('Notes:one_note', 'GET /', queries)
+
+
+class LazyURLResolverTests(SimpleTestCase):
+    """
+    Checks that lazily included URLconfs load only when their URLs are used.
+    """
+
+    def setUp(self):
+        """
+        Builds a root resolver with one plain and one lazy URLconf.
+        """
+        self.lazy = lazy_include(
+            'API/',
+            [path('items/', HttpResponse, name='items')],
+            'lazy',
+            )
+        self.root = URLResolver(
+            RegexPattern(r'^/'),
+            [path('home/', HttpResponse, name='home'), self.lazy],
+            )
+
+    def test_other_urls_leave_urlconf_unloaded(self):
+        self.assertEqual(self.root.reverse('home'), 'home/')
+        self.root.resolve('/home/')
+        self.assertFalse(self.lazy.loaded)
+
+    def test_resolving_loads_urlconf(self):
+        self.root.resolve('/API/items/')
+        self.assertTrue(self.lazy.loaded)
+
+    def test_reversing_loads_urlconf(self):
+        prefix, resolver = self.root.namespace_dict['lazy']
+        self.assertFalse(self.lazy.loaded)
+        self.assertEqual(resolver.reverse('items'), 'items/')
+        self.assertTrue(self.lazy.loaded)
+
+
+class StreamingListTests(LibraryTestCase):
+    """
+    Checks that long note lists are streamed, in chunks, with the same content
+    they render with otherwise.
+    """
+    NOTES = tuple(f'Lecture {number}' for number in range(5))
+
+    def setUp(self):
+        """
+        Logs the test client in and empties the caches.
+        """
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def get(self, url, threshold):
+        """
+        Requests url with lists streamed past threshold rows, two at a time,
+        returning whether it was streamed and the content.
+        """
+        with mock.patch.object(mixins, 'STREAMING_LIST_THRESHOLD', threshold), \
+                mock.patch.object(mixins, 'STREAMING_LIST_CHUNK_SIZE', 2):
+            response = self.client.get(url)
+            if response.streaming:
+                return True, b''.join(response.streaming_content)
+            return False, response.content
+
+    def test_long_lists_stream(self):
+        for url in ('/Notes/Courses/All-Notes/', '/Dashboard/'):
+            self.assertEqual(
+                self.get(url, 2),
+                (True, self.get(url, 5)[1]),
+                )
+            self.assertFalse(self.get(url, 5)[0])
+
+
+class NavigationTests(LibraryTestCase):
+    """
+    Checks that the cached navigation tree, sidebar and search index are
+    rebuilt whenever one of the user's terms, courses or notes changes.
+    """
+    NOTES = ('Lecture 1',)
+
+    def setUp(self):
+        """
+        Logs the test client in.
+        """
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def tree(self):
+        """
+        Returns the titles in the navigation tree served to the user, as a
+        dict of term session to course code to note titles.
+        """
+        terms = self.client.get('/Notes/Navigation/JSON/').json()['terms']
+        return {
+            term['session']: {
+                course['course_code']: [note['title']
+                                        for note in course['notes']]
+                for course in term['courses']
+                }
+            for term in terms
+            }
+
+    def assertTree(self, expected, gone=()):
+        """
+        Asserts that the navigation tree shows the expected titles, and that
+        the sidebar and search index show them but none of the gone ones,
+        then checks that all three are cached again.
+        """
+        self.assertEqual(self.tree(), expected)
+        sidebar = str(render_sidebar(self.user))
+        notes = [
+            title
+            for courses in expected.values()
+            for titles in courses.values()
+            for title in titles
+            ]
+        for title in notes:
+            self.assertIn(title, sidebar)
+            self.assertIn(title, self.search(title))
+        for title in gone:
+            self.assertNotIn(title, sidebar)
+            self.assertNotIn(title, self.search(title))
+        with self.assertNumQueries(0):
+            get_navigation_tree(self.user)
+            render_sidebar(self.user)
+            get_search_index(self.user)
+
+    def search(self, query):
+        """
+        Returns the titles of the user's notes matching query.
+        """
+        matches, facets = search_notes(self.user, query)
+        return [match['title'] for score, match in matches]
+
+    def test_tree_is_cached(self):
+        self.assertTree({'Fall 2019': {'CS101': ['Lecture 1']}})
+        ClassNote.objects.update(body='<p>Body edits leave the tree</p>')
+        self.assertEqual(self.tree(), {'Fall 2019': {'CS101': ['Lecture 1']}})
+
+    def test_notes_change_tree(self):
+        self.assertTree({'Fall 2019': {'CS101': ['Lecture 1']}})
+        note = self.create_note('Lecture 2')
+        self.assertTree({'Fall 2019': {'CS101': ['Lecture 2', 'Lecture 1']}})
+        note.title = 'Recursion'
+        note.save()
+        self.assertTree(
+            {'Fall 2019': {'CS101': ['Recursion', 'Lecture 1']}},
+            gone=['Lecture 2'],
+            )
+        note.delete()
+        self.assertTree(
+            {'Fall 2019': {'CS101': ['Lecture 1']}},
+            gone=['Recursion'],
+            )
+
+    def test_courses_change_tree(self):
+        self.assertTree({'Fall 2019': {'CS101': ['Lecture 1']}})
+        course = self.create_course('CS102', 'Data Structures')
+        self.assertTree({'Fall 2019': {'CS101': ['Lecture 1'], 'CS102': []}})
+        course.course_code = 'CS202'
+        course.save()
+        self.assertTree({'Fall 2019': {'CS101': ['Lecture 1'], 'CS202': []}})
+        tasks.delete_course(self.course.pk)
+        self.assertTree({'Fall 2019': {'CS202': []}}, gone=['Lecture 1'])
+
+    def test_terms_change_tree(self):
+        self.assertTree({'Fall 2019': {'CS101': ['Lecture 1']}})
+        term = Term.objects.create(
+            user=self.user,
+            school='School',
+            year=2020,
+            session='Spring 2020',
+            term_slug='spring-2020',
+            )
+        self.assertTree({
+            'Spring 2020': {},
+            'Fall 2019': {'CS101': ['Lecture 1']},
+            })
+        term.session = 'Summer 2020'
+        term.save()
+        self.assertTree({
+            'Summer 2020': {},
+            'Fall 2019': {'CS101': ['Lecture 1']},
+            })
+        tasks.delete_term(self.term.pk)
+        self.assertTree({'Summer 2020': {}}, gone=['Lecture 1'])
+
+    def test_other_users_changes_keep_tree(self):
+        self.assertTree({'Fall 2019': {'CS101': ['Lecture 1']}})
+        other = get_user_model().objects.create_user('other')
+        Term.objects.create(user=other, school='School', session='Other')
+        with self.assertNumQueries(0):
+            get_navigation_tree(self.user)
+
+
+class SearchTests(LibraryTestCase):
+    """
+    Checks that searches tolerate typos and rank the closest titles first.
+    """
+    NOTES = ('Lecture 3', 'Lecture 13', 'Recursion')
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Adds a second course with a note.
+        """
+        super().setUpTestData()
+        course = cls.create_course('MATH200', 'Linear Algebra')
+        cls.create_note('Eigenvalues', course=course)
+
+    def slugs(self, query, **scope):
+        matches, facets = search_notes(self.user, query, scope)
+        return [match['slug'] for score, match in matches]
+
+    def facets(self, query, **scope):
+        matches, facets = search_notes(self.user, query, scope)
+        return {
+            name: [(facet['slug'], facet['count'], facet['selected'])
+                   for facet in values]
+            for name, values in facets.items()
+            }
+
+    def test_trigrams_match_pg_trgm(self):
+        self.assertEqual(normalize(' Lecture-3, Élan '), 'lecture 3 elan')
+        self.assertEqual(trigrams('cat'), {'  c', ' ca', 'cat', 'at '})
+        self.assertEqual(similarity(trigrams('cat'), trigrams('cat')), 1.0)
+        self.assertEqual(similarity(trigrams('cat'), set()), 0.0)
+
+    def test_typos_are_tolerated(self):
+        self.assertEqual(self.slugs('lectre 3')[0], 'lecture-3')
+        self.assertEqual(self.slugs('recurson'), ['recursion'])
+        self.assertEqual(self.slugs('linear algebar'), ['eigenvalues'])
+        self.assertEqual(self.slugs('quantum'), [])
+
+    def test_substrings_of_titles_match(self):
+        self.assertEqual(self.slugs('lue'), ['eigenvalues'])
+        self.assertEqual(self.slugs('CURS'), ['recursion'])
+
+    def test_search_bar_redirects(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/Notes/Search/', {'title': 'recurson'})
+        self.assertRedirects(
+            response,
+            '/Notes/Courses/fall-2019/cs101/recursion/',
+            fetch_redirect_response=False,
+            )
+        response = self.client.get('/Notes/Search/', {'title': 'lectre'})
+        self.assertRedirects(
+            response,
+            '/Notes/Search/Results/?title=lectre',
+            fetch_redirect_response=False,
+            )
+
+    def test_long_searches_share_short_keys(self):
+        self.client.force_login(self.user)
+        shared = mock.patch.object(views, 'coalesce', wraps=views.coalesce)
+        with shared as coalesce:
+            self.client.get('/Notes/Search/', {'title': 'lecture ' * 100})
+        key = coalesce.call_args[0][0]
+        self.assertLessEqual(len(f'coalesce:result:{key}'), 100)
+
+    def test_scopes_and_facets(self):
+        self.assertEqual(self.facets('cs101 algebra'), {
+            'terms': [('fall-2019', 4, False)],
+            'courses': [('cs101', 3, False), ('math200', 1, False)],
+            })
+        self.assertEqual(self.slugs('lecture', course='math200'), [])
+        self.assertEqual(self.facets('lecture', term='current'), {
+            'terms': [('fall-2019', 2, True)],
+            'courses': [('cs101', 2, False)],
+            })
+        self.assertEqual(self.slugs('lecture', term='spring-2019'), [])
+        self.assertEqual(
+            self.slugs('lecture', start=date(2000, 1, 1)),
+            ['lecture-13', 'lecture-3'],
+            )
+        self.assertEqual(self.slugs('lecture', end=date(2000, 1, 1)), [])
+
+    def test_results_page_lists_facets(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            '/Notes/Search/Results/',
+            {'title': 'lecture 3', 'course': 'cs101'},
+            )
+        self.assertEqual(
+            [note.note_slug for note in response.context['notes']],
+            ['lecture-3', 'lecture-13'],
+            )
+        facet, = response.context['course_facets']
+        self.assertTrue(facet['selected'])
+        self.assertEqual(facet['url'], '/Notes/Search/Results/?title=lecture+3')
+
+
+class RelatedNotesTests(LibraryTestCase):
+    """
+    Checks that notes sharing distinctive words are suggested for each other.
+    """
+    BODIES = {
+        'Stacks': '<p>Stacks push and pop; a stack is LIFO.</p>',
+        'Queues': '<p>Queues enqueue and dequeue; a queue is FIFO.</p>',
+        'Deques': '<p>A deque is both a stack and a queue: push, pop, '
+                  'enqueue and dequeue.</p>',
+        'Proofs': '<p>Induction proves statements about numbers.</p>',
+        }
+    NOTES = tuple(BODIES.items())
+
+    def test_vectors(self):
+        self.assertEqual(
+            tokenize(plain_text('<p>The Stack&#39;s top &amp; 42 items</p>')),
+            ['stack', 'top', 'items'],
+            )
+        terms, counts = vectorize('pop pop push')
+        self.assertEqual(sorted(counts), [1, 2])
+        self.assertEqual(list(terms), sorted(terms))
+        self.assertEqual(
+            NoteVector.objects.filter(user=self.user).count(),
+            len(self.BODIES),
+            )
+
+    def test_nearest_neighbours(self):
+        vectors = {
+            number: vectorize(plain_text(body))
+            for number, body in enumerate(self.BODIES.values())
+            }
+        neighbours = nearest_neighbours(vectors, count=1, min_score=0.1)
+        self.assertEqual(neighbours[0][0][1], 2)
+        self.assertEqual(neighbours[1][0][1], 2)
+        self.assertNotIn(3, neighbours)
+
+    def test_read_page_suggests_related_notes(self):
+        tasks.refresh_related_notes(self.user.pk)
+        self.client.force_login(self.user)
+        response = self.client.get('/Notes/Courses/fall-2019/cs101/deques/')
+        self.assertCountEqual(
+            [related['title']
+             for related in response.context['related_notes']['notes']],
+            ['Queues', 'Stacks'],
+            )
+        ClassNote.objects.get(note_slug='queues').delete()
+        tasks.refresh_related_notes(self.user.pk)
+        response = self.client.get('/Notes/Courses/fall-2019/cs101/deques/')
+        self.assertEqual(
+            [related['title']
+             for related in response.context['related_notes']['notes']],
+            ['Stacks'],
+            )
+
+
+class DuplicateTests(LibraryTestCase):
+    """
+    Checks that near-duplicate bodies are fingerprinted alike and flagged.
+    """
+    BODY = (
+        '<p>A binary search tree keeps smaller keys in the left subtree and '
+        'larger keys in the right subtree, so lookups, insertions and '
+        'deletions take time proportional to the height of the tree, which '
+        'stays logarithmic while the tree is balanced.</p>'
+        )
+    NOTES = (
+        ('Trees', BODY),
+        ('Trees-Copy', BODY.replace('balanced.', 'balanced!!')),
+        ('Proofs', '<p>Induction proves a statement for every natural number '
+                   'by proving it for zero and showing that it holds for the '
+                   'successor of any number it holds for.</p>'),
+        )
+
+    def test_simhash(self):
+        text = plain_text(self.BODY)
+        edited = 'Note: ' + text
+        self.assertLessEqual(distance(simhash(text), simhash(edited)), 3)
+        self.assertGreater(
+            distance(simhash(text), simhash(text[::-1])),
+            3,
+            )
+        self.assertIsNone(simhash('Too short to tell.'))
+
+    def test_copies_are_flagged_on_save(self):
+        original = ClassNote.objects.get(note_slug='trees')
+        vectors = NoteVector.objects.filter(user=self.user)
+        self.assertEqual(
+            dict(vectors.values_list('note__note_slug', 'duplicate_of')),
+            {'trees': None, 'trees-copy': original.pk, 'proofs': None},
+            )
+        self.client.force_login(self.user)
+        response = self.client.get('/Notes/Courses/fall-2019/cs101/trees-copy/')
+        self.assertEqual(
+            response.context['related_notes']['duplicate_of']['title'],
+            'Trees',
+            )
+
+    def test_cluster_fingerprints(self):
+        fingerprints = {
+            1: 0,
+            2: 0b111,
+            3: 0b111 << 4,
+            4: (1 << 64) - 1,
+            5: (1 << 64) - 1,
+            }
+        self.assertEqual(
+            sorted(cluster_fingerprints(fingerprints)),
+            [[1, 2, 3], [4, 5]],
+            )
+        self.assertEqual(cluster_fingerprints(fingerprints, 0), [[4, 5]])
+
+    def test_find_originals(self):
+        fingerprints = {4: 0b1111, 1: (1 << 64) - 1, 2: 0b1, 3: 0b11}
+        self.assertEqual(
+            find_originals(fingerprints),
+            {1: None, 2: None, 3: 2, 4: 2},
+            )
+
+    def test_rebuild_flags_duplicates_anew(self):
+        trees, copy, proofs = ClassNote.objects.order_by('pk')
+        vectors = NoteVector.objects.filter(user=self.user)
+        vectors.update(fingerprint=None, duplicate_of=None)
+        vectors.filter(note=proofs).update(duplicate_of=trees)
+        rebuild_vectors(ClassNote.objects.all())
+        self.assertEqual(
+            dict(vectors.values_list('note_id', 'duplicate_of')),
+            {trees.pk: None, copy.pk: trees.pk, proofs.pk: None},
+            )
+
+    def test_report_skips_deleted_notes(self):
+        trees, copy, proofs = ClassNote.objects.order_by('pk')
+        output = StringIO()
+        command = find_duplicates.Command(stdout=output)
+        command.report([(self.user.pk, [trees.pk, copy.pk + 100])])
+        self.assertEqual(output.getvalue(), '')
+
+    def test_find_duplicates_command(self):
+        output = StringIO()
+        call_command('find_duplicates', rebuild=True, stdout=output)
+        self.assertIn('Trees-Copy (CS101)', output.getvalue())
+        self.assertIn('1 duplicate clusters holding 2 notes', output.getvalue())
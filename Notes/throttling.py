@@ -0,0 +1,132 @@
+"""
+Per-user rate limiting with token buckets kept in the cache, so limits hold
+across worker processes. Limits are configured per scope in the RATE_LIMITS
+setting as 'requests/period', e.g. {'search': '30/minute'}; a scope that is
+not configured is not limited.
+
+A bucket is read and written back under a lock taken with cache.add(),
+which is atomic on every backend, unlike cache.incr() on the database cache;
+without it, concurrent requests would all see the same tokens and a burst
+would get through. A client whose bucket stays locked for LOCK_WAIT seconds
+is refused as if its bucket were empty.
+"""
+import math
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 60 * 60, 'day': 60 * 60 * 24}
+LOCK_TIMEOUT = 5
+LOCK_WAIT = 0.5
+LOCK_POLL = 0.01
+
+
+def parse_rate(rate):
+    """
+    Turns a 'requests/period' string into a (capacity, seconds) tuple.
+    """
+    requests, period = rate.split('/')
+    return int(requests), PERIODS[period.rstrip('s')]
+
+
+def get_rate(scope):
+    """
+    Returns the (capacity, seconds) limit for a scope, or None if the scope
+    isn't limited.
+    """
+    rate = getattr(settings, 'RATE_LIMITS', {}).get(scope)
+    return parse_rate(rate) if rate else None
+
+
+def client_ident(request):
+    """
+    Identifies who a request counts against: the user if logged in, otherwise
+    the client's address.
+    """
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f'ip:{request.META.get("REMOTE_ADDR")}'
+
+
+def take_token(scope, ident):
+    """
+    Takes one token from the client's bucket for a scope. Buckets hold up to
+    capacity tokens and refill continuously at capacity per period. Returns 0
+    if a token was available, otherwise the number of seconds until one is.
+    """
+    rate = get_rate(scope)
+    if rate is None:
+        return 0
+
+    capacity, seconds = rate
+    key = f'throttle:{scope}:{ident}'
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + LOCK_WAIT
+    while not cache.add(lock_key, True, LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            return seconds / capacity
+        time.sleep(LOCK_POLL)
+
+    try:
+        now = time.time()
+        tokens, updated = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * capacity / seconds)
+
+        if tokens >= 1:
+            cache.set(key, (tokens - 1, now), seconds)
+            return 0
+
+        cache.set(key, (tokens, now), seconds)
+        return (1 - tokens) * seconds / capacity
+    finally:
+        cache.delete(lock_key)
+
+
+def too_many_requests(wait):
+    """
+    Produces a 429 response telling the client how long to wait.
+    """
+    response = HttpResponse('Too many requests.', status=429)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def rate_limit(scope):
+    """
+    Decorator that limits a function view to the rate configured for scope.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            wait = take_token(scope, client_ident(request))
+            if wait:
+                return too_many_requests(wait)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TokenBucketThrottle():
+    """
+    Django REST framework throttle backed by the same token buckets. Views are
+    limited by their throttle_scope attribute, falling back to 'api'. It
+    implements BaseThrottle's interface without subclassing it, so that
+    importing this module for rate_limit doesn't import the framework.
+    """
+
+    def allow_request(self, request, view):
+        """
+        Takes a token for the view's scope, remembering the wait on failure.
+        """
+        scope = getattr(view, 'throttle_scope', 'api')
+        self.wait_time = take_token(scope, client_ident(request))
+        return not self.wait_time
+
+    def wait(self):
+        """
+        Seconds until the next request would be allowed; used by the framework
+        for the Retry-After header.
+        """
+        return self.wait_time
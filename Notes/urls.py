@@ -7,7 +7,10 @@ from .views import (CreateTermView, CreateCourseView, CoursesOfTermView,
                     UpdateOptionsCourse, DeleteCourseView,
                     CoursesOfTermEditView, UpdateCourseView, NoteUpdateOptions,
                     NotesOfCourseUpdateOptions,DeleteNoteView, UpdateNoteView,
-                    SearchBar, NotesListSearchQuery, )
+                    AutosaveNoteView, NoteHistoryView, SearchBar,
+                    NotesListSearchQuery, TaskView, TaskStatusView,
+                    NavigationTreeView, NavigationTreeJSON,
+                    NoteCacheMetricsView, )
 
 app_name = 'Notes'
 
@@ -18,7 +21,7 @@ urlpatterns = [
          name = 'notes_list',
         ),
     path(
-        'Courses/<notes_query>/',
+        'Search/Results/',
         login_required(NotesListSearchQuery.as_view()),
         name = 'notes_search'
         ),
@@ -67,6 +70,21 @@ urlpatterns = [
         login_required(UpdateNoteView.as_view()),
         name = 'update_note',
         ),
+    path(
+        'Courses/<slug>/<course_id>/<note_slug>/Autosave/',
+        login_required(AutosaveNoteView.as_view()),
+        name = 'autosave_note',
+        ),
+    path(
+        'Courses/<slug>/<course_id>/<note_slug>/History/',
+        login_required(NoteHistoryView.as_view()),
+        name = 'note_history',
+        ),
+    path(
+        'Courses/<slug>/<course_id>/<note_slug>/History/<int:revision>/',
+        login_required(NoteHistoryView.as_view()),
+        name = 'note_revision',
+        ),
     path(
         'Courses/',
         login_required(CreateCourseView.as_view()),
@@ -117,4 +135,58 @@ urlpatterns = [
         SearchBar,
         name = 'searchbar'
         ),
+    path(
+        'Tasks/<int:pk>/',
+        login_required(TaskView.as_view()),
+        name = 'task',
+        ),
+    path(
+        'Tasks/<int:pk>/Status/',
+        login_required(TaskStatusView.as_view()),
+        name = 'task_status',
+        ),
+    path(
+        'Navigation/',
+        login_required(NavigationTreeView.as_view()),
+        name = 'navigation',
+        ),
+    path(
+        'Navigation/JSON/',
+        login_required(NavigationTreeJSON.as_view()),
+        name = 'navigation_json',
+        ),
+    path(
+        'Cache/Metrics/',
+        NoteCacheMetricsView.as_view(),
+        name = 'note_cache_metrics',
+        ),
 ]
+
+# Most queries a single request to each route may make, counting the session,
+# user and sidebar queries every page makes with a cold cache. Enforced on
+# test client requests by Notes.testing.QueryAuditRunner.
+query_budgets = {
+    'notes_list': 6,
+    'notes_search': 8,
+    'note_edit': 6,
+    'course_term': 7,
+    'course_of_term_edit': 8,
+    'course_update': 8,
+    'notes_of_course': 7,
+    'notes_of_course_edit': 7,
+    'one_note': 9,
+    'update_note': 14,
+    'note_history': 7,
+    'course': 7,
+    'course_edit': 6,
+    'notes': 6,
+    'note_of_course_create': 6,
+    'term': 6,
+    'term_edit': 7,
+    'term_update': 6,
+    'searchbar': 5,
+    'task': 6,
+    'task_status': 3,
+    'navigation': 5,
+    'navigation_json': 5,
+}
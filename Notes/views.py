@@ -1,107 +1,107 @@
-from django.http import HttpResponse, HttpResponseRedirect
+import difflib
+import hashlib
+import json
+import zlib
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import IntegrityError, transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.http import (Http404, HttpResponse, HttpResponseRedirect,
+                         JsonResponse, QueryDict,)
 from django.shortcuts import render, resolve_url, get_object_or_404
 from django.urls import reverse_lazy, reverse
-from django.utils.text import slugify
-from django.views.generic.base import TemplateView
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import is_safe_url, urlencode
+from django.views.generic.base import TemplateView, View
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import (CreateView, UpdateView, DeleteView,
                                        FormView,)
 from django.views.generic.list import ListView
-from rest_framework import permissions, viewsets
+from .archive import rehydrate
+from .coalescing import coalesce
 from .forms import (TermForm, CourseForm, ClassNoteForm, CoursesOfTermForm,
-                    UpdateNoteForm, SearchBarForm, CurrentTermForm,)
-from .models import Term, Course, ClassNote
-from .serializers import TermSerializer, CourseSerializer, ClassNoteSerializer
+                    UpdateNoteForm, SearchBarForm, CurrentTermForm,
+                    SearchScopeForm,)
+from .mixins import RequestMemoMixin, StreamingListMixin
+from .models import Term, Course, ClassNote, Task
+from .navigation import get_navigation_tree
+from .notecache import attach_body, cache_metrics, invalidate
+from .patches import PatchError, apply_patch
+from .related import related_notes, update_vector
+from .revisions import get_revision_body, record_revision
+from .search import CURRENT_TERM, normalize, search_notes
+from .slugs import save_with_unique_slug
+from .stats import adjust_stats, count_words, dashboard_stats
+from .tasks import enqueue, queue_related_refresh
+from .throttling import rate_limit
+
+def search_redirect_url(user, title, query_string):
+    """
+    Produces the URL the searchbar sends the user to for a given title and
+    the scope in query_string; refer to SearchBar.
+    """
+    redirect_url = reverse('Notes:notes_list')
+    scope = SearchScopeForm(QueryDict(query_string)).get_scope()
+    matches, facets = search_notes(user, title, scope)
+
+    if matches:
+        score, best = matches[0]
+        redirect_url = best['url']
+        exact = normalize(best['title']) == normalize(title)
+        if len(matches) > 1 and not exact:
+            url = reverse('Notes:notes_search')
+            redirect_url = f'{url}?{query_string}'
 
+    return redirect_url
+
+@rate_limit('search')
 def SearchBar(request):
     """
     Redirects active-user to a ClassNote object's DetailView given the data that
     they provide to the searchbar. ClassNote objects are retrieved by
-    title. If multiple matches are made, user is provided a list of all similar
-    hits; refer to NotesListSearchQuery class. If no matches can be made user is
-    shown all ClassNote objects.
+    title, course code or course title, tolerating typos; refer to
+    Notes.search. If multiple matches are made and none has the exact title,
+    user is provided a list of all similar hits, best first; refer to
+    NotesListSearchQuery class. If no matches can be made user is shown all
+    ClassNote objects. Searches may be scoped as SearchScopeForm allows.
+    Identical searches running at the same time for the same user share one
+    lookup, keyed by a digest of the query string so that long searches fit
+    the cache's key column.
     """
     redirect_url = reverse_lazy('Notes:notes_list')
 
     if request.method == 'GET':
-
         user = request.user
-        notes = user.notes.all()
-
-        if notes:
-            title = ''.join(request.GET['title'].lower().split(' '))
-
-            matches = []
-            for note in notes:
-                if title in note.join_title():
-                    course = note.course
-                    term = course.term
-                    args = [term.term_slug, course.course_slug, note.note_slug]
-                    redirect_url = reverse_lazy("Notes:one_note", args=args)
-                    matches.append(note.note_slug)
-
-            if len(matches) > 1:
-                args = ['+'.join(matches)]
-                redirect_url = reverse_lazy('Notes:notes_search', args=args)
+        title = request.GET['title']
+        query_string = request.GET.urlencode()
+        digest = hashlib.sha1(query_string.encode('utf-8')).hexdigest()
+        key = f'search:{user.pk}:{digest}'
+        redirect_url = coalesce(
+            key,
+            lambda: search_redirect_url(user, title, query_string),
+            )
 
     return HttpResponseRedirect(redirect_url)
 
-class TermViewSet(viewsets.ModelViewSet):
-    """
-    Displays the JSON data of all Term objects associated with the active-user.
-    """
-    serializer_class = TermSerializer
-    permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
-
-    def get_queryset(self):
-        """
-        Retrieves all Term objects associated with the active_user; otherwise
-        returns an empty queryset for anonymous users.
-        """
-        active_user = self.request.user
-        if active_user.is_authenticated:
-            queryset = Term.objects.filter(user=active_user)
-        else:
-            queryset = Term.objects.none()
-        return queryset
-
-class CourseViewSet(viewsets.ModelViewSet):
-    """
-    Displays JSON data of all Course objects associated with the active-user.
-    """
-    serializer_class = CourseSerializer
-    permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
-
-    def get_queryset(self):
-        """
-        Retrieves all Course objects associated with the active_user; otherwise
-        returns an empty queryset for anonymous users.
-        """
-        active_user = self.request.user
-        if active_user.is_authenticated:
-            queryset = Course.objects.filter(user=active_user)
-        else:
-            queryset = Course.objects.none()
-        return queryset
-
-class ClassNoteViewSet(viewsets.ModelViewSet):
+class BackgroundDeleteMixin():
     """
-    Displays JSON data of all ClassNote objects associated with the active-user.
+    Mixin for delete views that hands the deletion off to a background task
+    and sends the user to a page that waits for it to finish before moving on
+    to the usual success URL.
     """
-    serializer_class = ClassNoteSerializer
-    permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
+    task_name = None
 
-    def get_queryset(self):
+    def delete(self, request, *args, **kwargs):
         """
-        Retrieves all ClassNote objects associated with the active_user;
-        otherwise returns an empty queryset for anonymous users.
+        Queues the deletion of the object and redirects to its task page.
         """
-        active_user = self.request.user
-        if active_user.is_authenticated:
-            queryset = ClassNote.objects.filter(user=active_user)
-        else:
-            queryset = ClassNote.objects.none()
-        return queryset
+        self.object = self.get_object()
+        success_url = str(self.get_success_url())
+        queued = enqueue(self.task_name, self.object.pk, user=request.user)
+        url = reverse('Notes:task', args=[queued.pk])
+        query = urlencode({'next': success_url})
+        return HttpResponseRedirect(f'{url}?{query}')
 
 class CreateTermView(CreateView, ListView):
     """
@@ -120,8 +120,7 @@ class CreateTermView(CreateView, ListView):
         term_form = TermForm(self.request.POST)
         term = term_form.save(commit = False)
         term.user = self.request.user
-        term.term_slug = slugify(term.session)
-        term.save()
+        save_with_unique_slug(term, 'term_slug', term.session, 'term')
         return HttpResponseRedirect(self.success_url)
 
     def get_queryset(self):
@@ -129,7 +128,7 @@ class CreateTermView(CreateView, ListView):
         Retrieves  queryset of all Term objects related to the active-user.
         """
         active_user = self.request.user
-        queryset = active_user.terms.all()
+        queryset = active_user.terms.with_course_counts()
         return queryset
 
 class UpdateOptionsTerm(FormView, ListView):
@@ -147,7 +146,7 @@ class UpdateOptionsTerm(FormView, ListView):
         Retrieves Term objects related to active user.
         """
         user = self.request.user
-        queryset = user.terms.all()
+        queryset = user.terms.with_course_counts()
         return queryset
 
     def get_context_data(self, **kwargs):
@@ -237,10 +236,11 @@ class UpdateTermView(UpdateView):
         context['cancel_edit'] = True
         return context
 
-class DeleteTermView(DeleteView):
+class DeleteTermView(BackgroundDeleteMixin, DeleteView):
     """
     View for deleting an existing Term object.
     """
+    task_name = 'delete_term'
     success_url = reverse_lazy('Notes:term_edit')
 
     def get_object(self):
@@ -269,7 +269,8 @@ class CreateCourseView(CreateView, ListView):
         Retrieves all Course objects associated with the active-user.
         """
         active_user = self.request.user
-        queryset = active_user.courses.all()
+        queryset = active_user.courses.with_note_stats()
+        queryset = queryset.select_related('term')
         return queryset
 
     def get_form_kwargs(self):
@@ -288,11 +289,15 @@ class CreateCourseView(CreateView, ListView):
         course_form = CourseForm(self.request.POST)
         course = course_form.save(commit = False)
         course.user = self.request.user
-        course.course_slug = slugify(course.course_code)
-        course.save()
+        save_with_unique_slug(
+            course,
+            'course_slug',
+            course.course_code,
+            'course',
+            )
         return HttpResponseRedirect(self.success_url)
 
-class CoursesOfTermView(CreateView, ListView):
+class CoursesOfTermView(RequestMemoMixin, CreateView, ListView):
     """
     View for creating a Course object through a specific term as well as listing
     all Course objects associated with a specific Term object.
@@ -300,6 +305,7 @@ class CoursesOfTermView(CreateView, ListView):
     template_name = 'course_list.html'
     context_object_name = 'courses'
     form_class = CoursesOfTermForm
+    memoized_methods = ('get_term',)
 
     def get_success_url(self):
         """
@@ -308,19 +314,26 @@ class CoursesOfTermView(CreateView, ListView):
         args = [self.kwargs['slug']]
         return reverse_lazy('Notes:course_term', args = args)
 
-    def get_queryset(self):
+    def get_term(self):
         """
-        Retrieves Course objects associated with a specific term and the
-        active-user.
+        Custom method that retrieves the Term object the courses belong to.
         """
-        user = self.request.user
         term = get_object_or_404(
             Term,
             term_slug = self.kwargs['slug'],
             user = self.request.user,
             )
-        slug = term.term_slug
-        return Course.objects.filter(user=user,term__term_slug=slug)
+        return term
+
+    def get_queryset(self):
+        """
+        Retrieves Course objects associated with a specific term and the
+        active-user.
+        """
+        user = self.request.user
+        term = self.get_term()
+        queryset = Course.objects.filter(user=user, term=term)
+        return queryset.with_note_stats().select_related('term')
 
     def get_context_data(self, **kwargs):
         """
@@ -341,15 +354,14 @@ class CoursesOfTermView(CreateView, ListView):
         """
         course_form = CoursesOfTermForm(self.request.POST)
         course = course_form.save(commit=False)
-        term = get_object_or_404(
-            Term,
-            term_slug=self.kwargs['slug'],
-            user=self.request.user,
-            )
-        course.term = term
+        course.term = self.get_term()
         course.user = self.request.user
-        course.course_slug = slugify(course.course_code)
-        course.save()
+        save_with_unique_slug(
+            course,
+            'course_slug',
+            course.course_code,
+            'course',
+            )
         return HttpResponseRedirect(self.get_success_url())
 
 class UpdateOptionsCourse(ListView):
@@ -364,7 +376,8 @@ class UpdateOptionsCourse(ListView):
         Retrieves all Course objects associated with the active-user.
         """
         user = self.request.user
-        queryset = user.courses.all()
+        queryset = user.courses.with_note_stats()
+        queryset = queryset.select_related('term')
         return queryset
 
     def get_context_data(self, **kwargs):
@@ -375,10 +388,12 @@ class UpdateOptionsCourse(ListView):
         context['editing'] = True
         return context
 
-class DeleteCourseView(DeleteView):
+class DeleteCourseView(RequestMemoMixin, BackgroundDeleteMixin, DeleteView):
     """
     View for deleting an existing Course object.
     """
+    task_name = 'delete_course'
+    memoized_methods = ('get_object',)
     success_url = reverse_lazy('Notes:course_edit')
 
     def get_object(self):
@@ -386,7 +401,7 @@ class DeleteCourseView(DeleteView):
         Retrieves the object to be deleted.
         """
         course = get_object_or_404(
-            Course,
+            Course.objects.select_related('term'),
             user = self.request.user,
             course_slug = self.kwargs['slug'],
             )
@@ -441,12 +456,13 @@ class CoursesOfTermEditView(ListView):
         slug = term.term_slug
         return Course.objects.filter(user=user,term__term_slug=slug)
 
-class UpdateCourseView(UpdateView):
+class UpdateCourseView(RequestMemoMixin, UpdateView):
     """
     View for updating an existing Course object.
     """
     template_name = 'update_course.html'
     form_class = CourseForm
+    memoized_methods = ('get_object',)
 
     def get_object(self):
         """
@@ -516,17 +532,18 @@ class CreateNoteView(CreateView):
         notes = notes_form.save(commit=False)
         user = self.request.user
         notes.user = user
-        slug = slugify(notes.title)
-        notes.note_slug = slug
-        notes.save()
+        with transaction.atomic():
+            save_with_unique_slug(notes, 'note_slug', notes.title, 'note')
+            record_revision(notes)
         return HttpResponseRedirect(self.success_url)
 
 
-class NotesList(ListView):
+class NotesList(StreamingListMixin, ListView):
     """
     View for listing all ClassNote objects.
     """
     template_name = 'notes_list.html'
+    row_template_name = 'notes_list_row.html'
     context_object_name = 'notes'
 
     def get_queryset(self):
@@ -535,14 +552,16 @@ class NotesList(ListView):
         """
         user = self.request.user
         queryset = ClassNote.objects.filter(user=user)
+        queryset = queryset.select_related('course__term')
         return queryset
 
-class NotesOfCourse(ListView):
+class NotesOfCourse(RequestMemoMixin, ListView):
     """
     View for listing all ClassNote objects of a specific course.
     """
     template_name = 'notes_list.html'
     context_object_name = 'notes'
+    memoized_methods = ('get_course',)
 
     def get_course(self):
         """
@@ -550,7 +569,7 @@ class NotesOfCourse(ListView):
         """
         user = self.request.user
         course = get_object_or_404(
-            Course,
+            Course.objects.select_related('term'),
             user=user,
             course_slug=self.kwargs['course_id'],
         )
@@ -578,13 +597,15 @@ class NotesOfCourse(ListView):
         user = self.request.user
         course = self.get_course()
         queryset = ClassNote.objects.filter(user=user, course=course)
+        queryset = queryset.select_related('course__term')
         return queryset
 
-class NotesListDashboard(ListView):
+class NotesListDashboard(StreamingListMixin, ListView):
     """
     View for listing all ClassNote objects on the dashboard.
     """
     template_name = 'dashboard.html'
+    row_template_name = 'dashboard_card.html'
     context_object_name = 'notes'
 
     def get_queryset(self):
@@ -595,6 +616,7 @@ class NotesListDashboard(ListView):
         user = self.request.user
         queryset = ClassNote.objects.filter(user=user)
         queryset = queryset.order_by('-created_at')
+        queryset = queryset.select_related('course__term')
         return queryset
 
     def get_context_data(self):
@@ -603,40 +625,65 @@ class NotesListDashboard(ListView):
         """
         context = super().get_context_data()
         context['dashboard'] = True
+        context['stats'] = dashboard_stats(self.request.user)
         return context
 
 class ReadNote(DetailView):
     """
-    View reading an existing ClassNote object.
+    View reading an existing ClassNote object. Rendered with a read-only
+    template so that no editor or form assets are loaded.
     """
-    template_name = 'notes_list.html'
+    template_name = 'note_detail.html'
     context_object_name = 'note'
 
     def get_object(self):
         """
-        Retrieves the ClassNote object to be read.
+        Retrieves the ClassNote object to be read along with the course and
+        term needed to build its edit URL. The body comes from the note
+        cache; refer to Notes.notecache.
         """
         note = get_object_or_404(
-            ClassNote,
+            ClassNote.objects.select_related('course__term').defer('body'),
             user=self.request.user,
             note_slug=self.kwargs['note_slug'],
             )
-        return note
+        return attach_body(note)
+
+    def get(self, request, *args, **kwargs):
+        """
+        Renders the note with an ETag built from its revision and its related
+        notes, answering 304 when the client already holds the current page.
+        The response is marked for the service worker, which keeps recently
+        read notes for offline reading.
+        """
+        self.object = self.get_object()
+        self.related_notes = related_notes(self.object)
+        checksum = zlib.crc32(repr(self.related_notes).encode('utf-8'))
+        etag = f'"{self.object.pk}.{self.object.revision}.{checksum:x}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            context = self.get_context_data(object=self.object)
+            response = self.render_to_response(context)
+        response['ETag'] = etag
+        response['X-Offline-Note'] = '1'
+        return response
 
     def get_context_data(self, **kwargs):
         """
-        Provides extra context to the template.
+        Provides the template with the notes most similar to this one and the
+        note it's a copy of, if any; refer to Notes.related.
         """
         context = super().get_context_data(**kwargs)
-        context['single_note'] = True
+        context['related_notes'] = self.related_notes
         return context
 
-class NoteUpdateOptions(ListView):
+class NoteUpdateOptions(StreamingListMixin, ListView):
     """
     View for selecting whether to update or delete and existing ClassNote
     object.
     """
     template_name = 'notes_edit_delete.html'
+    row_template_name = 'notes_edit_delete_row.html'
     context_object_name = 'notes'
 
     def get_queryset(self):
@@ -645,6 +692,7 @@ class NoteUpdateOptions(ListView):
         """
         user = self.request.user
         queryset = ClassNote.objects.filter(user=user)
+        queryset = queryset.select_related('course__term')
         return queryset
 
     def get_context_data(self, **kwargs):
@@ -656,12 +704,13 @@ class NoteUpdateOptions(ListView):
         context['single_course'] = False
         return context
 
-class NotesOfCourseUpdateOptions(ListView):
+class NotesOfCourseUpdateOptions(RequestMemoMixin, ListView):
     """
     View for listing all ClassNote objects of a specific course.
     """
     template_name = 'notes_edit_delete.html'
     context_object_name = 'notes'
+    memoized_methods = ('get_course',)
 
     def get_course(self):
         """
@@ -670,7 +719,7 @@ class NotesOfCourseUpdateOptions(ListView):
         slug = self.request.META['HTTP_REFERER'].split('/')[-2]
         user = self.request.user
         course = get_object_or_404(
-            Course,
+            Course.objects.select_related('term'),
             user=user,
             course_slug=slug,
             )
@@ -684,6 +733,7 @@ class NotesOfCourseUpdateOptions(ListView):
         user = self.request.user
         course = self.get_course()
         queryset = user.notes.filter(course=course)
+        queryset = queryset.select_related('course__term')
         return queryset
 
     def get_context_data(self, **kwargs):
@@ -720,25 +770,27 @@ class DeleteNoteView(DeleteView):
             )
         return object
 
-class UpdateNoteView(UpdateView):
+class UpdateNoteView(RequestMemoMixin, UpdateView):
     """
     View for updating an existing ClassNote object.
     """
     template_name = "note_update.html"
     form_class = UpdateNoteForm
     context_object_name = 'note'
+    memoized_methods = ('get_object',)
 
     def get_object(self):
         """
-        Retrieves the object to be updated.
+        Retrieves the object to be updated, bringing back its body if it was
+        archived.
         """
         note_slug = self.kwargs['note_slug']
         note = get_object_or_404(
-            ClassNote,
+            ClassNote.objects.select_related('course__term'),
             user = self.request.user,
             note_slug = note_slug,
             )
-        return note
+        return rehydrate(note)
 
     def get_success_url(self):
         """
@@ -758,36 +810,352 @@ class UpdateNoteView(UpdateView):
         """
         context = super().get_context_data(**kwargs)
         context['cancel_edit'] = True
+        context['body_length'] = len(self.object.body.encode('utf-16-le')) // 2
+        return context
+
+    def form_valid(self, form):
+        """
+        Saves the updated ClassNote object if anything changed, which bumps
+        its revision so that autosaves made against the old revision are
+        rejected. The save only goes through while the note is still at the
+        revision it was loaded at, like an autosave's; if an autosave got in
+        first, the form is shown again with a 409 to be submitted anew.
+        """
+        if not form.has_changed():
+            return HttpResponseRedirect(self.get_success_url())
+
+        previous_body = form.initial.get('body')
+        base_revision = self.object.revision
+        try:
+            with transaction.atomic():
+                if self.current_revision(lock=True) != base_revision:
+                    return self.conflict(form)
+                response = super().form_valid(form)
+                record_revision(self.object, previous_body)
+        except IntegrityError:
+            if self.current_revision() == base_revision:
+                raise
+            return self.conflict(form)
+        return response
+
+    def current_revision(self, lock=False):
+        """
+        Reads the note's revision from the database, locking its row if asked
+        to.
+        """
+        notes = ClassNote.objects.filter(pk=self.object.pk).order_by()
+        if lock:
+            notes = notes.select_for_update()
+        return notes.values_list('revision', flat=True).first()
+
+    def conflict(self, form):
+        """
+        Shows the form again, keeping the submitted changes, after the note
+        was saved elsewhere mid-request.
+        """
+        self.object.revision = self.current_revision()
+        form.add_error(None, (
+            'This note was saved elsewhere while your changes were being '
+            'saved. Submit the form again to keep your changes.'
+            ))
+        response = self.render_to_response(self.get_context_data(form=form))
+        response.status_code = 409
+        return response
+
+class AutosaveNoteView(View):
+    """
+    Saves an existing ClassNote object's body from a compact patch made against
+    a known revision instead of a full form post; refer to Notes.patches for
+    the patch format.
+    """
+
+    def post(self, request, *args, **kwargs):
+        """
+        Applies the posted patch and responds with the note's revision. A 409
+        response means the note was saved elsewhere since the patch's base
+        revision, and the client has to reload before saving again.
+        """
+        try:
+            payload = json.loads(request.body.decode('utf-8'))
+            base_revision = int(payload['revision'])
+            ops = payload['ops']
+        except (ValueError, KeyError, TypeError):
+            error = {'error': 'Malformed autosave request.'}
+            return JsonResponse(error, status=400)
+
+        note = get_object_or_404(
+            ClassNote.objects.only(
+                'body',
+                'revision',
+                'word_count',
+                'course',
+                'archived',
+                ),
+            user=request.user,
+            note_slug=self.kwargs['note_slug'],
+            )
+        rehydrate(note)
+
+        if note.revision != base_revision:
+            return JsonResponse({'revision': note.revision}, status=409)
+
+        try:
+            body = apply_patch(note.body, ops)
+        except PatchError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+
+        if body == note.body:
+            return JsonResponse({'revision': note.revision, 'saved': False})
+
+        words = count_words(body)
+        with transaction.atomic():
+            updated = ClassNote.objects.filter(
+                pk=note.pk,
+                revision=base_revision,
+                ).update(
+                    body=body,
+                    revision=base_revision + 1,
+                    word_count=words,
+                    )
+
+            if updated:
+                previous_body = note.body
+                note.body = body
+                note.revision = base_revision + 1
+                record_revision(note, previous_body)
+                invalidate(note.pk, base_revision)
+                adjust_stats(
+                    request.user.pk,
+                    note.course_id,
+                    words=words - note.word_count,
+                    activity=timezone.now(),
+                    )
+                update_vector(note)
+                queue_related_refresh(request.user.pk)
+
+        if not updated:
+            note.refresh_from_db(fields=['revision'])
+            return JsonResponse({'revision': note.revision}, status=409)
+
+        return JsonResponse({'revision': note.revision, 'saved': True})
+
+class NoteHistoryView(DetailView):
+    """
+    View listing the saved revisions of an existing ClassNote object and, when
+    a revision is selected, the changes it made to the previous revision.
+    """
+    template_name = 'note_history.html'
+    context_object_name = 'note'
+
+    def get_object(self):
+        """
+        Retrieves the ClassNote object whose history is shown.
+        """
+        note = get_object_or_404(
+            ClassNote.objects.select_related('course__term').defer('body'),
+            user=self.request.user,
+            note_slug=self.kwargs['note_slug'],
+            )
+        return note
+
+    def get_diff(self, number):
+        """
+        Custom method that produces a line by line diff between the selected
+        revision and the one before it, as a list of (change, line) tuples
+        where change is one of '+', '-' or ' '.
+        """
+        after = get_revision_body(self.object, number)
+        if after is None:
+            raise Http404('Revision not found.')
+
+        before = get_revision_body(self.object, number - 1) or ''
+        diff = difflib.ndiff(before.splitlines(), after.splitlines())
+        return [(line[0], line[2:]) for line in diff if line[0] in '+- ']
+
+    def get_context_data(self, **kwargs):
+        """
+        Provides extra context to the template.
+        """
+        context = super().get_context_data(**kwargs)
+        context['cancel_edit'] = True
+        context['revisions'] = self.object.revisions.defer('data').reverse()
+        number = self.kwargs.get('revision')
+        if number is not None:
+            context['selected'] = number
+            context['diff'] = self.get_diff(number)
         return context
 
 class NotesListSearchQuery(ListView):
     """
     If multiple ClassNote object matches are made from the data the user
-    provides to the searchbar, this view will generate a queryset of all those
-    objects with similar titles.
+    provides to the searchbar, this view lists them, best first, alongside
+    the number of matches in each term and course. Choosing a term or course,
+    or a range of dates, narrows the search down to it; refer to
+    Notes.search.
     """
-    template_name = "notes_list.html"
+    template_name = "notes_search.html"
     context_object_name = "notes"
 
+    def get(self, request, *args, **kwargs):
+        """
+        Reads the search and its scope from the query string.
+        """
+        self.form = SearchScopeForm(request.GET)
+        self.title = request.GET.get('title', '')
+        self.scope = self.form.get_scope()
+        return super().get(request, *args, **kwargs)
+
     def get_queryset(self):
         """
-        Generates a queryset of all ClassNote objects that have a title whose
-        substring matches what the user provides to the searchbar.
+        Runs the search and generates a queryset of the ClassNote objects it
+        matched, in the order it ranked them.
         """
-        slugs = self.kwargs['notes_query'].split('+')
-        user = self.request.user
+        matches, self.facets = search_notes(
+            self.request.user,
+            self.title,
+            self.scope,
+            )
+        slugs = [match['slug'] for score, match in matches]
 
-        queryset = None
-        for slug in slugs:
-            if queryset is None:
-                queryset = ClassNote.objects.filter(user=user, note_slug=slug)
-            else:
-                queryset = queryset | ClassNote.objects.filter(
-                    user=user,
-                    note_slug=slug,
-                    )
+        rank = Case(
+            *(When(note_slug=slug, then=Value(number))
+              for number, slug in enumerate(slugs)),
+            default=Value(len(slugs)),
+            output_field=IntegerField(),
+            )
+        queryset = ClassNote.objects.filter(
+            user=self.request.user,
+            note_slug__in=slugs,
+            ).select_related('course__term').order_by(rank)
+        return queryset
 
-        if len(queryset) == 0:
-            return HttpResponseRedirect(reverse_lazy('Notes:notes_list'))
+    def get_context_data(self, **kwargs):
+        """
+        Provides the template with the search, its scope form and the facets,
+        each linking to the search narrowed down to it, or widened back out
+        when it's already chosen.
+        """
+        context = super().get_context_data(**kwargs)
+        context['search_title'] = self.title
+        context['scope_form'] = self.form
+        context['term_facets'] = self.facet_links(
+            self.facets['terms'], 'term', ('term', 'course'),
+            )
+        context['course_facets'] = self.facet_links(
+            self.facets['courses'], 'course', ('course',),
+            )
+        query = self.request.GET.copy()
+        query.pop('course', None)
+        query['term'] = CURRENT_TERM
+        context['current_term_url'] = f'{reverse("Notes:notes_search")}?' \
+            f'{query.urlencode()}'
+        context['current_term_selected'] = \
+            self.scope.get('term') == CURRENT_TERM
+        return context
 
-        return queryset
+    def facet_links(self, facets, key, cleared):
+        """
+        Adds to each facet the URL of the search with the facet chosen, or
+        with it and the fields in cleared dropped if it's already chosen.
+        """
+        url = reverse('Notes:notes_search')
+        for facet in facets:
+            query = self.request.GET.copy()
+            for field in cleared:
+                query.pop(field, None)
+            if not facet['selected']:
+                query[key] = facet['slug']
+            facet['url'] = f'{url}?{query.urlencode()}'
+        return facets
+
+class TaskView(DetailView):
+    """
+    View that waits for a background task queued by the active-user to finish
+    and then sends them on to the page they came from.
+    """
+    template_name = 'task.html'
+    context_object_name = 'task'
+
+    def get_object(self):
+        """
+        Retrieves the Task object being waited on.
+        """
+        task = get_object_or_404(
+            Task,
+            pk=self.kwargs['pk'],
+            user=self.request.user,
+            )
+        return task
+
+    def get_context_data(self, **kwargs):
+        """
+        Provides the template with the URL to continue to once the task is
+        done, falling back to the dashboard for unsafe URLs.
+        """
+        context = super().get_context_data(**kwargs)
+        next_url = self.request.GET.get('next', '')
+        allowed_hosts = {self.request.get_host()}
+        if not is_safe_url(next_url, allowed_hosts=allowed_hosts):
+            next_url = reverse('dashboard')
+        context['next_url'] = next_url
+        return context
+
+class TaskStatusView(View):
+    """
+    Returns the status of a background task queued by the active-user as JSON
+    for the task page to poll.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Responds with the task's status.
+        """
+        task = get_object_or_404(
+            Task.objects.only('status', 'progress', 'attempts'),
+            pk=self.kwargs['pk'],
+            user=request.user,
+            )
+        status = {
+            'status': task.status,
+            'progress': task.progress,
+            'attempts': task.attempts,
+            }
+        return JsonResponse(status)
+
+class NavigationTreeView(TemplateView):
+    """
+    Renders the active-user's Term, Course and Note tree as an HTML fragment.
+    """
+    template_name = 'navigation_tree.html'
+
+    def get_context_data(self, **kwargs):
+        """
+        Provides the template with the navigation tree.
+        """
+        context = super().get_context_data(**kwargs)
+        context['navigation_tree'] = get_navigation_tree(self.request.user)
+        return context
+
+class NavigationTreeJSON(View):
+    """
+    Returns the active-user's Term, Course and Note tree as JSON.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Responds with the navigation tree.
+        """
+        tree = get_navigation_tree(request.user)
+        return JsonResponse({'terms': tree})
+
+@method_decorator(staff_member_required, name='dispatch')
+class NoteCacheMetricsView(View):
+    """
+    Reports the note cache's hit rates for the process serving the request.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Returns the metrics as JSON.
+        """
+        return JsonResponse(cache_metrics())
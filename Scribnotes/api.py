@@ -0,0 +1,20 @@
+"""
+The REST API's user viewset; refer to Scribnotes/api_urls.py.
+"""
+from django.contrib.auth import get_user_model
+from rest_framework import viewsets
+from .serializers import UserSerializer
+
+class UserViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Viewset for displaying active user data as JSON.
+    """
+    serializer_class = UserSerializer
+
+    def get_queryset(self):
+        """
+        Retrieves active user.
+        """
+        username = self.request.user.username
+        user = get_user_model().objects.filter(username=username)
+        return user
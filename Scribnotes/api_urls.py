@@ -0,0 +1,22 @@
+"""
+URLconf of the REST API, mounted lazily under Web-API/ in the 'api'
+namespace; refer to Scribnotes/resolvers.py.
+"""
+from rest_framework import routers
+from Notes.api import TermViewSet, CourseViewSet, ClassNoteViewSet
+from .api import UserViewSet
+
+app_name = 'api'
+
+router = routers.DefaultRouter()
+router.register(r'users', UserViewSet, basename='user')
+router.register(r'terms', TermViewSet, basename='term')
+router.register(r'courses', CourseViewSet, basename='course')
+router.register(r'classnotes', ClassNoteViewSet, basename='classnote')
+
+urlpatterns = router.urls
+
+# Query budgets for the routes above; refer to Notes/urls.py.
+query_budgets = {
+    'classnote-list': 5,
+}
@@ -0,0 +1,115 @@
+from django.conf import settings
+from django.urls import reverse
+from django.utils.crypto import salted_hmac
+from .profiling import profile, requested_token, token_is_valid
+from .routers import allow_replicas
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'use_primary'
+OFFLINE_USER_COOKIE = 'offline_user'
+OFFLINE_USER_SALT = 'Scribnotes.middleware.offline_user'
+
+
+class ReplicaMiddleware():
+    """
+    Lets safe requests read from replicas. After an unsafe request the client
+    gets a short-lived cookie that pins its reads to the primary, so a user
+    always sees their own writes even while replicas catch up.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """
+        Allows or forbids replica reads for the duration of the request.
+        """
+        safe = request.method in SAFE_METHODS
+        allow_replicas(safe and STICKY_COOKIE not in request.COOKIES)
+
+        try:
+            response = self.get_response(request)
+        finally:
+            allow_replicas(False)
+
+        if not safe:
+            response.set_cookie(
+                STICKY_COOKIE,
+                '1',
+                max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 10),
+                httponly=True,
+                )
+        return response
+
+
+def offline_user(user):
+    """
+    Returns the opaque value identifying user to the service worker.
+    """
+    return salted_hmac(OFFLINE_USER_SALT, str(user.pk)).hexdigest()[:20]
+
+
+class OfflineUserMiddleware():
+    """
+    Tells the service worker whose session the browser holds, so that it
+    only serves notes kept for offline reading to the user who read them;
+    refer to templates/service_worker.js. Signed-in users get a cookie the
+    worker can read, lasting as long as their session, which is dropped once
+    the session is gone, and notes marked for the worker get the same value
+    in a header. Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """
+        Sets or drops the cookie and marks kept notes with their reader.
+        """
+        response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            if OFFLINE_USER_COOKIE in request.COOKIES:
+                response.delete_cookie(OFFLINE_USER_COOKIE)
+            return response
+
+        value = offline_user(user)
+        if response.has_header('X-Offline-Note'):
+            response['X-Offline-User'] = value
+        if request.COOKIES.get(OFFLINE_USER_COOKIE) != value:
+            expires = settings.SESSION_EXPIRE_AT_BROWSER_CLOSE
+            response.set_cookie(
+                OFFLINE_USER_COOKIE,
+                value,
+                max_age=None if expires else settings.SESSION_COOKIE_AGE,
+                secure=settings.SESSION_COOKIE_SECURE,
+                samesite='Lax',
+                )
+        return response
+
+
+class ProfilingMiddleware():
+    """
+    Profiles requests from staff users that carry a valid profiling token;
+    refer to Scribnotes/profiling.py. Every other request passes straight
+    through. Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """
+        Runs the request under the profiler when asked to, and tells the client
+        where to find the report.
+        """
+        token = requested_token(request)
+        if not token or not token_is_valid(token, request.user):
+            return self.get_response(request)
+
+        response, report_id = profile(request, self.get_response)
+        response['X-Profile-Report'] = reverse(
+            'profile_report',
+            args=[report_id],
+            )
+        return response
@@ -0,0 +1,201 @@
+"""
+On-demand profiling of single requests for staff users. A request carrying a
+valid profiling token, either as the PROFILE_PARAM query parameter or the
+PROFILE_HEADER header, runs under cProfile with every SQL statement recorded
+along with its duration and the line of project code that issued it. The
+report is kept in the cache for PROFILING_REPORT_TIMEOUT seconds, and the
+response points to it in the X-Profile-Report header.
+
+Tokens are signed with the project's secret key and tied to one staff user, so
+they can't be forged or used by anyone else.
+"""
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import time
+import uuid
+from contextlib import ExitStack
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+
+PROFILE_PARAM = 'profile'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+SALT = 'Scribnotes.profiling'
+REPORTS_KEPT = 20
+STATS_SHOWN = 40
+
+
+def report_timeout():
+    """
+    Seconds a report is kept for.
+    """
+    return getattr(settings, 'PROFILING_REPORT_TIMEOUT', 60 * 60 * 24)
+
+
+def make_token(user):
+    """
+    Produces a profiling token for a staff user.
+    """
+    return signing.TimestampSigner(salt=SALT).sign(str(user.pk))
+
+
+def requested_token(request):
+    """
+    Returns the profiling token a request carries, if any. This is all an
+    unprofiled request pays for.
+    """
+    return request.GET.get(PROFILE_PARAM) or request.META.get(PROFILE_HEADER)
+
+
+def token_is_valid(token, user):
+    """
+    Returns whether token was issued to user, the user is still staff, and the
+    token hasn't expired.
+    """
+    if not user.is_authenticated or not user.is_staff:
+        return False
+    max_age = getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 60 * 60 * 24)
+    try:
+        value = signing.TimestampSigner(salt=SALT).unsign(token, max_age)
+    except signing.BadSignature:
+        return False
+    return value == str(user.pk)
+
+
+def origin(frame):
+    """
+    Finds where a query came from, walking out from frame: the innermost line
+    of project code, or of a template when the query is made while rendering
+    one, formatted as 'path:line in function'. Installed packages and this
+    module are skipped.
+    """
+    while frame is not None:
+        code = frame.f_code
+        node = frame.f_locals.get('self')
+        if code.co_name == 'render_annotated' and hasattr(node, 'origin'):
+            return f'{node.origin.template_name}:{node.token.lineno}'
+
+        filename = os.path.abspath(code.co_filename)
+        if filename.startswith(settings.BASE_DIR) and \
+                'site-packages' not in filename and \
+                filename != os.path.abspath(__file__):
+            path = os.path.relpath(filename, settings.BASE_DIR)
+            return f'{path}:{frame.f_lineno} in {code.co_name}'
+        frame = frame.f_back
+    return ''
+
+
+class QueryRecorder():
+    """
+    Database execute wrapper that records every statement run through it.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Runs the statement, timing it and noting where it came from.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': self.alias,
+                'sql': sql,
+                'params': repr(params),
+                'duration': (time.perf_counter() - start) * 1000,
+                'origin': origin(sys._getframe(1)),
+                })
+
+
+def profile(request, get_response):
+    """
+    Handles request under cProfile with SQL capture, stores the report and
+    returns the response along with the report's id.
+    """
+    recorders = [QueryRecorder(alias) for alias in connections]
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+
+    with ExitStack() as stack:
+        for recorder in recorders:
+            connection = connections[recorder.alias]
+            stack.enter_context(connection.execute_wrapper(recorder))
+        response = profiler.runcall(get_response, request)
+
+    duration = (time.perf_counter() - start) * 1000
+    profiler.create_stats()
+    data = marshal.dumps(profiler.stats)
+
+    queries = [query for recorder in recorders for query in recorder.queries]
+    report_id = uuid.uuid4().hex
+    report = {
+        'id': report_id,
+        'user_id': request.user.pk,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code,
+        'created_at': timezone.now(),
+        'duration': duration,
+        'queries': queries,
+        'sql_duration': sum(query['duration'] for query in queries),
+        'stats': format_stats(profiler),
+        'profile': data,
+        }
+    save_report(report)
+    return response, report_id
+
+
+def format_stats(profiler):
+    """
+    Renders the most expensive functions by cumulative time as text.
+    """
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(STATS_SHOWN)
+    return stream.getvalue()
+
+
+def index_key(user_id):
+    """
+    Cache key under which the ids of a user's recent reports are kept.
+    """
+    return f'profile-index:{user_id}'
+
+
+def save_report(report):
+    """
+    Stores a report and adds it to its user's list of recent reports.
+    """
+    timeout = report_timeout()
+    cache.set(f'profile:{report["id"]}', report, timeout)
+
+    key = index_key(report['user_id'])
+    ids = [report['id']] + cache.get(key, [])
+    cache.set(key, ids[:REPORTS_KEPT], timeout)
+
+
+def get_report(report_id):
+    """
+    Returns a stored report, or None if it doesn't exist or has expired.
+    """
+    return cache.get(f'profile:{report_id}')
+
+
+def recent_reports(user):
+    """
+    Returns the user's reports that are still stored, newest first.
+    """
+    reports = cache.get_many([f'profile:{id}' for id in
+                              cache.get(index_key(user.pk), [])])
+    return sorted(reports.values(), key=lambda report: report['created_at'],
+                  reverse=True)
@@ -0,0 +1,71 @@
+"""
+URL resolvers that load their URLconf on first use. Django imports a URLconf
+passed to include() right away, and it loads every nested URLconf the first
+time any URL is reversed. LazyURLResolver waits until a URL under its prefix
+is resolved or one of its own names is reversed. The enclosing resolver only
+needs a namespaced resolver's namespace, not its names, so lazy resolvers
+must have one.
+"""
+from django.urls import URLResolver
+from django.urls.resolvers import RoutePattern
+
+
+class LazyURLResolver(URLResolver):
+    """
+    URLResolver that imports its URLconf only when its URLs are needed. The
+    base class already leaves url_patterns alone when resolving paths outside
+    its prefix.
+    """
+
+    @property
+    def loaded(self):
+        """
+        Whether the URLconf has been imported.
+        """
+        return 'urlconf_module' in self.__dict__
+
+    def _populate(self):
+        """
+        Fills in the reverse lookup tables once the URLconf is loaded. The
+        enclosing resolver calls this while populating itself, which must not
+        load the URLconf.
+        """
+        if self.loaded:
+            super()._populate()
+
+    @property
+    def reverse_dict(self):
+        """
+        Loads the URLconf to reverse one of its names.
+        """
+        self.url_patterns
+        return super().reverse_dict
+
+    @property
+    def namespace_dict(self):
+        """
+        Loads the URLconf to reverse a name in a nested namespace.
+        """
+        self.url_patterns
+        return super().namespace_dict
+
+    @property
+    def app_dict(self):
+        """
+        Loads the URLconf to look up a nested application namespace.
+        """
+        self.url_patterns
+        return super().app_dict
+
+
+def lazy_include(route, urlconf, namespace):
+    """
+    Like path(route, include((urlconf, namespace))), but doesn't import the
+    urlconf module until its URLs are needed.
+    """
+    return LazyURLResolver(
+        RoutePattern(route, is_endpoint=False),
+        urlconf,
+        app_name=namespace,
+        namespace=namespace,
+        )
@@ -0,0 +1,116 @@
+"""
+Routes reads made while handling safe requests to read replicas. The
+ReplicaMiddleware decides per request whether replicas may be used; outside
+of such a request (management commands, the task worker) every query goes to
+the primary database.
+"""
+import random
+import threading
+import time
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+PRIMARY = 'default'
+PRIMARY_ONLY_APPS = {'admin', 'django_cache', 'sessions'}
+PRIMARY_ONLY_MODELS = {'Notes.task'}
+
+LAG_QUERY = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+_state = threading.local()
+_health = {}
+
+
+def allow_replicas(allowed):
+    """
+    Sets whether reads in the current thread may go to a replica.
+    """
+    _state.replicas_allowed = allowed
+
+
+def replica_lag(alias):
+    """
+    Returns how many seconds the replica is behind the primary. Only
+    PostgreSQL replicas can lag; any other database is treated as current.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0
+
+    with connection.cursor() as cursor:
+        cursor.execute(LAG_QUERY)
+        lag = cursor.fetchone()[0]
+    return float(lag or 0)
+
+
+def replica_is_fresh(alias):
+    """
+    Returns whether the replica is reachable and no more than
+    REPLICA_MAX_LAG seconds behind. The answer is remembered for
+    REPLICA_CHECK_INTERVAL seconds so the check doesn't cost a query per
+    request.
+    """
+    now = time.monotonic()
+    interval = getattr(settings, 'REPLICA_CHECK_INTERVAL', 5)
+    checked = _health.get(alias)
+    if checked is not None and now - checked[0] < interval:
+        return checked[1]
+
+    try:
+        fresh = replica_lag(alias) <= getattr(settings, 'REPLICA_MAX_LAG', 2)
+    except DatabaseError:
+        fresh = False
+
+    _health[alias] = (now, fresh)
+    return fresh
+
+
+class ReplicaRouter():
+    """
+    Database router that sends reads to a randomly chosen fresh replica from
+    DATABASE_REPLICAS when the current request allows it, and everything else
+    to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        """
+        Picks the database for a read query.
+        """
+        if not getattr(_state, 'replicas_allowed', False):
+            return PRIMARY
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return PRIMARY
+        if model._meta.label_lower in PRIMARY_ONLY_MODELS:
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        fresh = [alias for alias in replicas if replica_is_fresh(alias)]
+        if not fresh:
+            return PRIMARY
+        return random.choice(fresh)
+
+    def db_for_write(self, model, **hints):
+        """
+        All writes go to the primary.
+        """
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """
+        Replicas hold the same data as the primary, so objects read from any
+        of them may be related.
+        """
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """
+        Only the primary is migrated; replicas receive schema changes through
+        replication.
+        """
+        return db == PRIMARY
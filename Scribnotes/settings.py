@@ -31,16 +31,27 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    'DEFAULT_THROTTLE_CLASSES': ('Notes.throttling.TokenBucketThrottle',),
+}
+
+# Per-user request limits by scope; refer to Notes/throttling.py.
+RATE_LIMITS = {
+    'search': '30/minute',
+    'api': '120/minute',
+    'notes_api': '60/minute',
 }
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'Scribnotes.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'Scribnotes.middleware.OfflineUserMiddleware',
+    'Scribnotes.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -48,12 +59,20 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'Scribnotes.urls'
 
+# Compiled templates are kept in memory between requests unless DEBUG is on.
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR,],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS if DEBUG else [
+                ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -61,6 +80,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'Notes.context_processors.SearchBarContext',
                 'Notes.context_processors.SetCurrentCourses',
+                'Notes.context_processors.NavigationTree',
             ],
         },
     },
@@ -80,6 +100,25 @@ DATABASES = {
 }
 
 
+# Cache
+# A database cache is shared by all worker processes, so per-user entries
+# invalidated in one process are dropped for all of them. The table is
+# created by `manage.py createcachetable`. It holds a few entries per active
+# user (navigation trees, search indexes, rate limit buckets) and one per
+# recently read note's related notes; past MAX_ENTRIES a third of it is
+# culled. Note bodies aren't kept in it; refer to Notes/notecache.py.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'scribnotes_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -131,5 +170,82 @@ CKEDITOR_CONFIGS = {
     }
 }
 
+# Background tasks; refer to Notes/tasks.py. Run `manage.py run_tasks` for a
+# dedicated worker, otherwise tasks are run by a thread in the web process.
+# Tasks still running after BACKGROUND_TASK_STALE_AFTER seconds are taken to
+# have lost their worker.
+
+BACKGROUND_TASKS_IN_PROCESS = True
+BACKGROUND_TASK_RETRY_DELAY = 30
+BACKGROUND_TASK_STALE_AFTER = 600
+
+# Notes of past terms older than this many years are moved to the archive by
+# `manage.py archive_notes`; refer to Notes/archive.py.
+
+ARCHIVE_AFTER_YEARS = 2
+
+# Note bodies at least this many characters long are stored compressed; refer
+# to Notes/fields.py.
+
+NOTE_BODY_COMPRESS_MIN_LENGTH = 1024
+
+# Decoded note bodies are cached per process, up to this many bytes, and in the
+# shared cache for this many seconds, unless the shared cache is the database
+# one; refer to Notes/notecache.py.
+NOTE_CACHE_MAX_BYTES = 8 * 1024 * 1024
+NOTE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Seconds a fresh web process may take to boot, as measured by
+# `manage.py startup_profile --check`; refer to Scribnotes/startup.py.
+STARTUP_TIME_BUDGET = 0.5
+
+# Note lists longer than this many rows are streamed to the browser in chunks
+# of STREAMING_LIST_CHUNK_SIZE rows; refer to Notes/mixins.py.
+STREAMING_LIST_THRESHOLD = 200
+STREAMING_LIST_CHUNK_SIZE = 100
+
+# Notes whose title, course code or course title is at least this similar to
+# a search, by trigrams, are matched, and at most SEARCH_RESULT_LIMIT of them
+# are listed; refer to Notes/search.py.
+SEARCH_SIMILARITY_THRESHOLD = 0.3
+SEARCH_RESULT_LIMIT = 50
+
+# Each note is shown up to RELATED_NOTES_COUNT notes at least
+# RELATED_NOTES_MIN_SCORE cosine-similar to it over their
+# RELATED_NOTES_TERMS_KEPT heaviest terms, recomputed by a background task
+# this many seconds after its owner's notes change; refer to Notes/related.py.
+RELATED_NOTES_COUNT = 5
+RELATED_NOTES_MIN_SCORE = 0.1
+RELATED_NOTES_TERMS_KEPT = 32
+RELATED_NOTES_REFRESH_DELAY = 60
+
+# The test runner enforces the query budgets declared beside the URLconfs and
+# writes a report of repeated and slow queries; refer to Notes/testing.py.
+
+TEST_RUNNER = 'Notes.testing.QueryAuditRunner'
+TEST_QUERY_REPORT = os.path.join(BASE_DIR, 'query-report.txt')
+
+# Staff request profiling; refer to Scribnotes/profiling.py. Tokens are handed
+# out on the Profiles/ page.
+
+PROFILING_TOKEN_MAX_AGE = 60 * 60 * 24
+PROFILING_REPORT_TIMEOUT = 60 * 60 * 24
+
 prod_db = dj_database_url.config(conn_max_age=500)
 DATABASES['default'].update(prod_db)
+
+# Read replicas; refer to Scribnotes/routers.py. REPLICA_DATABASE_URLS is a
+# comma-separated list of database URLs, each added as a replicaN alias. Under
+# test, replicas mirror the default test database.
+
+DATABASE_ROUTERS = ['Scribnotes.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_MAX_LAG = 2
+REPLICA_STICKY_SECONDS = 10
+
+replica_urls = os.environ.get('REPLICA_DATABASE_URLS', '')
+for number, url in enumerate(filter(None, replica_urls.split(',')), 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = dj_database_url.parse(url, conn_max_age=500)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
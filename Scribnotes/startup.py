@@ -0,0 +1,177 @@
+"""
+Startup timing and warm-up for web processes.
+
+profile_startup() measures how long a fresh process takes to become ready to
+serve: configuring Django and loading the apps, building the WSGI handler and
+its middleware, then loading the root URLconf and the views it imports, which
+Django otherwise leaves to the first request. Every module import is timed
+along the way. `manage.py startup_profile` runs it in a child process and
+compares the total with the STARTUP_TIME_BUDGET setting.
+
+warm_up() does that work ahead of traffic and then some. It loads every
+URLconf, including the ones Scribnotes/urls.py loads lazily. It also compiles
+the project's templates into the cached template loader and opens the
+database connections. gunicorn.conf.py warms the master process before
+workers are forked. `manage.py warmup` runs it by hand.
+
+Only the standard library is imported at load time, so that timing starts
+before Django is imported.
+"""
+import builtins
+import importlib
+import os
+import sys
+import time
+from functools import wraps
+from itertools import islice
+
+
+class ImportTimer():
+    """
+    Times module imports by wrapping __import__ and importlib.import_module.
+    An import that loads new modules is charged to the first module it loads,
+    with its total time and its own time, which excludes the nested imports
+    it triggered.
+    """
+
+    def __init__(self):
+        self.modules = {}
+        self.stack = []
+        self.originals = None
+
+    def wrap(self, function):
+        """
+        Returns function timed.
+        """
+        @wraps(function)
+        def timed(*args, **kwargs):
+            loaded = len(sys.modules)
+            self.stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = self.stack.pop()
+                if len(sys.modules) > loaded:
+                    if self.stack:
+                        self.stack[-1] += elapsed
+                    name = next(islice(sys.modules, loaded, None))
+                    total, own = self.modules.get(name, (0.0, 0.0))
+                    self.modules[name] = (total + elapsed,
+                                          own + elapsed - nested)
+        return timed
+
+    def __enter__(self):
+        self.originals = (builtins.__import__, importlib.import_module)
+        builtins.__import__ = self.wrap(builtins.__import__)
+        importlib.import_module = self.wrap(importlib.import_module)
+        return self
+
+    def __exit__(self, *exc_info):
+        builtins.__import__, importlib.import_module = self.originals
+
+    def slowest(self, limit):
+        """
+        Returns (module, total seconds, own seconds) for the limit imports
+        that took the longest themselves.
+        """
+        timings = [(name, total, own)
+                   for name, (total, own) in self.modules.items()]
+        timings.sort(key=lambda timing: timing[2], reverse=True)
+        return timings[:limit]
+
+
+def profile_startup(limit=25):
+    """
+    Boots Django in this process as a web worker would, returning the time
+    taken by each phase and the limit slowest imports. Only meaningful in a
+    fresh process; refer to `manage.py startup_profile`.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Scribnotes.settings')
+    phases = []
+    with ImportTimer() as timer:
+        start = time.perf_counter()
+        import django
+        django.setup(set_prefix=False)
+        phases.append(('Settings and apps', time.perf_counter() - start))
+
+        start = time.perf_counter()
+        from django.core.handlers.wsgi import WSGIHandler
+        WSGIHandler()
+        phases.append(('WSGI handler and middleware',
+                       time.perf_counter() - start))
+
+        start = time.perf_counter()
+        from django.urls import get_resolver
+        get_resolver().url_patterns
+        phases.append(('Root URLconf and views', time.perf_counter() - start))
+
+    return {
+        'phases': phases,
+        'total': sum(seconds for name, seconds in phases),
+        'imports': timer.slowest(limit),
+        }
+
+
+def load_urlconfs(resolver):
+    """
+    Imports every URLconf under resolver and fills in the reverse lookup
+    tables of each.
+    """
+    from django.urls import URLResolver
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            load_urlconfs(pattern)
+    resolver.reverse_dict
+
+
+def load_templates():
+    """
+    Compiles every template in the project's template directories, leaving
+    them in the cached template loader.
+    """
+    from django.template import engines
+    from django.template.backends.django import DjangoTemplates
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates):
+            continue
+        for directory in engine.engine.dirs:
+            for root, dirs, files in os.walk(directory):
+                for file_name in files:
+                    path = os.path.join(root, file_name)
+                    engine.get_template(os.path.relpath(path, directory))
+
+
+def connect_databases():
+    """
+    Opens a connection to the primary database and to each replica in
+    DATABASE_REPLICAS, the databases requests use.
+    """
+    from django.conf import settings
+    from django.db import connections
+    aliases = ['default'] + list(getattr(settings, 'DATABASE_REPLICAS', []))
+    for alias in aliases:
+        connections[alias].ensure_connection()
+
+
+def warm_up(connect=True):
+    """
+    Prepares a booted process for traffic; refer to the module docstring.
+    Returns the time taken by each step. connect=False leaves the databases
+    alone, for processes that fork workers afterwards.
+    """
+    from django.urls import get_resolver
+    steps = [
+        ('URLconfs', lambda: load_urlconfs(get_resolver())),
+        ('Templates', load_templates),
+        ]
+    if connect:
+        steps.append(('Database connections', connect_databases))
+
+    timings = []
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        timings.append((name, time.perf_counter() - start))
+    return timings
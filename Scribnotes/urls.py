@@ -1,16 +1,11 @@
 from django.contrib import admin
 from django.contrib.auth.decorators import login_required
 from django.urls import path, include
-from rest_framework import routers
-from .views import UserCreateView, LoginIndexView, LogOut, UserViewSet
-from Notes.views import (NotesListDashboard, TermViewSet, CourseViewSet,
-                         ClassNoteViewSet,)
-
-router = routers.DefaultRouter()
-router.register(r'users', UserViewSet, basename='user')
-router.register(r'terms', TermViewSet, basename='term')
-router.register(r'courses', CourseViewSet, basename='course')
-router.register(r'classnotes', ClassNoteViewSet, basename='classnote')
+from .resolvers import lazy_include
+from .views import (UserCreateView, LoginIndexView, LogOut,
+                    ProfileListView, ProfileReportView, ProfileDownloadView,
+                    ManifestView, ServiceWorkerView, OfflineView,)
+from Notes.views import NotesListDashboard
 
 urlpatterns = [
     path(
@@ -42,13 +37,41 @@ urlpatterns = [
         'Notes/',
          include('Notes.urls'),
         ),
+    lazy_include('Web-API/', 'Scribnotes.api_urls', 'api'),
+    path(
+        'Profiles/',
+        ProfileListView.as_view(),
+        name = 'profile_list',
+        ),
+    path(
+        'Profiles/<slug:report_id>/',
+        ProfileReportView.as_view(),
+        name = 'profile_report',
+        ),
     path(
-        'Web-API/',
-        include(router.urls),
+        'Profiles/<slug:report_id>/Download/',
+        ProfileDownloadView.as_view(),
+        name = 'profile_download',
         ),
     path(
-        'API-auth/',
-        include('rest_framework.urls'),
-        name = 'rest_framework',
+        'manifest.webmanifest',
+        ManifestView.as_view(),
+        name = 'manifest',
         ),
+    path(
+        'service-worker.js',
+        ServiceWorkerView.as_view(),
+        name = 'service_worker',
+        ),
+    path(
+        'Offline/',
+        OfflineView.as_view(),
+        name = 'offline',
+        ),
+    lazy_include('API-auth/', 'rest_framework.urls', 'rest_framework'),
 ]
+
+# Query budgets for the routes above; refer to Notes/urls.py.
+query_budgets = {
+    'dashboard': 8,
+}
@@ -1,27 +1,19 @@
-from django.contrib.auth import login, authenticate, get_user_model
+import hashlib
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.views import LoginView, LogoutView
-from django.http import HttpResponseRedirect
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.http import (Http404, HttpResponse, HttpResponseRedirect,
+                         JsonResponse,)
 from django.shortcuts import resolve_url
-from django.urls import reverse_lazy
-from django.views.generic.base import TemplateView
+from django.urls import reverse, reverse_lazy
+from django.utils.decorators import method_decorator
+from django.views.generic.base import TemplateView, View
 from django.views.generic.edit import CreateView
-from rest_framework import viewsets
-from .serializers import UserSerializer
-
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
-    """
-    Viewset for displaying active user data as JSON.
-    """
-    serializer_class = UserSerializer
-
-    def get_queryset(self):
-        """
-        Retrieves active user.
-        """
-        username = self.request.user.username
-        user = get_user_model().objects.filter(username=username)
-        return user
+from .middleware import OFFLINE_USER_COOKIE
+from .profiling import (PROFILE_PARAM, get_report, make_token,
+                        recent_reports,)
 
 class UserCreateView(CreateView):
     """
@@ -63,3 +55,146 @@ class LogOut(LogoutView):
         """
         next_page = reverse_lazy('loginindex')
         return resolve_url(next_page)
+
+@method_decorator(staff_member_required, name='dispatch')
+class ProfileListView(TemplateView):
+    """
+    Lists the staff user's recent profiling reports and gives them a token
+    for profiling further requests.
+    """
+    template_name = 'profile_list.html'
+
+    def get_context_data(self, **kwargs):
+        """
+        Adds the user's reports and a fresh profiling token.
+        """
+        context = super().get_context_data(**kwargs)
+        context['reports'] = recent_reports(self.request.user)
+        context['token'] = make_token(self.request.user)
+        context['param'] = PROFILE_PARAM
+        return context
+
+class ProfileReportMixin():
+    """
+    Looks up the profiling report named in the URL; staff users only see their
+    own reports.
+    """
+
+    def get_report(self):
+        """
+        Retrieves the report or raises 404.
+        """
+        report = get_report(self.kwargs['report_id'])
+        if report is None or report['user_id'] != self.request.user.pk:
+            raise Http404('No such report.')
+        return report
+
+@method_decorator(staff_member_required, name='dispatch')
+class ProfileReportView(ProfileReportMixin, TemplateView):
+    """
+    Summarizes a profiling report: the slowest functions and every SQL
+    statement, with repeated statements counted.
+    """
+    template_name = 'profile_report.html'
+
+    def get_context_data(self, **kwargs):
+        """
+        Adds the report and how many times each statement ran.
+        """
+        context = super().get_context_data(**kwargs)
+        report = self.get_report()
+        counts = {}
+        for query in report['queries']:
+            counts[query['sql']] = counts.get(query['sql'], 0) + 1
+
+        context['report'] = report
+        context['repeated'] = sorted(
+            ((count, sql) for sql, count in counts.items() if count > 1),
+            reverse=True,
+            )
+        return context
+
+@method_decorator(staff_member_required, name='dispatch')
+class ProfileDownloadView(ProfileReportMixin, View):
+    """
+    Serves a report's raw profile, loadable with pstats or snakeviz.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Returns the profile as an attachment.
+        """
+        report = self.get_report()
+        response = HttpResponse(
+            report['profile'],
+            content_type='application/octet-stream',
+            )
+        response['Content-Disposition'] = \
+            f'attachment; filename="{report["id"]}.prof"'
+        return response
+
+class ManifestView(View):
+    """
+    Serves the web app manifest that lets browsers install Scribnotes.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Returns the manifest as JSON.
+        """
+        manifest = {
+            'name': 'Scribnotes',
+            'short_name': 'Scribnotes',
+            'start_url': reverse('dashboard'),
+            'scope': '/',
+            'display': 'standalone',
+            'background_color': '#ffffff',
+            'theme_color': '#343a40',
+            }
+        return JsonResponse(
+            manifest,
+            content_type='application/manifest+json',
+            )
+
+class ServiceWorkerView(TemplateView):
+    """
+    Serves the service worker from the site root so that it controls every
+    page. It precaches the app shell and keeps recently read notes for
+    offline reading; refer to templates/service_worker.js.
+    """
+    template_name = 'service_worker.js'
+    content_type = 'application/javascript'
+    shell_assets = ('css/base.css', 'js/offline.js')
+
+    def get_context_data(self, **kwargs):
+        """
+        Provides the shell's URLs, which carry WhiteNoise's content hashes in
+        production, and a cache name derived from them so that a deploy with
+        changed assets replaces the old cache, and the name of the cookie
+        naming the session's user.
+        """
+        context = super().get_context_data(**kwargs)
+        shell = [staticfiles_storage.url(path) for path in self.shell_assets]
+        shell.append(reverse('offline'))
+        digest = hashlib.sha1('\n'.join(shell).encode()).hexdigest()[:12]
+        context['shell'] = shell
+        context['cache_name'] = f'scribnotes-shell-{digest}'
+        context['offline_url'] = reverse('offline')
+        context['logout_url'] = reverse('logout')
+        context['user_cookie'] = OFFLINE_USER_COOKIE
+        return context
+
+    def render_to_response(self, context, **response_kwargs):
+        """
+        Tells browsers to check for a new worker on every load.
+        """
+        response = super().render_to_response(context, **response_kwargs)
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+class OfflineView(TemplateView):
+    """
+    Page the service worker shows when a page can't be fetched and hasn't
+    been kept for offline reading.
+    """
+    template_name = 'offline.html'
@@ -0,0 +1,28 @@
+"""
+gunicorn settings for the web process. The application is loaded once in the
+master, which also warms it up before forking, so workers start with URLconfs
+imported and templates compiled, sharing that memory. Database connections
+can't be shared across a fork, so each worker opens its own before taking
+requests. Refer to Scribnotes/startup.py.
+"""
+preload_app = True
+
+
+def when_ready(server):
+    """
+    Warms up the preloaded application in the master, before any worker is
+    forked.
+    """
+    from Scribnotes.startup import warm_up
+    timings = warm_up(connect=False)
+    server.log.info('Warmed up: ' + ', '.join(
+        f'{name} {seconds * 1000:.0f} ms' for name, seconds in timings
+        ))
+
+
+def post_worker_init(worker):
+    """
+    Opens the worker's database connections before it accepts requests.
+    """
+    from Scribnotes.startup import connect_databases
+    connect_databases()
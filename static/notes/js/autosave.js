@@ -0,0 +1,77 @@
+
+// Periodically saves the note body by posting only the changed span as a
+// patch against the last saved revision; refer to Notes/patches.py.
+(function(){
+  var form = $("form[data-autosave-url]")
+  var url = form.attr("data-autosave-url")
+  var revision = parseInt(form.attr("data-revision"), 10)
+  var length = parseInt(form.attr("data-body-length"), 10)
+  var token = form.find("input[name=csrfmiddlewaretoken]").val()
+  var status = $("#autosave-status")
+  var saved = null
+  var pending = false
+  var timer = null
+
+  function makePatch(before, after){
+    if (before === null){
+      // The editor normalises the saved HTML, so the first save replaces the
+      // stored body wholesale and later saves diff against what was sent.
+      return [-length, after]
+    }
+    var prefix = 0
+    var limit = Math.min(before.length, after.length)
+    while (prefix < limit && before.charCodeAt(prefix) === after.charCodeAt(prefix)){
+      prefix++
+    }
+    var suffix = 0
+    limit -= prefix
+    while (suffix < limit &&
+           before.charCodeAt(before.length - 1 - suffix) === after.charCodeAt(after.length - 1 - suffix)){
+      suffix++
+    }
+    var ops = []
+    if (prefix){
+      ops.push(prefix)
+    }
+    if (before.length - prefix - suffix){
+      ops.push(-(before.length - prefix - suffix))
+    }
+    if (after.length - prefix - suffix){
+      ops.push(after.slice(prefix, after.length - suffix))
+    }
+    return ops
+  }
+
+  function save(editor){
+    var body = editor.getData()
+    if (pending || body === saved){
+      return
+    }
+    pending = true
+    fetch(url, {
+      method: "POST",
+      credentials: "same-origin",
+      headers: {"Content-Type": "application/json", "X-CSRFToken": token},
+      body: JSON.stringify({revision: revision, ops: makePatch(saved, body)})
+    }).then(function(response){
+      return response.json().then(function(data){
+        if (response.ok){
+          revision = data.revision
+          saved = body
+          status.text("Saved")
+        } else if (response.status === 409){
+          status.text("This note was changed elsewhere; reload to keep editing.")
+          clearInterval(timer)
+        }
+      })
+    }).catch(function(){
+      status.text("Autosave failed; your changes are kept until you save.")
+    }).then(function(){
+      pending = false
+    })
+  }
+
+  $(document).on("editor:ready", function(event, editor){
+    timer = setInterval(function(){ save(editor) }, 5000)
+  })
+})()
@@ -0,0 +1,32 @@
+
+// Loads the CKEditor bundle only once the user focuses the note body, rather
+// than shipping it with every page that renders the form.
+(function(){
+  var loader = document.getElementById("editor-loader")
+  var loading = false
+
+  function replaceTextareas(){
+    $("textarea[data-type=ckeditortype][data-processed=0]").each(function(){
+      this.setAttribute("data-processed", "1")
+      var editor = CKEDITOR.replace(this.id, JSON.parse(this.getAttribute("data-config")))
+      editor.on("instanceReady", function(){
+        editor.focus()
+        $(document).trigger("editor:ready", [editor])
+      })
+    })
+  }
+
+  function loadEditor(){
+    if (loading){
+      return
+    }
+    loading = true
+    window.CKEDITOR_BASEPATH = loader.getAttribute("data-ckeditor-basepath")
+    var script = document.createElement("script")
+    script.src = loader.getAttribute("data-ckeditor-src")
+    script.onload = replaceTextareas
+    document.head.appendChild(script)
+  }
+
+  $("textarea[data-type=ckeditortype]").one("focus", loadEditor)
+})()
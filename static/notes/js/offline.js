@@ -0,0 +1,12 @@
+
+// Registers the service worker that keeps the app shell and recently read
+// notes available offline.
+(function(){
+  var script = document.currentScript
+  if (!("serviceWorker" in navigator)){
+    return
+  }
+  window.addEventListener("load", function(){
+    navigator.serviceWorker.register(script.getAttribute("data-service-worker"))
+  })
+})()
@@ -0,0 +1,28 @@
+
+// Polls a background task until it finishes, then moves on to the next page.
+(function(){
+  var task = $("#task")
+  var statusUrl = task.attr("data-status-url")
+  var nextUrl = task.attr("data-next-url")
+
+  function poll(){
+    fetch(statusUrl, {credentials: "same-origin"}).then(function(response){
+      return response.json()
+    }).then(function(data){
+      if (data.status === "done"){
+        window.location = nextUrl
+      } else if (data.status === "failed"){
+        $("#task-message").text("Something went wrong; please try again.")
+      } else {
+        if (data.progress){
+          $("#task-progress").text(data.progress + "% done")
+        }
+        setTimeout(poll, 1000)
+      }
+    }).catch(function(){
+      setTimeout(poll, 3000)
+    })
+  }
+
+  poll()
+})()
@@ -0,0 +1,313 @@
+
+// Service worker for Scribnotes, rendered by ServiceWorkerView.
+//
+// The app shell (base stylesheet, this worker's loader and the offline page)
+// is precached; other scripts, stylesheets and fonts are cached the first time
+// they load. Their URLs carry content hashes or versions, so cached copies
+// never go stale.
+//
+// Notes that have been read are kept in IndexedDB, up to NOTES_KEPT of the
+// most recently read, each with the X-Offline-User value of the user who read
+// it. A kept note is only served when the browser's offline_user cookie,
+// which the server keeps in step with the session, names the same user; it's
+// then served straight from IndexedDB and revalidated in the background with
+// its ETag, the server answering 304 while the note's revision is unchanged.
+// When the cookie names someone else, or nobody, every kept note is dropped.
+// Browsers whose workers can't read cookies only serve a kept note once the
+// server has answered 304 for it. Posting to a note's URLs (editing,
+// autosaving) drops the kept copy first, and signing out drops all of them.
+
+var CACHE_NAME = "{{ cache_name|escapejs }}"
+var SHELL = [{% for url in shell %}"{{ url|escapejs }}"{% if not forloop.last %}, {% endif %}{% endfor %}]
+var OFFLINE_URL = "{{ offline_url|escapejs }}"
+var LOGOUT_URL = "{{ logout_url|escapejs }}"
+var USER_COOKIE = "{{ user_cookie|escapejs }}"
+var RUNTIME_DESTINATIONS = ["script", "style", "font"]
+
+var NOTES_DB = "scribnotes"
+var NOTES_STORE = "notes"
+var NOTES_KEPT = 50
+
+self.addEventListener("install", function(event){
+  event.waitUntil(caches.open(CACHE_NAME).then(function(cache){
+    return cache.addAll(SHELL)
+  }).then(function(){
+    return self.skipWaiting()
+  }))
+})
+
+self.addEventListener("activate", function(event){
+  event.waitUntil(caches.keys().then(function(names){
+    return Promise.all(names.filter(function(name){
+      return name !== CACHE_NAME
+    }).map(function(name){
+      return caches.delete(name)
+    }))
+  }).then(function(){
+    return self.clients.claim()
+  }))
+})
+
+self.addEventListener("fetch", function(event){
+  var request = event.request
+  var url = new URL(request.url)
+  var local = url.origin === location.origin
+
+  if (request.method !== "GET"){
+    if (local){
+      event.respondWith(forgetNotes(url.pathname).then(function(){
+        return fetch(request)
+      }))
+    }
+    return
+  }
+
+  if (local && url.pathname === LOGOUT_URL){
+    event.respondWith(clearNotes().then(function(){
+      return fetch(request)
+    }))
+  } else if (request.mode === "navigate"){
+    event.respondWith(navigate(event))
+  } else if (SHELL.indexOf(url.pathname) !== -1 ||
+             RUNTIME_DESTINATIONS.indexOf(request.destination) !== -1){
+    event.respondWith(fromCache(request))
+  }
+})
+
+// Static assets: cache first, caching whatever the network returns.
+function fromCache(request){
+  return caches.match(request).then(function(cached){
+    if (cached){
+      return cached
+    }
+    return fetch(request).then(function(response){
+      if (response.ok || response.type === "opaque"){
+        var copy = response.clone()
+        caches.open(CACHE_NAME).then(function(cache){
+          cache.put(request, copy)
+        })
+      }
+      return response
+    })
+  })
+}
+
+// Pages: kept notes come from IndexedDB, everything else from the network,
+// with the offline page as a last resort.
+function navigate(event){
+  var request = event.request
+  return Promise.all([sessionUser(), readNote(request.url)]).catch(function(){
+    return [undefined, null]
+  }).then(function(found){
+    var user = found[0]
+    var note = found[1]
+    if (note && user === undefined){
+      return verified(event, note)
+    }
+    if (note && note.user === user){
+      event.waitUntil(revalidate(note))
+      return noteResponse(note)
+    }
+    var cleared = note ? clearNotes() : Promise.resolve()
+    return cleared.then(function(){
+      return fromNetwork(event)
+    })
+  }).catch(function(){
+    return caches.match(OFFLINE_URL)
+  })
+}
+
+function fromNetwork(event){
+  return fetch(event.request).then(function(response){
+    if (response.ok && response.headers.get("X-Offline-Note")){
+      event.waitUntil(keepNote(event.request.url, response.clone()))
+    }
+    return response
+  })
+}
+
+// Resolves with the offline_user cookie's value, "" without one, or
+// undefined where the worker can't read cookies.
+function sessionUser(){
+  if (!self.cookieStore){
+    return Promise.resolve(undefined)
+  }
+  return self.cookieStore.get(USER_COOKIE).then(function(cookie){
+    return cookie ? cookie.value : ""
+  })
+}
+
+// Serves a kept note only once the server confirms, with a 304, that it's
+// still current for the session's user; anything else is served as fetched.
+function verified(event, note){
+  return fetch(note.url, {
+    credentials: "same-origin",
+    cache: "no-store",
+    headers: {"If-None-Match": note.etag},
+  }).then(function(response){
+    if (response.status === 304 &&
+        response.headers.get("X-Offline-User") === note.user){
+      event.waitUntil(touchNote(note))
+      return noteResponse(note)
+    }
+    if (response.ok && response.headers.get("X-Offline-Note")){
+      event.waitUntil(keepNote(note.url, response.clone()))
+    } else {
+      event.waitUntil(forgetNote(note.url))
+    }
+    return response
+  })
+}
+
+function noteResponse(note){
+  return new Response(note.body, {
+    headers: {"Content-Type": "text/html; charset=utf-8", "ETag": note.etag},
+  })
+}
+
+// Asks the server whether a kept note is still current, replacing or
+// dropping it if not. Network errors leave it as it is.
+function revalidate(note){
+  return fetch(note.url, {
+    credentials: "same-origin",
+    cache: "no-store",
+    headers: {"If-None-Match": note.etag},
+  }).then(function(response){
+    if (response.status === 304 &&
+        response.headers.get("X-Offline-User") === note.user){
+      return touchNote(note)
+    }
+    if (response.ok && response.headers.get("X-Offline-Note")){
+      return keepNote(note.url, response)
+    }
+    return forgetNote(note.url)
+  }).catch(function(){})
+}
+
+// IndexedDB helpers.
+
+function openNotes(){
+  return new Promise(function(resolve, reject){
+    var request = indexedDB.open(NOTES_DB, 1)
+    request.onupgradeneeded = function(){
+      var store = request.result.createObjectStore(NOTES_STORE, {keyPath: "url"})
+      store.createIndex("readAt", "readAt")
+    }
+    request.onsuccess = function(){
+      resolve(request.result)
+    }
+    request.onerror = function(){
+      reject(request.error)
+    }
+  })
+}
+
+// Runs action against the notes store in one transaction, resolving with the
+// result of the request action returns, if any, once the transaction is done.
+function withNotes(mode, action){
+  return openNotes().then(function(db){
+    return new Promise(function(resolve, reject){
+      var transaction = db.transaction(NOTES_STORE, mode)
+      var request = action(transaction.objectStore(NOTES_STORE))
+      transaction.oncomplete = function(){
+        resolve(request ? request.result : undefined)
+      }
+      transaction.onerror = function(){
+        reject(transaction.error)
+      }
+    })
+  })
+}
+
+function readNote(url){
+  return withNotes("readonly", function(store){
+    return store.get(url)
+  })
+}
+
+function touchNote(note){
+  note.readAt = Date.now()
+  return withNotes("readwrite", function(store){
+    store.put(note)
+  })
+}
+
+// Keeps a note for its reader, dropping any kept for another user.
+function keepNote(url, response){
+  var user = response.headers.get("X-Offline-User")
+  if (!user){
+    return Promise.resolve()
+  }
+  return response.text().then(function(body){
+    return withNotes("readwrite", function(store){
+      forgetOthers(store, user)
+      store.put({
+        url: url,
+        body: body,
+        etag: response.headers.get("ETag"),
+        user: user,
+        readAt: Date.now(),
+      })
+      prune(store)
+    })
+  })
+}
+
+function forgetOthers(store, user){
+  store.openCursor().onsuccess = function(event){
+    var cursor = event.target.result
+    if (cursor){
+      if (cursor.value.user !== user){
+        cursor.delete()
+      }
+      cursor.continue()
+    }
+  }
+}
+
+// Drops the least recently read notes beyond NOTES_KEPT.
+function prune(store){
+  store.count().onsuccess = function(event){
+    var excess = event.target.result - NOTES_KEPT
+    if (excess <= 0){
+      return
+    }
+    store.index("readAt").openCursor().onsuccess = function(event){
+      var cursor = event.target.result
+      if (cursor && excess > 0){
+        cursor.delete()
+        excess -= 1
+        cursor.continue()
+      }
+    }
+  }
+}
+
+function forgetNote(url){
+  return withNotes("readwrite", function(store){
+    store.delete(url)
+  })
+}
+
+// Drops kept notes whose URL the given path starts with, i.e. the note being
+// edited or autosaved.
+function forgetNotes(path){
+  return withNotes("readwrite", function(store){
+    store.openCursor().onsuccess = function(event){
+      var cursor = event.target.result
+      if (!cursor){
+        return
+      }
+      if (path.indexOf(new URL(cursor.value.url).pathname) === 0){
+        cursor.delete()
+      }
+      cursor.continue()
+    }
+  }).catch(function(){})
+}
+
+function clearNotes(){
+  return withNotes("readwrite", function(store){
+    store.clear()
+  }).catch(function(){})
+}